@@ -0,0 +1,197 @@
+"""
+Persistent cache of finalized chain data, shared by all the tools.
+
+Blocks, transactions, receipts and logs never change once they are
+`confirmations` blocks deep. `ChainCache` keeps the JSON-RPC results of such
+requests in an SQLite database, keyed by the chain (network id and genesis
+block hash, so that a restarted test chain doesn't see the data of the
+previous one) and by the request, with an in-memory LRU in front of it.
+Results about younger blocks are never stored, so a reorganization can't
+leave stale entries behind.
+"""
+from collections import OrderedDict
+import json
+import logging
+import os
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+# methods whose results are cached once the block they are about is final
+FINAL_METHODS = ('eth_getBlockByNumber', 'eth_getTransactionByHash',
+                 'eth_getTransactionReceipt', 'eth_getLogs')
+# returned by ChainCache.get for requests that are not cached
+MISSING = object()
+# eth_getLogs ranges are cached in segments aligned to this many blocks
+LOGS_SEGMENT = 10000
+
+
+def block_number(value):
+    """Block number of a block parameter, None for tags like 'latest'."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.startswith('0x'):
+        return int(value, 16)
+    return None
+
+
+class ChainCache:
+    """Results of finalized requests of `transport`, stored in the SQLite file `path`.
+
+    `eth_getLogs` ranges are split at multiples of LOGS_SEGMENT blocks and
+    each segment is cached on its own: tools ask for ranges ending at the
+    head, different in every run, but the segments below the final block
+    are the same whatever the end of the range. A range within a cached
+    segment is answered from the segment's logs.
+    """
+
+    def __init__(self, transport, path, confirmations=12, lru_size=10000):
+        self.transport = transport
+        self.path = path
+        self.confirmations = confirmations
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+        self.db = None
+        self.chain = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        network = self.transport.request('net_version', [])['result']
+        genesis = self.transport.request('eth_getBlockByNumber', ['0x0', False])['result']
+        self.chain = '%s:%s' % (network, genesis['hash'])
+        db = sqlite3.connect(self.path)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute('CREATE TABLE IF NOT EXISTS results ('
+                   'chain TEXT, request TEXT, result TEXT, PRIMARY KEY (chain, request))')
+        # set last: other greenlets may use the cache while the node answers
+        self.db = db
+        log.info('chain data cache %s for chain %s' % (self.path, self.chain))
+
+    def final_block(self):
+        return self.transport.head() - self.confirmations
+
+    def key(self, method, params):
+        return method + json.dumps(params, sort_keys=True)
+
+    def get(self, method, params):
+        """Cached result of a request, MISSING if it is not cached."""
+        if method not in FINAL_METHODS:
+            return MISSING
+        if self.db is None:
+            self.open()
+        key = self.key(method, params)
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            result = self.lru[key]
+        else:
+            row = self.db.execute('SELECT result FROM results WHERE chain = ? AND request = ?',
+                                  (self.chain, key)).fetchone()
+            if row is None:
+                if method == 'eth_getLogs':
+                    return self.get_from_segment(params[0])
+                return MISSING
+            result = json.loads(row[0])
+            self.remember(key, result)
+        self.transport.record(method, 0, 'cached')
+        return result
+
+    def get_from_segment(self, filter_params):
+        """Logs of a range within one segment, from the cached segment; MISSING if not cached."""
+        from_block = block_number(filter_params.get('fromBlock'))
+        to_block = block_number(filter_params.get('toBlock'))
+        if from_block is None or to_block is None or 'blockHash' in filter_params:
+            return MISSING
+        start = from_block // LOGS_SEGMENT * LOGS_SEGMENT
+        end = start + LOGS_SEGMENT - 1
+        if to_block > end or (from_block, to_block) == (start, end):
+            return MISSING
+        logs = self.get('eth_getLogs', [dict(filter_params, fromBlock=hex(start),
+                                             toBlock=hex(end))])
+        if logs is MISSING:
+            return MISSING
+        return [event for event in logs
+                if from_block <= block_number(event['blockNumber']) <= to_block]
+
+    def store(self, method, params, result):
+        """Cache the result of a request if the block it is about is final."""
+        self.store_all([(method, params, result)])
+
+    def store_all(self, results):
+        """Cache the final ones of [(method, params, result)] in one transaction."""
+        rows = [(self.key(method, params), result) for method, params, result in results
+                if method in FINAL_METHODS and self.is_final(method, params, result)]
+        if len(rows) == 0:
+            return
+        if self.db is None:
+            self.open()
+        self.db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                            [(self.chain, key, json.dumps(result)) for key, result in rows])
+        self.db.commit()
+        for key, result in rows:
+            self.remember(key, result)
+
+    def remember(self, key, result):
+        self.lru[key] = result
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def is_final(self, method, params, result):
+        if result is None:
+            # unknown block or transaction: may exist later
+            return False
+        if method == 'eth_getBlockByNumber':
+            block = block_number(params[0])
+        elif method == 'eth_getLogs':
+            if 'blockHash' in params[0] or block_number(params[0].get('fromBlock')) is None:
+                return False
+            block = block_number(params[0].get('toBlock'))
+        else:
+            # a pending transaction has no block number yet
+            block = block_number(result.get('blockNumber'))
+        return block is not None and block <= self.final_block()
+
+    def request(self, method, params):
+        """Response to a request, from the cache if it is there."""
+        result = self.get(method, params)
+        if result is not MISSING:
+            return {'jsonrpc': '2.0', 'id': 0, 'result': result}
+        if method == 'eth_getLogs':
+            segments = self.request_segments(params[0])
+            if segments is not None:
+                return segments
+        response = self.transport.request(method, params)
+        if 'error' not in response:
+            self.store(method, params, response['result'])
+        return response
+
+    def request_segments(self, filter_params):
+        """Logs of a range spanning several segments, requested segment by segment."""
+        from_block = block_number(filter_params.get('fromBlock'))
+        to_block = block_number(filter_params.get('toBlock'))
+        if from_block is None or to_block is None or 'blockHash' in filter_params:
+            return None
+        if from_block // LOGS_SEGMENT == to_block // LOGS_SEGMENT:
+            return None
+        logs = []
+        # segments read from the node, stored together at the end
+        fetched = []
+        start = from_block
+        while start <= to_block:
+            end = min((start // LOGS_SEGMENT + 1) * LOGS_SEGMENT - 1, to_block)
+            params = [dict(filter_params, fromBlock=hex(start), toBlock=hex(end))]
+            result = self.get('eth_getLogs', params)
+            if result is MISSING:
+                response = self.transport.request('eth_getLogs', params)
+                if 'error' in response:
+                    self.store_all(fetched)
+                    return response
+                result = response['result']
+                fetched.append(('eth_getLogs', params, result))
+            logs.extend(result)
+            start = end + 1
+        self.store_all(fetched)
+        return {'jsonrpc': '2.0', 'id': 0, 'result': logs}
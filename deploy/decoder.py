@@ -0,0 +1,135 @@
+"""
+Event log decoders compiled once per contract ABI.
+
+`get_event_data` normalizes the event ABI and runs the generic ABI decoder on
+every call. For events made of static types (uint, int, address, bool, bytesN)
+each argument is a single 32 byte word of the topics or the data, so the
+decoder can be reduced to a list of (name, word position, word decoder).
+"""
+from collections.abc import Mapping
+import json
+import re
+
+from eth_utils import encode_hex, event_abi_to_log_topic, force_text
+from web3.utils.events import get_event_data
+
+BYTES_TYPE = re.compile(r'^bytes([0-9]+)$')
+
+
+def word_decoder(abi_type):
+    """Decoder of one hex encoded 32 byte word, None for types spanning more words."""
+    if '[' in abi_type:
+        # arrays, even of a fixed size, take several words or are dynamic
+        return None
+    if abi_type.startswith('uint'):
+        return lambda word: int(word, 16)
+    if abi_type.startswith('int'):
+        def decode_int(word):
+            value = int(word, 16)
+            return value - 2 ** 256 if value >= 2 ** 255 else value
+        return decode_int
+    if abi_type == 'address':
+        return lambda word: '0x' + word[24:]
+    if abi_type == 'bool':
+        return lambda word: int(word, 16) != 0
+    match = BYTES_TYPE.match(abi_type)
+    if match:
+        size = int(match.group(1))
+        # get_event_data returns bytes as text, like all the web3 results
+        return lambda word: force_text(bytes.fromhex(word[:2 * size]))
+    return None
+
+
+class EventDecoder:
+    def __init__(self, event_abi):
+        self.abi = event_abi
+        self.name = event_abi['name']
+        self.topic = encode_hex(event_abi_to_log_topic(event_abi))
+        # anonymous events have no event signature in topics[0]
+        offset = 0 if event_abi.get('anonymous') else 1
+        self.fields = {}
+        topic_index = offset
+        data_index = 0
+        for argument in event_abi['inputs']:
+            decoder = word_decoder(argument['type'])
+            if argument['indexed']:
+                self.fields[argument['name']] = (True, topic_index, decoder)
+                topic_index += 1
+            else:
+                self.fields[argument['name']] = (False, data_index, decoder)
+                data_index += 1
+        self.compiled = all(decoder is not None for _, _, decoder in self.fields.values())
+
+    def decode_field(self, log, name):
+        indexed, index, decoder = self.fields[name]
+        if indexed:
+            return decoder(log['topics'][index][2:])
+        return decoder(log['data'][2 + 64 * index:2 + 64 * (index + 1)])
+
+    def decode_args(self, log):
+        if not self.compiled:
+            return get_event_data(self.abi, log)['args']
+        return {name: self.decode_field(log, name) for name in self.fields}
+
+    def decode(self, log, lazy=False):
+        """Set 'event' and 'args' on a log dict; lazy args are decoded on access."""
+        log['event'] = self.name
+        if lazy and self.compiled:
+            log['args'] = LazyArgs(self, log)
+        else:
+            log['args'] = self.decode_args(log)
+        return log
+
+
+class LazyArgs(Mapping):
+    """Event arguments of a raw log, each decoded the first time it is read."""
+    __slots__ = ('decoder', 'log', 'values')
+
+    def __init__(self, decoder, log):
+        self.decoder = decoder
+        self.log = log
+        self.values = {}
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            self.values[name] = self.decoder.decode_field(self.log, name)
+        return self.values[name]
+
+    def __iter__(self):
+        return iter(self.decoder.fields)
+
+    def __len__(self):
+        return len(self.decoder.fields)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class DecoderRegistry:
+    """Decoders of all the events of a contract ABI, by topic0 and by name."""
+
+    def __init__(self, abi, lazy=False):
+        self.lazy = lazy
+        decoders = [EventDecoder(i) for i in abi if i['type'] == 'event']
+        self.by_topic = {decoder.topic: decoder for decoder in decoders}
+        self.by_name = {decoder.name: decoder for decoder in decoders}
+
+    def __getitem__(self, event_name):
+        return self.by_name[event_name]
+
+    def topics(self, event_names):
+        return [self.by_name[name].topic for name in event_names]
+
+    def decode(self, log):
+        return self.by_topic[log['topics'][0]].decode(log, self.lazy)
+
+
+_registries = {}
+
+
+def get_registry(abi, lazy=False):
+    """Shared DecoderRegistry of an ABI, built on first use."""
+    key = (json.dumps(abi, sort_keys=True), lazy)
+    if key not in _registries:
+        _registries[key] = DecoderRegistry(abi, lazy)
+    return _registries[key]
@@ -3,18 +3,14 @@ monkey.patch_all()
 """
 Deploy RaidenToken and DutchAuction on a testnet
 """
-import requests.adapters as adapter
-adapter.DEFAULT_POOLSIZE = 1000
-
-
 import click
 import sys
 from populus import Project
 from deploy.utils import (
     passphrase,
     check_succesful_tx,
-    set_connection_pool_size,
 )
+from deploy.transport import install_transport
 from deploy.simulation import (
     auction_simulation
 )
@@ -32,6 +28,21 @@ log = logging.getLogger(__name__)
     '--owner',
     help='Contracts owner, default: web3.eth.accounts[0]'
 )
+@click.option(
+    '--rpc-pool-size',
+    default=1000,
+    help='Number of keep-alive connections to the node'
+)
+@click.option(
+    '--rpc-retries',
+    default=3,
+    help='Retries of a JSON-RPC request after a transient error'
+)
+@click.option(
+    '--rpc-cache',
+    default='build/chain-cache.sqlite',
+    help='File caching finalized chain data between runs, "" disables it'
+)
 @click.pass_context
 def main(ctx, **kwargs):
     project = Project()
@@ -42,7 +53,11 @@ def main(ctx, **kwargs):
              "or you'll get timeout".format(chain_name))
 
     with project.get_chain(chain_name) as chain:
-        set_connection_pool_size(chain.web3, 1000, 1000)
+        # the simulation sends requests from hundreds of greenlets, most of them
+        # asking the same auction state in the same block
+        install_transport(chain.web3, pool_size=kwargs['rpc_pool_size'],
+                          retries=kwargs['rpc_retries'], call_cache=True,
+                          chain_cache=kwargs['rpc_cache'])
         ctx.obj = {}
         ctx.obj['chain'] = chain
         ctx.obj['owner'] = kwargs['owner'] or chain.web3.eth.accounts[0]
@@ -0,0 +1,248 @@
+"""
+One poller of new blocks and logs shared by all the log watchers of a web3.
+
+Every `contract.on(...).watch()` or `LogFilter.watch()` installs its own
+filter, polled by its own greenlet. `LogHub` instead polls `eth_blockNumber`
+once per interval and, when new blocks arrived, fetches the logs of all the
+subscriptions with a single `eth_getLogs` over the new block range (the
+union of their addresses and first topics), then hands each log to the
+subscriptions it matches. The polling traffic does not depend on the number
+of subscriptions.
+
+Nodes without `eth_getLogs` (eth-testrpc) get the same range through a
+filter installed for it, read with `eth_getFilterLogs` and uninstalled.
+
+The logs of a block range are read once, when the range is new, so logs
+of blocks replaced by a chain reorganization are never reported as
+removed. The hub serves the deploy tools and tests; code that must undo
+orphaned logs reads them from a node filter (see event_sampler.feed).
+"""
+import logging
+import weakref
+
+import gevent
+import gevent.event
+from web3.formatters import input_filter_params_formatter, log_array_formatter
+
+log = logging.getLogger(__name__)
+
+# JSON-RPC error code and messages of nodes that don't implement a method
+METHOD_NOT_FOUND = -32601
+METHOD_MISSING_ERRORS = (
+    'method not found',
+    'not supported',
+    'not implemented',
+    'does not exist'
+)
+
+
+class Subscription:
+    """Logs of `address` whose topics match `topics`, passed to `callback`.
+
+    `topics` has the `eth_getLogs` form: one entry per topic position, None
+    for any value or a list of accepted values. Only the logs of blocks
+    [from_block, to_block] are delivered.
+    """
+
+    def __init__(self, hub, address, topics, callback, from_block=None, to_block=None):
+        self.hub = hub
+        self.address = address.lower()
+        self.topics = [[topic] if isinstance(topic, str) else topic for topic in topics]
+        self.callback = callback
+        self.from_block = from_block
+        self.to_block = to_block
+
+    def matches(self, event):
+        if event['address'].lower() != self.address:
+            return False
+        if self.from_block is not None and event['blockNumber'] < self.from_block:
+            return False
+        if self.to_block is not None and event['blockNumber'] > self.to_block:
+            return False
+        if len(event['topics']) < len(self.topics):
+            return False
+        return all(accepted is None or topic in accepted
+                   for accepted, topic in zip(self.topics, event['topics']))
+
+    def filter_params(self):
+        return {'address': self.address, 'topics': self.topics}
+
+    def stop(self):
+        self.hub.unsubscribe(self)
+
+
+class LogHub:
+    """Shared new block and log poller; use `get_hub(web3)` to get the one of a web3.
+
+    Block listeners are called with each new head block number after the
+    logs up to that block were delivered. The hub polls while it has
+    subscriptions or block listeners and stops with the last of them. It
+    only holds a weak reference to web3, so that a dropped web3 (e.g. of a
+    test chain) takes its hub with it.
+    """
+
+    def __init__(self, web3, poll_interval=1):
+        self.web3_ref = weakref.ref(web3)
+        # None until the first range is read: whether the node has eth_getLogs
+        self.get_logs_supported = None
+        self.poll_interval = poll_interval
+        self.run = gevent.event.Event()
+        self.subscriptions = []
+        self.block_listeners = []
+        # last block whose logs were delivered
+        self.block = None
+        # cleared while a poll is delivering the logs up to `polled_block`
+        self.idle = gevent.event.Event()
+        self.idle.set()
+        self.polled_block = None
+        self.ev_poll = None
+
+    @property
+    def web3(self):
+        return self.web3_ref()
+
+    def start(self):
+        if self.ev_poll is not None:
+            return
+        if self.block is None:
+            self.block = self.web3.eth.blockNumber
+        # a poller stopped from one of its callbacks ends after that poll: give the
+        # new one its own event
+        self.run = gevent.event.Event()
+        self.ev_poll = gevent.spawn(self.callback, self.run)
+
+    def stop(self):
+        self.run.set()
+        if self.ev_poll is not None and self.ev_poll is not gevent.getcurrent():
+            self.ev_poll.kill()
+        self.ev_poll = None
+
+    def subscribe(self, address, topics, callback, from_block=None, to_block=None):
+        """Deliver the logs of `address` matching `topics` to `callback`.
+
+        With `from_block`, the logs since that block are delivered first;
+        it may be ahead of the hub, e.g. after reading logs up to the latest
+        block with `get_logs()`.
+        """
+        self.start()
+        if from_block == 'earliest':
+            from_block = 0
+        subscription = Subscription(self, address, topics, callback, from_block, to_block)
+        synced = from_block - 1 if from_block is not None else None
+        while True:
+            if gevent.getcurrent() is self.ev_poll:
+                # subscribed by a callback: the poll in progress delivers up to polled_block
+                to = self.polled_block
+            else:
+                # a poll in flight fetched the logs without this subscription
+                self.idle.wait()
+                to = self.block
+            if synced is None or synced >= to:
+                break
+            for event in self.get_logs(subscription.filter_params(), synced + 1, to):
+                if subscription.matches(event):
+                    callback(event)
+            synced = to
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+        if len(self.subscriptions) == 0 and len(self.block_listeners) == 0:
+            self.stop()
+
+    def add_block_listener(self, listener):
+        self.start()
+        self.block_listeners.append(listener)
+
+    def get_logs(self, filter_params, from_block, to_block):
+        if from_block == 'earliest':
+            from_block = 0
+        if to_block == 'latest':
+            to_block = self.web3.eth.blockNumber
+        if from_block > to_block:
+            return []
+        params = input_filter_params_formatter(
+            dict(filter_params, fromBlock=from_block, toBlock=to_block))
+        if self.get_logs_supported is not False:
+            try:
+                response = self.web3._requestManager.request_blocking('eth_getLogs', [params])
+                self.get_logs_supported = True
+                return [dict(event) for event in log_array_formatter(response)]
+            except ValueError as e:
+                if self.get_logs_supported or not self.is_method_missing(e):
+                    raise
+                log.info('eth_getLogs is not supported (%s), reading log ranges with filters'
+                         % str(e))
+                self.get_logs_supported = False
+        log_filter = self.web3.eth.filter(params)
+        try:
+            # getFilterLogs already applies log_array_formatter
+            return [dict(event) for event in self.web3.eth.getFilterLogs(log_filter.filter_id)]
+        finally:
+            self.web3.eth.uninstallFilter(log_filter.filter_id)
+
+    @staticmethod
+    def is_method_missing(error):
+        details = error.args[0] if len(error.args) > 0 else None
+        if isinstance(details, dict) and details.get('code') == METHOD_NOT_FOUND:
+            return True
+        message = str(error).lower()
+        return any(s in message for s in METHOD_MISSING_ERRORS)
+
+    def filter_params(self):
+        addresses = set()
+        topics = set()
+        for subscription in self.subscriptions:
+            addresses.add(subscription.address)
+            first = subscription.topics[0] if len(subscription.topics) > 0 else None
+            if first is None:
+                # a subscription to any event: don't filter by topic
+                topics = None
+            elif topics is not None:
+                topics.update(first)
+        params = {'address': sorted(addresses)}
+        if topics is not None:
+            params['topics'] = [sorted(topics)]
+        return params
+
+    def callback(self, run):
+        while run.is_set() is False:
+            gevent.sleep(self.poll_interval)
+            if self.web3 is None:
+                # the web3 was dropped while its watchers were still subscribed
+                return
+            try:
+                self.poll()
+            except Exception as e:
+                log.warning('polling new blocks failed: %s' % str(e))
+
+    def poll(self):
+        head = self.web3.eth.blockNumber
+        if head <= self.block:
+            return
+        self.idle.clear()
+        self.polled_block = head
+        try:
+            if len(self.subscriptions) > 0:
+                subscriptions = list(self.subscriptions)
+                for event in self.get_logs(self.filter_params(), self.block + 1, head):
+                    for subscription in subscriptions:
+                        if subscription.matches(event) and subscription in self.subscriptions:
+                            subscription.callback(dict(event))
+            self.block = head
+        finally:
+            self.idle.set()
+        for listener in self.block_listeners:
+            listener(head)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub(web3):
+    """The LogHub shared by all the watchers of `web3`, created on first use."""
+    if web3 not in _hubs:
+        _hubs[web3] = LogHub(web3)
+    return _hubs[web3]
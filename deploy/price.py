@@ -0,0 +1,121 @@
+"""
+Local model of the DutchAuction price functions.
+
+Reproduces `calcTokenPrice`, `price` and `missingFundsToEndAuction` from
+contracts/auction.sol with the same uint256 integer arithmetic, so the price
+can be computed without calling the contract.
+"""
+import numpy
+
+UINT256_MOD = 2 ** 256
+INT64_MAX = 2 ** 63 - 1
+
+AUCTION_STARTED = 2
+AUCTION_ENDED = 3
+
+
+def calc_token_price(price_start, price_constant, price_exponent, elapsed):
+    """`DutchAuction.calcTokenPrice` for `elapsed` seconds since the auction start."""
+    decay_rate = pow(elapsed, price_exponent, UINT256_MOD) // price_constant
+    return ((price_start * (1 + elapsed)) % UINT256_MOD //
+            ((1 + elapsed + decay_rate) % UINT256_MOD))
+
+
+def calc_token_prices(price_start, price_constant, price_exponent, elapsed):
+    """Vectorized `calc_token_price` over an array of elapsed seconds.
+
+    Uses int64 arithmetic when every intermediate value fits, Python ints
+    (object arrays) otherwise; both give the exact contract result.
+    """
+    elapsed = numpy.asarray(elapsed)
+    max_elapsed = int(elapsed.max()) if elapsed.size else 0
+    fits_int64 = (max_elapsed ** price_exponent <= INT64_MAX and
+                  price_start * (1 + max_elapsed) <= INT64_MAX)
+    if fits_int64:
+        elapsed = elapsed.astype(numpy.int64)
+        decay_rate = elapsed ** price_exponent // price_constant
+        return price_start * (1 + elapsed) // (1 + elapsed + decay_rate)
+    elapsed = elapsed.astype(object)
+    decay_rate = numpy.array([pow(int(e), price_exponent, UINT256_MOD) for e in elapsed],
+                             dtype=object) // price_constant
+    return ((price_start * (1 + elapsed)) % UINT256_MOD //
+            ((1 + elapsed + decay_rate) % UINT256_MOD))
+
+
+def elapsed_at_price(price_start, price_constant, price_exponent, price):
+    """Smallest elapsed time (seconds) at which `calc_token_price` is <= `price`.
+
+    The contract price only decreases after the first few rounding spikes, so
+    this is the inverse of `calc_token_price` past those. Returns None if the
+    price is never reached.
+    """
+    if price >= price_start:
+        return 0
+    if price < 0:
+        return None
+    high = 1
+    while calc_token_price(price_start, price_constant, price_exponent, high) > price:
+        high *= 2
+        if high ** price_exponent >= UINT256_MOD:
+            return None
+    low = 0
+    while low < high:
+        middle = (low + high) // 2
+        if calc_token_price(price_start, price_constant, price_exponent, middle) > price:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class AuctionPrice:
+    """The price functions of one auction, from its Deployed/AuctionStarted parameters."""
+
+    def __init__(self, price_start, price_constant, price_exponent, start_time=None,
+                 num_tokens_auctioned=None, token_multiplier=None):
+        self.price_start = price_start
+        self.price_constant = price_constant
+        self.price_exponent = price_exponent
+        self.start_time = start_time
+        self.num_tokens_auctioned = num_tokens_auctioned
+        self.token_multiplier = token_multiplier
+
+    @classmethod
+    def from_contract(cls, auction):
+        call = auction.call()
+        return cls(call.price_start(), call.price_constant(), call.price_exponent(),
+                   call.start_time(), call.num_tokens_auctioned(), call.token_multiplier())
+
+    def elapsed(self, timestamp, stage=AUCTION_STARTED):
+        if stage != AUCTION_STARTED or self.start_time is None:
+            return 0
+        return (timestamp - self.start_time) % UINT256_MOD
+
+    def price(self, timestamp, stage=AUCTION_STARTED):
+        """`DutchAuction.price()` at a block `timestamp`."""
+        if stage >= AUCTION_ENDED:
+            return 0
+        return calc_token_price(self.price_start, self.price_constant, self.price_exponent,
+                                self.elapsed(timestamp, stage))
+
+    def prices(self, timestamps):
+        """`price()` for every timestamp of a started auction."""
+        elapsed = numpy.asarray(timestamps) - self.start_time
+        return calc_token_prices(self.price_start, self.price_constant, self.price_exponent,
+                                 numpy.maximum(elapsed, 0))
+
+    def missing_funds(self, timestamp, received_wei, stage=AUCTION_STARTED):
+        """`DutchAuction.missingFundsToEndAuction()` at a block `timestamp`."""
+        required_wei_at_price = ((self.num_tokens_auctioned * self.price(timestamp, stage)) %
+                                 UINT256_MOD // self.token_multiplier)
+        if required_wei_at_price <= received_wei:
+            return 0
+        return required_wei_at_price - received_wei
+
+    def timestamp_at_price(self, price):
+        """Block timestamp from which the auction price is <= `price`."""
+        elapsed = elapsed_at_price(self.price_start, self.price_constant, self.price_exponent,
+                                   price)
+        if elapsed is None:
+            return None
+        return self.start_time + elapsed
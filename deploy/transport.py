@@ -0,0 +1,273 @@
+"""
+JSON-RPC transport shared by the sampler, the distributor and the simulation.
+
+`RPCTransport` is an HTTPProvider with its own keep-alive connection pool,
+per-method call counts and timings, retries with jittered exponential
+backoff on transient errors and JSON-RPC batches. `install_transport(web3)`
+replaces the HTTP provider of a web3 instance with it; other providers (IPC,
+tester) are left alone and `batch_request` falls back to single requests.
+
+With `call_cache=True` reads of the latest state (`eth_call`,
+`eth_getBalance`) go through a `CallCache`, so that many greenlets asking
+the same question in the same block cost one request. With `chain_cache`,
+the path of a deploy.cache.ChainCache database, finalized blocks, logs,
+transactions and receipts are answered from disk across runs.
+"""
+from collections import defaultdict
+from gevent.event import AsyncResult
+import json
+import logging
+import random
+import time
+
+import gevent
+import requests
+import requests.adapters
+from web3 import HTTPProvider
+
+from deploy.cache import FINAL_METHODS, MISSING, ChainCache
+
+log = logging.getLogger(__name__)
+
+# HTTP statuses of an overloaded or restarting node
+TRANSIENT_STATUSES = (429, 502, 503, 504)
+# methods that must not be sent twice if the node may have received them
+NON_IDEMPOTENT = ('eth_sendTransaction', 'eth_sendRawTransaction', 'personal_sendTransaction',
+                  'personal_signAndSendTransaction')
+# reads whose last parameter is the block, answered by CallCache when it is 'latest'
+CACHED_METHODS = ('eth_call', 'eth_getBalance')
+
+
+class RPCTransport(HTTPProvider):
+    """HTTPProvider with pooling, retries, batches and per-method metrics.
+
+    Every request is retried up to `retries` times after a connection error,
+    a timeout or a transient HTTP status, sleeping a random duration between
+    0 and `backoff * 2 ** attempt` seconds (capped at `max_backoff`). Sending
+    transactions is only retried when the connection could not be made.
+    JSON-RPC errors are returned to web3 as they are.
+
+    Listeners are called with (method, duration, outcome) after each attempt,
+    outcome being 'ok', 'retry' or 'error'; batches are reported once per
+    request with the 'batched' outcome and once as the 'batch' method, reads
+    answered by the call cache with the 'cached' outcome.
+    """
+
+    def __init__(self, endpoint_uri, request_kwargs=None, pool_size=10, retries=3,
+                 backoff=0.1, max_backoff=5, timeout=30, call_cache=False, chain_cache=None,
+                 confirmations=12):
+        super(RPCTransport, self).__init__(endpoint_uri, request_kwargs)
+        self._request_kwargs.setdefault('timeout', timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                                pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # method -> [calls, errors, retries, cached, seconds]
+        self.stats = defaultdict(lambda: [0, 0, 0, 0, 0.0])
+        self.listeners = []
+        self.head_block = None
+        self.head_time = 0
+        self.pending_head = None
+        self.call_cache = CallCache(self) if call_cache else None
+        self.chain_cache = None
+        if chain_cache:
+            self.chain_cache = ChainCache(self, chain_cache, confirmations)
+
+    def __str__(self):
+        return "pooled RPC connection {0}".format(self.endpoint_uri)
+
+    def make_request(self, method, params):
+        if (self.call_cache is not None and method in CACHED_METHODS and
+                len(params) > 0 and params[-1] == 'latest'):
+            return self.call_cache.request(method, params)
+        if self.chain_cache is not None and method in FINAL_METHODS:
+            return self.chain_cache.request(method, params)
+        return self.post(method, self.encode_rpc_request(method, params),
+                         retry=method not in NON_IDEMPOTENT)
+
+    def request(self, method, params):
+        """Decoded response of a request sent to the node, bypassing the caches."""
+        return json.loads(self.post(method, self.encode_rpc_request(method, params),
+                                    retry=method not in NON_IDEMPOTENT).decode())
+
+    def head(self, max_age=1):
+        """Latest block number, asked again at most every `max_age` seconds."""
+        if self.pending_head is not None:
+            return self.pending_head.get()
+        if self.head_block is not None and time.time() - self.head_time < max_age:
+            return self.head_block
+        self.pending_head = pending = AsyncResult()
+        try:
+            block = int(self.request('eth_blockNumber', [])['result'], 16)
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            self.pending_head = None
+        self.head_block = block
+        self.head_time = time.time()
+        pending.set(block)
+        return block
+
+    def batch(self, requests):
+        """Send [(method, params)] as one JSON-RPC batch; results are in request order.
+
+        Requests answered by the chain cache are left out of the batch.
+        """
+        results = [None] * len(requests)
+        missing = list(range(len(requests)))
+        if self.chain_cache is not None:
+            missing = []
+            for i, (method, params) in enumerate(requests):
+                cached = self.chain_cache.get(method, params)
+                if cached is MISSING:
+                    missing.append(i)
+                else:
+                    results[i] = cached
+            if len(missing) == 0:
+                return results
+        payload = [{'jsonrpc': '2.0', 'method': requests[i][0], 'params': requests[i][1],
+                    'id': i} for i in missing]
+        retry = all(requests[i][0] not in NON_IDEMPOTENT for i in missing)
+        for i in missing:
+            self.record(requests[i][0], 0, 'batched')
+        response = json.loads(self.post('batch', json.dumps(payload).encode(), retry).decode())
+        if isinstance(response, dict):
+            # the node rejected the batch as a whole
+            raise ValueError(response.get('error', response))
+        for item in response:
+            if 'error' in item:
+                raise ValueError(item['error'])
+            results[item['id']] = item['result']
+        if self.chain_cache is not None:
+            self.chain_cache.store_all([(requests[i][0], requests[i][1], results[i])
+                                        for i in missing])
+        return results
+
+    def post(self, method, data, retry=True):
+        attempt = 0
+        while True:
+            t_start = time.time()
+            try:
+                response = self.session.post(self.endpoint_uri, data=data,
+                                             **self.get_request_kwargs())
+                response.raise_for_status()
+            except requests.RequestException as e:
+                duration = time.time() - t_start
+                if attempt >= self.retries or not self.is_transient(e, retry):
+                    self.record(method, duration, 'error')
+                    raise
+                self.record(method, duration, 'retry')
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                log.warning('%s request failed (%s), retrying in %.2f seconds'
+                            % (method, str(e), delay))
+                gevent.sleep(delay)
+                attempt += 1
+                continue
+            self.record(method, time.time() - t_start, 'ok')
+            return response.content
+
+    def is_transient(self, error, retry):
+        if isinstance(error, requests.ConnectTimeout):
+            # the request was not sent
+            return True
+        if not retry:
+            return False
+        if isinstance(error, requests.HTTPError):
+            return error.response.status_code in TRANSIENT_STATUSES
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+    def record(self, method, duration, outcome):
+        stats = self.stats[method]
+        if outcome in ('ok', 'error', 'batched'):
+            stats[0] += 1
+        if outcome == 'error':
+            stats[1] += 1
+        elif outcome == 'retry':
+            stats[2] += 1
+        elif outcome == 'cached':
+            stats[3] += 1
+        stats[4] += duration
+        for listener in self.listeners:
+            listener(method, duration, outcome)
+
+    def log_stats(self):
+        for method, (calls, errors, retries, cached, seconds) in sorted(self.stats.items()):
+            log.info('%s: %d calls, %d errors, %d retries, %d cached, %f seconds'
+                     % (method, calls, errors, retries, cached, seconds))
+
+
+class CallCache:
+    """Single-flight cache of reads of the latest state, valid for one block.
+
+    A read at 'latest' is sent for the head block number instead and keyed by
+    (method, params at that block), i.e. (to, calldata, block) for `eth_call`
+    plus the sender, which can change the result. Concurrent identical reads
+    wait for the first one's response; all entries are dropped when the head
+    changes. The head is asked with `eth_blockNumber` at most every `max_age`
+    seconds, so a read may see the state of a block up to `max_age` old.
+    Error responses are shared by the waiting reads but not cached.
+    """
+
+    def __init__(self, transport, max_age=1):
+        self.transport = transport
+        self.max_age = max_age
+        # block of the cached results
+        self.block = None
+        # (method, params) -> AsyncResult of the response
+        self.results = {}
+
+    def request(self, method, params):
+        block = self.transport.head(self.max_age)
+        if block != self.block:
+            self.results.clear()
+            self.block = block
+        params = list(params[:-1]) + [hex(block)]
+        key = (method, json.dumps(params, sort_keys=True))
+        result = self.results.get(key)
+        if result is not None:
+            self.transport.record(method, 0, 'cached')
+            return result.get()
+        self.results[key] = result = AsyncResult()
+        try:
+            response = self.transport.request(method, params)
+        except Exception as e:
+            self.results.pop(key, None)
+            result.set_exception(e)
+            raise
+        if 'error' in response:
+            self.results.pop(key, None)
+        result.set(response)
+        return response
+
+
+def install_transport(web3, **kwargs):
+    """Replace the HTTP provider of `web3` with an RPCTransport to the same endpoint.
+
+    Returns the transport, or None if `web3` does not use an HTTP provider.
+    """
+    provider = web3.currentProvider
+    if isinstance(provider, RPCTransport):
+        return provider
+    if not isinstance(provider, HTTPProvider):
+        return None
+    transport = RPCTransport(provider.endpoint_uri, dict(provider._request_kwargs), **kwargs)
+    web3.setProvider(transport)
+    log.info('web3 provider is %s' % transport)
+    return transport
+
+
+def batch_request(web3, requests):
+    """Send [(method, params)] as one JSON-RPC batch; results are in request order.
+
+    Providers that can't do batches (IPC, tester) get the requests one by one.
+    """
+    provider = web3.currentProvider
+    if not isinstance(provider, RPCTransport):
+        return [web3._requestManager.request_blocking(method, params)
+                for method, params in requests]
+    return provider.batch(requests)
@@ -5,9 +5,9 @@ import sha3
 import gevent
 from ethereum.utils import encode_hex
 
-from web3.formatters import input_filter_params_formatter, log_array_formatter
-from web3.utils.events import get_event_data
 from web3.utils.filters import construct_event_filter_params
+from deploy.decoder import get_registry
+from deploy.hub import get_hub
 import logging
 
 log = logging.getLogger(__name__)
@@ -35,6 +35,12 @@ def check_succesful_tx(web3, txid, timeout=180) -> dict:
 
 
 class LogFilter:
+    """Decoded `event_name` logs of `address` since `from_block`, then as they are mined.
+
+    Logs are delivered by the LogHub of `web3`, so any number of filters
+    share the same polling.
+    """
+
     def __init__(self,
                  web3,
                  abi,
@@ -45,53 +51,46 @@ class LogFilter:
                  filters=None,
                  callback=None):
         self.web3 = web3
-        filter_kwargs = {
-            'fromBlock': from_block,
-            'toBlock': to_block,
-            'address': address
-        }
-        self.event_abi = [i for i in abi if i['type'] == 'event' and i['name'] == event_name][0]
-        assert self.event_abi
+        self.decoder = get_registry(abi)[event_name]
+        self.event_abi = self.decoder.abi
         filters = filters if filters else {}
-        self.filter = construct_event_filter_params(
+        topics = construct_event_filter_params(
             self.event_abi,
-            argument_filters=filters,
-            **filter_kwargs)[1]
-        filter_params = input_filter_params_formatter(self.filter)
-
-        self.filter = web3.eth.filter(filter_params)
-
-        for log in self.get_logs():
-            callback(log)
+            argument_filters=filters)[1]['topics']
 
-        self.watch_logs(callback)
-
-    def get_logs(self):
-        response = self.web3.eth.getFilterLogs(self.filter.filter_id)
-        logs = log_array_formatter(response)
-        logs = [dict(log) for log in logs]
-        for log in logs:
-            log = self.set_log_data(log)
-        return logs
-
-    def set_log_data(self, log):
-        log['args'] = get_event_data(self.event_abi, log)['args']
-        return log
-
-    def watch_logs(self, callback):
         def log_callback(log):
             callback(self.set_log_data(log))
 
-        self.filter.watch(log_callback)
+        self.subscription = get_hub(web3).subscribe(
+            address,
+            topics,
+            log_callback,
+            from_block=from_block,
+            to_block=None if to_block == 'latest' else to_block)
+
+    def set_log_data(self, log):
+        return self.decoder.decode(log)
 
     def stop(self):
-        self.filter.stop_watching()
-        self.web3.eth.uninstallFilter(self.filter.filter_id)
+        self.subscription.stop()
 
 
 def watch_logs(contract, event, callback, params={}):
-    transfer_filter = contract.on(event, params)
-    transfer_filter.watch(callback)
+    """Call `callback` with each decoded `event` log of `contract` mined from now on.
+
+    `params` are those of `contract.on()`: 'filter' for indexed arguments and
+    'fromBlock' to get older logs first.
+    """
+    decoder = get_registry(contract.abi)[event]
+    topics = construct_event_filter_params(
+        decoder.abi,
+        argument_filters=params.get('filter', {}))[1]['topics']
+    from_block = params.get('fromBlock', 'latest')
+    return get_hub(contract.web3).subscribe(
+        contract.address,
+        topics,
+        lambda log: callback(decoder.decode(log)),
+        from_block=None if from_block == 'latest' else from_block)
 
 
 def print_logs(contract, event, name=''):
@@ -142,22 +141,5 @@ def assignFundsToBidders(web3, owner: str, bidders: list, distribution_limit: in
     gevent.joinall(gevents)
 
 
-def set_connection_pool_size(web3, pool_connections, pool_size):
-    """Hack to override default poolsize for web3"""
-    from web3.utils.compat.compat_requests import _get_session
-    from web3 import HTTPProvider
-    import requests
-    provider = web3.currentProvider
-    if isinstance(provider, HTTPProvider) is False:
-        return
-    provider._request_kwargs['timeout'] = 30
-    logging.info("setting web3 HTTPProvider connections={0} pool_size={1}"
-                 .format(pool_connections, pool_size))
-    session = _get_session(provider.endpoint_uri)
-    adapter = requests.adapters.HTTPAdapter(pool_connections, pool_size)
-    session.mount('http://', adapter)
-    requests.adapters.DEFAULT_POOL_TIMEOUT = 30
-
-
 def get_expected_tokens(amount, token_multiplier, final_price):
     return (token_multiplier * amount) // final_price
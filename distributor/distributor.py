@@ -6,10 +6,10 @@ from web3.utils.compat import (
     Timeout,
 )
 from deploy.utils import (
+    LogFilter,
     check_succesful_tx,
     get_expected_tokens
 )
-from tests.utils_logs import LogFilter
 import logging
 log = logging.getLogger(__name__)
 
@@ -74,9 +74,10 @@ class Distributor:
                 f.write('block_number,address,step_bid_value,event_bid_value\n')
             log.info('The following file has been created: %s', self.bids_file)
 
+        # each filter delivers the past logs when created, so the bids are known before
+        # the end of the auction, and the final price before the claims
         self.filter_bids = self.handle_auction_logs('BidSubmission', self.add_address)
-        self.filter_bids.init(self.watch_auction_end)
-        self.filter_bids.watch()
+        self.watch_auction_end()
 
     def watch_auction_end(self):
         def set_end(event):
@@ -84,13 +85,11 @@ class Distributor:
             self.final_price = self.auction.call().final_price()
 
         self.filter_auction_end = self.handle_auction_logs('AuctionEnded', set_end)
-        self.filter_auction_end.init(self.watch_auction_claim)
-        self.filter_auction_end.watch()
+        self.watch_auction_claim()
 
     def watch_auction_claim(self):
         self.filter_claims = self.handle_auction_logs('ClaimedTokens', self.add_verified)
-        self.filter_claims.init(self.watch_auction_distributed)
-        self.filter_claims.watch()
+        self.watch_auction_distributed()
 
     def watch_auction_distributed(self):
         def set_distribution_end(event):
@@ -100,8 +99,6 @@ class Distributor:
 
         self.filter_distributed = self.handle_auction_logs('TokensDistributed',
                                                            set_distribution_end)
-        self.filter_distributed.init()
-        self.filter_distributed.watch()
 
     def add_address(self, event):
         if not event:
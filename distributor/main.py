@@ -7,6 +7,7 @@ import click
 from deploy.utils import (
     check_succesful_tx
 )
+from deploy.transport import install_transport
 import sys
 from time import time
 import logging
@@ -62,6 +63,21 @@ log = logging.getLogger(__name__)
     default=True,
     help='Only collect bid events information.'
 )
+@click.option(
+    '--rpc-pool-size',
+    default=10,
+    help='Number of keep-alive connections to the node'
+)
+@click.option(
+    '--rpc-retries',
+    default=3,
+    help='Retries of a JSON-RPC request after a transient error'
+)
+@click.option(
+    '--rpc-cache',
+    default='build/chain-cache.sqlite',
+    help='File caching finalized chain data between runs, "" disables it'
+)
 def main(**kwargs):
     project = Project()
 
@@ -85,6 +101,9 @@ def main(**kwargs):
 
     with project.get_chain(chain_name) as chain:
         web3 = chain.web3
+        transport = install_transport(web3, pool_size=kwargs['rpc_pool_size'],
+                                      retries=kwargs['rpc_retries'],
+                                      chain_cache=kwargs['rpc_cache'])
         log.info('Web3 provider is %s' % (web3.currentProvider))
 
         account = account or chain.web3.eth.accounts[0]
@@ -124,6 +143,8 @@ def main(**kwargs):
                                     wait, not distribution)
         if distribution:
             distrib.distribute()
+        if transport is not None:
+            transport.log_stats()
 
 
 if __name__ == '__main__':
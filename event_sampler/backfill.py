@@ -0,0 +1,93 @@
+from gevent.pool import Pool
+from operator import itemgetter
+
+import logging
+import requests
+
+from web3.formatters import input_filter_params_formatter, log_array_formatter
+
+from deploy.cache import LOGS_SEGMENT
+
+log = logging.getLogger(__name__)
+
+# Substrings of node errors that mean "ask for a smaller block range".
+# geth/parity/infura all word this differently.
+RESULT_SIZE_ERRORS = (
+    'query returned more than',
+    'response size',
+    'result window',
+    'too many',
+    'limit exceeded',
+    'timeout',
+    'timed out',
+)
+
+
+class LogBackfill:
+    """Fetches logs for a block range as concurrent `eth_getLogs` chunks.
+
+    A chunk the node refuses to answer (too many results, timeout) is split
+    with half the chunk size until it goes through; the smaller size is then
+    used for the chunks that follow. Results are returned ordered by
+    (blockNumber, logIndex).
+
+    Chunks end at multiples of `chunk_size`, so that with the default size
+    each chunk is a segment of the chain cache (deploy.cache), the same in
+    every run whatever the range asked for.
+    """
+
+    def __init__(self, web3, chunk_size=LOGS_SEGMENT, min_chunk_size=1, concurrency=8):
+        assert chunk_size >= min_chunk_size >= 1
+        self.web3 = web3
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.concurrency = concurrency
+
+    def get_logs(self, filter_params, from_block=0, to_block='latest'):
+        if to_block == 'latest':
+            to_block = self.web3.eth.blockNumber
+        if from_block == 'earliest':
+            from_block = 0
+        if from_block > to_block:
+            return []
+        pool = Pool(self.concurrency)
+        chunks = pool.map(lambda r: self.get_range(filter_params, *r),
+                          self.split_range(from_block, to_block))
+        logs = [log for chunk in chunks for log in chunk]
+        logs.sort(key=itemgetter('blockNumber', 'logIndex'))
+        return logs
+
+    def split_range(self, from_block, to_block, chunk_size=None):
+        chunk_size = self.chunk_size if chunk_size is None else chunk_size
+        start = from_block
+        while start <= to_block:
+            end = min((start // chunk_size + 1) * chunk_size - 1, to_block)
+            yield (start, end)
+            start = end + 1
+
+    def get_range(self, filter_params, from_block, to_block):
+        params = dict(filter_params, fromBlock=from_block, toBlock=to_block)
+        try:
+            response = self.web3._requestManager.request_blocking(
+                'eth_getLogs', [input_filter_params_formatter(params)])
+        except (ValueError, requests.exceptions.Timeout) as e:
+            size = to_block - from_block + 1
+            if size <= self.min_chunk_size or not self.is_result_size_error(e):
+                raise
+            chunk_size = self.chunk_size
+            while chunk_size >= size:
+                chunk_size //= 2
+            chunk_size = max(self.min_chunk_size, chunk_size)
+            self.chunk_size = min(self.chunk_size, chunk_size)
+            log.warning('eth_getLogs %d-%d failed (%s), retrying with chunk size %d'
+                        % (from_block, to_block, str(e), chunk_size))
+            return [event for start, end in self.split_range(from_block, to_block, chunk_size)
+                    for event in self.get_range(filter_params, start, end)]
+        return [dict(log) for log in log_array_formatter(response)]
+
+    @staticmethod
+    def is_result_size_error(error):
+        if isinstance(error, requests.exceptions.Timeout):
+            return True
+        message = str(error).lower()
+        return any(s in message for s in RESULT_SIZE_ERRORS)
@@ -0,0 +1,65 @@
+from bisect import bisect_left, bisect_right
+import csv
+import io
+import json
+
+BID_COLUMNS = ['block', 'transaction_index', 'log_index', 'sender', 'amount', 'missing_funds']
+CLAIM_COLUMNS = ['block', 'transaction_index', 'log_index', 'recipient', 'amount']
+FORMATS = ('ndjson', 'csv')
+
+
+def bid_rows(bids, count, from_block, to_block, sender=None):
+    """Bid rows of blocks [from_block, to_block] among the first `count` rows."""
+    sender_id = None
+    if sender is not None:
+        sender_id = bids.sender_ids.get(sender)
+        if sender_id is None:
+            return
+    for i in range(bisect_left(bids.block, from_block, 0, count),
+                   bisect_right(bids.block, to_block, 0, count)):
+        if i >= len(bids):
+            # rows dropped by a reorganization while streaming
+            return
+        if sender_id is not None and bids.sender[i] != sender_id:
+            continue
+        yield [bids.block[i], bids.transaction_index[i], bids.log_index[i],
+               bids.senders[bids.sender[i]], bids.amount[i], bids.missing_funds[i]]
+
+
+def claim_rows(claims, count, from_block, to_block, recipient=None):
+    """Claim rows of blocks [from_block, to_block] among the first `count`."""
+    recipient_id = None
+    if recipient is not None:
+        recipient_id = claims.recipient_ids.get(recipient)
+        if recipient_id is None:
+            return
+    for i in range(bisect_left(claims.block, from_block, 0, count),
+                   bisect_right(claims.block, to_block, 0, count)):
+        if i >= len(claims):
+            # rows dropped by a reorganization while streaming
+            return
+        if recipient_id is not None and claims.recipient[i] != recipient_id:
+            continue
+        yield [claims.block[i], claims.transaction_index[i], claims.log_index[i],
+               claims.recipients[claims.recipient[i]], claims.amount[i]]
+
+
+def serialize(rows, columns, output_format, chunk_size=1000):
+    """Encode rows as NDJSON objects or CSV lines, yielding `chunk_size` rows per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if output_format == 'csv':
+        writer.writerow(columns)
+    count = 0
+    for row in rows:
+        if output_format == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, row))) + '\n')
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell() > 0:
+        yield buffer.getvalue().encode()
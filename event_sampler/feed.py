@@ -0,0 +1,173 @@
+from deploy.transport import batch_request
+from event_sampler.backfill import LogBackfill
+from event_sampler.timestamps import BlockTimestampResolver
+
+from collections import defaultdict
+import gevent
+import gevent.event
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class LogFeed:
+    """Logs of any number of auction contracts from one filter and one backfill.
+
+    Samplers are registered with `add()` before `start()`. The feed installs a
+    single log filter over all their addresses, backfills every sampler from
+    the oldest checkpoint with shared `eth_getLogs` calls and routes each log
+    to the sampler of its address. Block timestamps are fetched through one
+    resolver, so a block holding logs of several auctions is fetched once.
+
+    The filter is polled by the feed rather than with `watch()`, so that the
+    samplers' checkpoints also advance through blocks without auction logs.
+    A node may report a new head before its logs reach the filter, so a poll
+    only vouches for the head read before the previous poll: by then the
+    filter had a whole interval to deliver that block's logs. Logs of later
+    blocks still reach the samplers as soon as they are delivered.
+
+    Chain reorganizations are detected from the filter's removed logs and
+    logs of replaced recent blocks, and by asking the hashes of the samplers'
+    recent blocks again at each new head. The samplers reached by a
+    reorganization are rolled back to the first replaced block and synced
+    again together, once per poll.
+    """
+
+    def __init__(self, web3, poll_interval=1):
+        self.web3 = web3
+        self.poll_interval = poll_interval
+        self.run = gevent.event.Event()
+        self.backfill = LogBackfill(web3)
+        self.timestamps = BlockTimestampResolver(web3)
+        # lowercase contract address -> EventSampler
+        self.samplers = {}
+        self.log_filter = None
+        # head block read before the last poll: its logs are delivered by the next one
+        self.polled_head = None
+        # hash of the head at which the hashes of the recent blocks were last checked
+        self.checked_head = None
+
+    def add(self, sampler):
+        self.samplers[sampler.contract_addr.lower()] = sampler
+
+    def filter_params(self, samplers=None):
+        samplers = self.samplers if samplers is None else samplers
+        topics = set()
+        for sampler in samplers.values():
+            topics.update(sampler.handlers.keys())
+        return {
+            'address': list(samplers.keys()),
+            'topics': [sorted(topics)]
+        }
+
+    def start(self):
+        # the filter is installed before syncing so that no log mined in between is lost;
+        # logs it reports for already synced blocks are skipped by the samplers
+        self.log_filter = self.web3.eth.filter(dict(self.filter_params(), fromBlock='latest'))
+        # blocks processed before a restart may have been replaced since
+        for address, block in self.check_hashes().items():
+            self.samplers[address].rollback(block)
+        self.sync_events()
+        self.ev_poll = gevent.spawn(self.callback)
+        for sampler in self.samplers.values():
+            sampler.start()
+
+    def stop(self):
+        self.run.set()
+
+    def callback(self):
+        while self.run.is_set() is False:
+            gevent.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception as e:
+                log.warning('log filter poll failed: %s' % str(e))
+
+    def poll(self):
+        head_block = self.web3.eth.getBlock('latest')
+        head = head_block['number']
+        changes = self.web3.eth.getFilterChanges(self.log_filter.filter_id)
+        # address -> first replaced block of the samplers reached by a reorganization
+        orphaned = self.check_hashes() if head_block['hash'] != self.checked_head else {}
+        self.checked_head = head_block['hash']
+        for event in changes:
+            sampler = self.samplers.get(event['address'].lower())
+            if sampler is not None and sampler.is_orphaned(event):
+                address = event['address'].lower()
+                orphaned[address] = min(orphaned.get(address, event['blockNumber']),
+                                        event['blockNumber'])
+        for event in changes:
+            if event['address'].lower() not in orphaned:
+                self.on_log(event)
+        if len(orphaned) > 0:
+            self.reorganize(orphaned)
+        if self.polled_head is not None:
+            for sampler in self.samplers.values():
+                sampler.advance(self.polled_head['number'], self.polled_head['timestamp'])
+        self.polled_head = head_block
+
+    def check_hashes(self):
+        """First replaced block of each sampler whose recent blocks changed hash.
+
+        The hashes of all the recent blocks are asked in one batch. A replaced
+        block may follow blocks without logs of the auction that were replaced
+        too, so the rollback starts after the last recent block still on the
+        chain, or at the oldest block that may be reorganized.
+        """
+        blocks = sorted(set(block for sampler in self.samplers.values()
+                            for block in sampler.state.recent))
+        if len(blocks) == 0:
+            return {}
+        results = batch_request(self.web3, [('eth_getBlockByNumber', [hex(block), False])
+                                            for block in blocks])
+        hashes = {block: result['hash'] if result is not None else None
+                  for block, result in zip(blocks, results)}
+        orphaned = {}
+        for address, sampler in self.samplers.items():
+            first = sampler.head - sampler.confirmations + 1
+            for block in sorted(sampler.state.recent):
+                if hashes[block] != sampler.state.recent[block]['hash']:
+                    orphaned[address] = first
+                    break
+                first = block + 1
+        return orphaned
+
+    def reorganize(self, orphaned):
+        """Roll back the samplers of `orphaned` and sync them again from there."""
+        for address, block in orphaned.items():
+            self.samplers[address].rollback(block)
+        self.sync_events({address: self.samplers[address] for address in orphaned})
+
+    def sync_events(self, samplers=None):
+        """Process the logs from the checkpoint of `samplers` (default all) to the head."""
+        samplers = self.samplers if samplers is None else samplers
+        from_block = min(sampler.state.synced_block for sampler in samplers.values()) + 1
+        head_block = self.web3.eth.getBlock('latest')
+        to_block = head_block['number']
+        log.info('syncing %d auctions from block %d' % (len(samplers), from_block))
+        t_start = time.time()
+        logs = self.backfill.get_logs(self.filter_params(samplers), from_block, to_block)
+        log.info('get logs of blocks %d-%d took %f seconds (%d events)'
+                 % (from_block, to_block, time.time() - t_start, len(logs)))
+        by_address = defaultdict(list)
+        for event in logs:
+            by_address[event['address'].lower()].append(event)
+        # one fetch for the blocks of all the auctions, stored in the state of each
+        blocks = {address: set(event['blockNumber'] for event in events)
+                  for address, events in by_address.items()}
+        timestamps = self.timestamps.resolve(
+            block for address, sampler in samplers.items()
+            for block in blocks.get(address, ()) if block not in sampler.state.block_to_timestamp)
+        for address, sampler in samplers.items():
+            sampler.store_timestamps({block: timestamps[block]
+                                      for block in blocks.get(address, ()) if block in timestamps})
+            events = [sampler.decode(dict(event)) for event in by_address[address]]
+            sampler.apply_events(events, to_block, head_block['timestamp'])
+
+    def on_log(self, event):
+        sampler = self.samplers.get(event['address'].lower())
+        if sampler is None:
+            log.warning('log of unknown contract %s' % event['address'])
+            return
+        sampler.on_log(event)
@@ -0,0 +1,208 @@
+import numpy
+
+# cells per chunk of a pyramid level, the unit copied on write after freeze()
+CHUNK_BITS = 8
+CHUNK = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK - 1
+
+
+class TimeHistogram:
+    """Bid amounts binned by block timestamp, kept as a power-of-two pyramid.
+
+    The base level holds the amount bid in each `resolution` seconds slot since
+    `origin`; level k holds the sums of 2**k consecutive slots. A bid updates one
+    cell per level, and the sum of any slot range is combined from at most two
+    cells per level, so a histogram of any number of bins costs O(bins log n)
+    no matter how many bids there are.
+
+    Levels are stored in chunks of CHUNK cells. `freeze()` shares the chunks
+    with the frozen copy instead of copying the cells, and a chunk is copied
+    the first time it changes afterwards, so publishing a view after a few
+    bids costs a few chunks rather than the whole pyramid.
+    """
+
+    def __init__(self, resolution=15):
+        self.resolution = resolution
+        self.origin = None
+        # levels[k]: chunks of the cells of level k, cell i being the amount bid
+        # in slots [i * 2**k, (i + 1) * 2**k)
+        self.levels = []
+        # number of cells of each level
+        self.sizes = []
+        # indexes of the chunks of each level not shared with a frozen copy
+        self.owned = []
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.total = 0
+        # read-only copy returned by freeze(), dropped on every change
+        self.frozen = None
+
+    def slot(self, timestamp):
+        return (timestamp - self.origin) // self.resolution
+
+    def cell(self, k, i):
+        return self.levels[k][i >> CHUNK_BITS][i & CHUNK_MASK]
+
+    def change(self, k, i, amount):
+        chunks = self.levels[k]
+        chunk = i >> CHUNK_BITS
+        if chunk not in self.owned[k]:
+            chunks[chunk] = list(chunks[chunk])
+            self.owned[k].add(chunk)
+        chunks[chunk][i & CHUNK_MASK] += amount
+
+    def slots(self):
+        """Amounts of the base level slots."""
+        if len(self.levels) == 0:
+            return []
+        return [amount for chunk in self.levels[0] for amount in chunk][:self.sizes[0]]
+
+    def add(self, timestamp, amount):
+        self.frozen = None
+        if self.origin is None:
+            self.origin = timestamp - timestamp % self.resolution
+        elif timestamp < self.origin:
+            self.rebase(timestamp - timestamp % self.resolution)
+        slot = self.slot(timestamp)
+        self.grow(slot + 1)
+        for k in range(len(self.levels)):
+            self.change(k, slot, amount)
+            slot >>= 1
+        self.total += amount
+        if self.first_timestamp is None or timestamp < self.first_timestamp:
+            self.first_timestamp = timestamp
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+
+    def remove(self, timestamp, amount):
+        """Take back a bid added with `add()`, e.g. after a chain reorganization."""
+        self.add(timestamp, -amount)
+        slot = self.slot(timestamp)
+        if self.cell(0, slot) != 0:
+            return
+        # the slot is empty: it may have held the first or the last bid
+        if slot == self.slot(self.first_timestamp):
+            first = self.find_slot(last=False)
+            self.first_timestamp = None if first is None else self.origin + first * self.resolution
+        if slot == self.slot(self.last_timestamp):
+            last = self.find_slot(last=True)
+            self.last_timestamp = None if last is None else self.origin + last * self.resolution
+
+    def find_slot(self, last):
+        """First or last base slot holding an amount, None if all are empty.
+
+        Descends the pyramid from its top cell towards the non-empty child,
+        which works because amounts are never negative.
+        """
+        if len(self.levels) == 0 or self.total == 0:
+            return None
+        i = 0
+        for k in range(len(self.levels) - 1, 0, -1):
+            left, right = 2 * i, 2 * i + 1
+            has_right = right < self.sizes[k - 1] and self.cell(k - 1, right) != 0
+            if last:
+                i = right if has_right else left
+            else:
+                i = left if self.cell(k - 1, left) != 0 else right
+        return i
+
+    def grow(self, size):
+        if len(self.levels) == 0:
+            self.add_level()
+        if self.sizes[0] >= size:
+            return
+        self.resize(0, size)
+        k = 1
+        while self.sizes[k - 1] > 1:
+            length = (self.sizes[k - 1] + 1) // 2
+            if k == len(self.levels):
+                self.add_level()
+                self.resize(k, length)
+                for i in range(length):
+                    below = self.cell(k - 1, 2 * i)
+                    if 2 * i + 1 < self.sizes[k - 1]:
+                        below += self.cell(k - 1, 2 * i + 1)
+                    if below != 0:
+                        self.change(k, i, below)
+            else:
+                self.resize(k, length)
+            k += 1
+
+    def add_level(self):
+        self.levels.append([])
+        self.sizes.append(0)
+        self.owned.append(set())
+
+    def resize(self, k, size):
+        chunks = self.levels[k]
+        while len(chunks) * CHUNK < size:
+            self.owned[k].add(len(chunks))
+            chunks.append([0] * CHUNK)
+        self.sizes[k] = size
+
+    def rebase(self, origin):
+        # a bid older than the origin; rare, so the pyramid is simply rebuilt
+        shift = (self.origin - origin) // self.resolution
+        self.origin = origin
+        self.fill([0] * shift + self.slots())
+
+    def fill(self, base):
+        """Rebuild the pyramid from the amounts of the base level slots."""
+        self.frozen = None
+        self.levels = []
+        self.sizes = []
+        self.owned = []
+        self.grow(len(base))
+        for slot, amount in enumerate(base):
+            if amount == 0:
+                continue
+            for k in range(len(self.levels)):
+                self.change(k, slot, amount)
+                slot >>= 1
+
+    def freeze(self):
+        """Copy of the histogram sharing its chunks, valid until the next change."""
+        if self.frozen is None:
+            frozen = TimeHistogram(self.resolution)
+            frozen.origin = self.origin
+            frozen.levels = tuple(tuple(chunks) for chunks in self.levels)
+            frozen.sizes = tuple(self.sizes)
+            frozen.first_timestamp = self.first_timestamp
+            frozen.last_timestamp = self.last_timestamp
+            frozen.total = self.total
+            frozen.frozen = frozen
+            # the chunks now belong to the frozen copy too: copy them before changing them
+            self.owned = [set() for _ in self.levels]
+            self.frozen = frozen
+        return self.frozen
+
+    def range_sum(self, start, end):
+        """Amount bid in slots [start, end)."""
+        total = 0
+        for k in range(len(self.levels)):
+            if start >= end:
+                break
+            if start & 1:
+                total += self.cell(k, start)
+                start += 1
+            if end & 1:
+                end -= 1
+                total += self.cell(k, end)
+            start >>= 1
+            end >>= 1
+        return total
+
+    def histogram(self, num_bins):
+        """Split the time between the first and the last bid into `num_bins` bins.
+
+        Returns the `num_bins + 1` bin edge timestamps and the amount bid per bin.
+        """
+        if self.first_timestamp is None:
+            return [], []
+        start = self.slot(self.first_timestamp)
+        end = self.slot(self.last_timestamp) + 1
+        num_bins = max(min(end - start, num_bins), 1)
+        edges = numpy.linspace(start, end, num_bins + 1).astype(int).tolist()
+        sums = [self.range_sum(edges[i], edges[i + 1]) for i in range(num_bins)]
+        timestamps = [self.origin + edge * self.resolution for edge in edges]
+        return timestamps, sums
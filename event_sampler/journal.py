@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+
+def write_atomic(path, data):
+    """Replace `path` with `data` so that a crash leaves either the old or the new file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+def fsync_dir(path):
+    # makes the rename itself durable
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """Append-only file of state changes, one JSON record per line.
+
+    Records are numbered; a snapshot stores the number of the last record it
+    includes, so records already in the snapshot are skipped on replay even if
+    the journal was not truncated after the snapshot was written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0
+        self.pending = []
+        # number of records written since the journal was last truncated
+        self.size = 0
+
+    def append(self, record):
+        self.seq += 1
+        self.pending.append([self.seq] + record)
+
+    def flush(self):
+        if len(self.pending) == 0:
+            return
+        with open(self.path, 'a') as f:
+            for record in self.pending:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.size += len(self.pending)
+        self.pending = []
+
+    def read(self, after_seq=0):
+        """Records with a number above `after_seq`, without their number.
+
+        A record torn by a crash is cut off the file together with anything
+        after it, so that the next flush doesn't append to the partial line.
+        """
+        if not os.path.isfile(self.path):
+            return
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('no end of line')
+                    record = json.loads(line.decode())
+                except ValueError:
+                    break
+                offset += len(line)
+                self.seq = max(self.seq, record[0])
+                self.size += 1
+                if record[0] > after_seq:
+                    yield record[1:]
+            end = f.seek(0, os.SEEK_END)
+        if end > offset:
+            log.warning('torn journal record in %s, dropping its last %d bytes'
+                        % (self.path, end - offset))
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+                os.fsync(f.fileno())
+
+    def truncate(self):
+        with open(self.path, 'w') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.size = 0
@@ -3,13 +3,26 @@ monkey.patch_all()
 from populus import Project
 import click
 import gevent
+import gevent.socket
 import logging
+import os
+import shutil
+import stat
 from flask import Flask
 from flask_restful import (
     Api,
 )
-from event_sampler.resources import AuctionStatus
+from event_sampler.resources import (AuctionEvents, AuctionExport, AuctionStatus, AuctionStream,
+                                     Metrics, StatusCache, instrument_app)
+from event_sampler.metrics import instrument_web3
+from deploy.transport import install_transport
 from event_sampler.sampler import EventSampler
+from event_sampler.feed import LogFeed
+from event_sampler.poller import ChainPoller
+from event_sampler.stream import StatusStream
+from event_sampler.shared import StatePublisher, shared_auctions
+
+log = logging.getLogger(__name__)
 
 
 @click.command()
@@ -21,17 +34,29 @@ from event_sampler.sampler import EventSampler
 @click.option(
     '--auction-address',
     required=True,
-    help='Address of the auction contract'
+    multiple=True,
+    help='Address of an auction contract; repeat the option to sample several auctions'
 )
 @click.option(
     '--chain-name',
     default='kovan',
     help='Name of the chain'
 )
+@click.option(
+    '--state-dir',
+    default='/tmp/event_sampler',
+    help='Directory of the per auction state files'
+)
 @click.option(
     '--state-file',
-    default='/tmp/event_sampler.json',
-    help='State file path'
+    default=None,
+    help='Deprecated: state file of a single auction sampled by older versions; '
+         'imported into --state-dir on first use'
+)
+@click.option(
+    '--confirmations',
+    default=12,
+    help='Blocks after which a block is considered final (reorg rollback window)'
 )
 @click.option(
     '--host',
@@ -43,23 +68,145 @@ from event_sampler.sampler import EventSampler
     default=5000,
     help='Port of the REST server'
 )
-def main(sample_period, auction_address, chain_name, state_file, host, port):
+@click.option(
+    '--workers',
+    default=0,
+    help='Number of pre-forked REST worker processes reading the state shared by this '
+         'process; 0 serves from this process'
+)
+@click.option(
+    '--rpc-pool-size',
+    default=10,
+    help='Number of keep-alive connections to the node'
+)
+@click.option(
+    '--rpc-retries',
+    default=3,
+    help='Retries of a JSON-RPC request after a transient error'
+)
+@click.option(
+    '--rpc-cache',
+    default=None,
+    help='File caching finalized chain data between runs, default: '
+         '<state-dir>/chain-cache.sqlite; "" disables it'
+)
+def main(sample_period, auction_address, chain_name, state_dir, state_file, confirmations,
+         host, port, workers, rpc_pool_size, rpc_retries, rpc_cache):
     from gevent.pywsgi import WSGIServer
-    app = Flask(__name__)
-    api = Api(app)
+    check_state_dir(state_dir)
+    if state_file is not None:
+        import_state_file(state_file, state_dir, auction_address)
+    if workers > 0:
+        # fork before connecting to the chain: workers only read the shared state files
+        listener = gevent.socket.socket()
+        listener.setsockopt(gevent.socket.SOL_SOCKET, gevent.socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+        listener.listen(128)
+        for _ in range(workers):
+            if os.fork() == 0:
+                auctions = shared_auctions(state_dir, auction_address)
+                # ingestion metrics are published by the ingester with the state
+                shared = next(iter(auctions.values()))['sampler']
+                app = make_app(auctions, lambda: shared.metrics)
+                WSGIServer(listener, app).serve_forever()
+                return
+        listener.close()
     project = Project()
     with project.get_chain(chain_name) as chain:
+        if rpc_cache is None:
+            rpc_cache = os.path.join(state_dir, 'chain-cache.sqlite')
+        install_transport(chain.web3, pool_size=rpc_pool_size, retries=rpc_retries,
+                          chain_cache=rpc_cache, confirmations=confirmations)
+        instrument_web3(chain.web3)
         Auction = chain.provider.get_contract_factory('DutchAuction')
-        auction_contract = Auction(address=auction_address)
-        sampler = EventSampler(auction_address, chain, state_file_path=state_file)
-        api.add_resource(AuctionStatus, "/status",
-                         resource_class_kwargs={'auction_contract': auction_contract,
-                                                'sampler': sampler})
-        rest_server = WSGIServer((host, port), app)
+        # all the auctions share one log filter, backfill and timestamp resolver
+        feed = LogFeed(chain.web3)
+        auctions = {}
+        for address in auction_address:
+            auction_contract = Auction(address=address)
+            sampler = EventSampler(address, chain,
+                                   state_file_path=auction_state_file(state_dir, address),
+                                   confirmations=confirmations, feed=feed)
+            poller = ChainPoller(auction_contract, float(sample_period))
+            poller.start()
+            auctions[address.lower()] = {
+                'contract': auction_contract,
+                'sampler': sampler,
+                'poller': poller,
+                'cache': StatusCache(poller, sampler)
+            }
+        feed.start()
+        if workers > 0:
+            publisher = StatePublisher(auctions, state_dir)
+            publisher.start()
+            publisher.ev_publish.join()
+            return
+        for auction in auctions.values():
+            # after the backfill, so that the first diff only holds new bids
+            auction['stream'] = StatusStream(auction['poller'], auction['sampler'])
+        rest_server = WSGIServer((host, port), make_app(auctions))
         server_greenlet = gevent.spawn(rest_server.serve_forever)
         server_greenlet.join()
 
 
+def check_state_dir(state_dir):
+    """Create the state directory, or make sure no other user can change its files.
+
+    REST workers and later runs trust the files in it, and the default lives
+    under the world-writable /tmp.
+    """
+    os.makedirs(state_dir, mode=0o700, exist_ok=True)
+    info = os.stat(state_dir)
+    if info.st_uid != os.getuid():
+        raise click.BadParameter('%s is owned by another user' % state_dir,
+                                 param_hint='--state-dir')
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise click.BadParameter('%s is writable by other users' % state_dir,
+                                 param_hint='--state-dir')
+
+
+def auction_state_file(state_dir, address):
+    return os.path.join(state_dir, '%s.state' % address.lower())
+
+
+def import_state_file(state_file, state_dir, auction_address):
+    """Copy the `--state-file` of older versions into the state directory.
+
+    The state file (and its journal, if any) becomes that of the only
+    auction, unless it already has one in `state_dir`. The sampler reads
+    the JSON and binary formats of older versions as they are.
+    """
+    log.warning('--state-file is deprecated, use --state-dir')
+    if len(auction_address) != 1:
+        raise click.BadParameter('only works with a single --auction-address',
+                                 param_hint='--state-file')
+    target = auction_state_file(state_dir, auction_address[0])
+    if os.path.exists(target) or not os.path.isfile(state_file):
+        return
+    log.info('importing %s as %s' % (state_file, target))
+    if os.path.isfile(state_file + '.journal'):
+        shutil.copyfile(state_file + '.journal', target + '.journal')
+    shutil.copyfile(state_file, target)
+
+
+def make_app(auctions, ingester_metrics=None):
+    app = Flask(__name__)
+    instrument_app(app)
+    api = Api(app)
+    api.add_resource(Metrics, "/metrics",
+                     resource_class_kwargs={'auctions': auctions,
+                                            'ingester_metrics': ingester_metrics})
+    api.add_resource(AuctionStatus, "/status", "/auction/<string:address>/status",
+                     resource_class_kwargs={'auctions': auctions})
+    api.add_resource(AuctionEvents, "/events", "/auction/<string:address>/events",
+                     resource_class_kwargs={'auctions': auctions})
+    api.add_resource(AuctionExport, "/export", "/auction/<string:address>/export",
+                     resource_class_kwargs={'auctions': auctions})
+    api.add_resource(AuctionStream, "/stream", "/auction/<string:address>/stream",
+                     resource_class_kwargs={'auctions': auctions})
+    return app
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     logging.getLogger("urllib3").setLevel(logging.WARNING)
@@ -0,0 +1,176 @@
+"""
+Process metrics of the event sampler, exposed in the Prometheus text format.
+
+Metrics are module level objects updated where the work happens, e.g.
+`RPC_LATENCY.observe(duration, method='eth_getLogs')`. Labels are passed as
+keyword arguments; each distinct set of label values is one time series.
+"""
+from contextlib import contextmanager
+import copy
+import time
+
+from deploy.transport import RPCTransport
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, registry=None):
+        self.name = name
+        self.help = help
+        # sorted ((label, value), ...) -> value
+        self.values = {}
+        (registry if registry is not None else REGISTRY).append(self)
+
+    def key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name, key, value
+
+    def expose(self, values):
+        lines = ['# HELP %s %s' % (self.name, self.help),
+                 '# TYPE %s %s' % (self.name, self.type)]
+        for name, key, value in self.samples(values):
+            lines.append('%s%s %s' % (name, format_labels(key), format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, help, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        if key not in self.values:
+            # per bucket counts, sum, count
+            self.values[key] = [[0] * len(self.buckets), 0, 0]
+        counts, total, count = self.values[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.values[key] = [counts, total + value, count + 1]
+
+    @contextmanager
+    def time(self, **labels):
+        t_start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - t_start, **labels)
+
+    def samples(self, values):
+        for key, (counts, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield self.name + '_bucket', key + (('le', format_value(bound)),), bucket_count
+            yield self.name + '_bucket', key + (('le', '+Inf'),), count
+            yield self.name + '_sum', key, total
+            yield self.name + '_count', key, count
+
+
+def format_labels(key):
+    if len(key) == 0:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (label, str(value).replace('\\', '\\\\')
+                                          .replace('"', '\\"'))
+                             for label, value in key)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def collect(registry=None):
+    """Copy of the values of all metrics by name, e.g. to expose them in another process."""
+    registry = registry if registry is not None else REGISTRY
+    return {metric.name: copy.deepcopy(metric.values) for metric in registry}
+
+
+def expose(registry=None, collected=None):
+    """Text exposition of the metrics that have samples.
+
+    `collected` is the result of `collect()` in another process; its series
+    are exposed along with the local ones, which win for equal labels.
+    """
+    registry = registry if registry is not None else REGISTRY
+    lines = []
+    for metric in registry:
+        values = dict((collected or {}).get(metric.name, {}))
+        values.update(metric.values)
+        if len(values) > 0:
+            lines.append(metric.expose(values) + '\n')
+    return ''.join(lines)
+
+
+REGISTRY = []
+
+RPC_CALLS = Counter('event_sampler_rpc_calls_total',
+                    'JSON-RPC calls to the node by method and outcome')
+RPC_LATENCY = Histogram('event_sampler_rpc_duration_seconds',
+                        'JSON-RPC call latency by method')
+EVENTS = Counter('event_sampler_events_total',
+                 'Auction events processed by auction and event type')
+CACHE_LOOKUPS = Counter('event_sampler_cache_lookups_total',
+                        'Cache lookups by cache and result (hit or miss)')
+STATE_SAVE = Histogram('event_sampler_state_save_duration_seconds',
+                       'Duration of state journal flushes and snapshot compactions')
+REQUEST_LATENCY = Histogram('event_sampler_http_request_duration_seconds',
+                            'REST request latency by route, method and status')
+HEAD_BLOCK = Gauge('event_sampler_head_block',
+                   'Latest block seen by the chain poller, by auction')
+SYNCED_BLOCK = Gauge('event_sampler_synced_block',
+                     'Last block whose logs have all been processed, by auction')
+LAG_BLOCKS = Gauge('event_sampler_lag_blocks',
+                   'Head block minus synced block, by auction')
+LAG_SECONDS = Gauge('event_sampler_lag_seconds',
+                    'Head block timestamp minus that of the synced block, by auction')
+
+
+def instrument_web3(web3):
+    """Count and time every request made through `web3`.
+
+    Requests through an RPCTransport are reported by its listeners, which also
+    see retries and batches; other providers are timed around the request manager.
+    """
+    if isinstance(web3.currentProvider, RPCTransport):
+        def observe(method, duration, outcome):
+            RPC_CALLS.inc(method=method, outcome=outcome)
+            if outcome not in ('batched', 'cached'):
+                RPC_LATENCY.observe(duration, method=method)
+        web3.currentProvider.listeners.append(observe)
+        return
+    request_blocking = web3._requestManager.request_blocking
+
+    def timed_request_blocking(method, params):
+        outcome = 'error'
+        try:
+            with RPC_LATENCY.time(method=method):
+                result = request_blocking(method, params)
+            outcome = 'ok'
+            return result
+        finally:
+            RPC_CALLS.inc(method=method, outcome=outcome)
+    web3._requestManager.request_blocking = timed_request_blocking
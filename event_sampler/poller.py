@@ -0,0 +1,87 @@
+from deploy.price import AuctionPrice, AUCTION_STARTED
+from eth_abi import decode_abi
+import gevent
+import gevent.event
+import logging
+from web3.utils.abi import get_abi_output_types, normalize_return_type
+from web3.utils.empty import empty
+
+log = logging.getLogger(__name__)
+
+
+def call_at(contract, function_name, block_number):
+    """`contract.call().<function_name>()` on the state of block `block_number`.
+
+    web3's `call()` always reads the latest state; this is the same call for
+    a function without arguments, pinned to a block.
+    """
+    transaction = {'to': contract.address}
+    if contract.web3.eth.defaultAccount is not empty:
+        transaction['from'] = contract.web3.eth.defaultAccount
+    transaction = contract._prepare_transaction(fn_name=function_name, transaction=transaction)
+    data = contract.web3.eth.call(transaction, block_number)
+    output_types = get_abi_output_types(contract._find_matching_fn_abi(function_name))
+    values = [normalize_return_type(output_type, value)
+              for output_type, value in zip(output_types, decode_abi(output_types, data))]
+    return values[0] if len(values) == 1 else values
+
+
+class ChainPoller:
+    """Keeps a snapshot of the auction's chain reads fresh, off the request path.
+
+    Every `sample_period` seconds the latest block is checked; on a new block
+    the contract views and the wallet balance are read at that block number
+    and published by replacing `snapshot` as a whole, so readers always see
+    the values of a single block.
+    """
+
+    def __init__(self, auction_contract, sample_period=5):
+        self.contract = auction_contract
+        self.web3 = auction_contract.web3
+        self.sample_period = sample_period
+        self.run = gevent.event.Event()
+        self.wallet_address = self.contract.call().wallet_address()
+        # price parameters are fixed once the auction starts; from then on
+        # the price is computed locally instead of calling price()
+        self.price_model = None
+        self.snapshot = None
+        # called with every new snapshot
+        self.listeners = []
+
+    def stop(self):
+        self.run.set()
+
+    def start(self):
+        self.refresh()
+        self.ev_poll = gevent.spawn(self.callback)
+
+    def callback(self):
+        while self.run.is_set() is False:
+            gevent.sleep(self.sample_period)
+            try:
+                self.refresh()
+            except Exception as e:
+                log.warning('chain poll failed: %s' % str(e))
+
+    def refresh(self):
+        block = self.web3.eth.getBlock('latest')
+        if self.snapshot is not None and self.snapshot['block']['number'] == block['number']:
+            return
+        stage = call_at(self.contract, 'stage', block['number'])
+        if stage >= AUCTION_STARTED and self.price_model is None:
+            self.price_model = AuctionPrice.from_contract(self.contract)
+        if self.price_model is not None:
+            price = self.price_model.price(block['timestamp'], stage)
+        else:
+            price = call_at(self.contract, 'price', block['number'])
+        snapshot = {
+            'block': block,
+            'stage': stage,
+            'price': price,
+            'wallet_balance': self.web3.eth.getBalance(self.wallet_address, block['number']),
+            'timestamp': block['timestamp']
+        }
+        self.snapshot = snapshot
+        log.debug('chain snapshot updated to block %d' % block['number'])
+        for listener in self.listeners:
+            listener(snapshot)
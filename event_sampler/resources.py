@@ -1,10 +1,22 @@
-from flask_restful import Resource, reqparse
+from flask import Response, g, request
+from flask_restful import Resource, abort, reqparse
+from bisect import bisect_right
+from itertools import accumulate
+from event_sampler.export import (BID_COLUMNS, CLAIM_COLUMNS, FORMATS, bid_rows,
+                                  claim_rows, serialize)
+from event_sampler.metrics import (CACHE_LOOKUPS, HEAD_BLOCK, LAG_BLOCKS, LAG_SECONDS,
+                                   REQUEST_LATENCY, SYNCED_BLOCK, expose)
 import logging
-import numpy
 import ethereum
+import json
+import time
 
 log = logging.getLogger(__name__)
 
+# range of the bins argument of /status; every value is a separate cache entry
+MIN_BINS = 1
+MAX_BINS = 200
+
 ## {"event": "BidSubmission", "blockNumber": 3607, "blockHash": "0xd0fb1e61d57841984ae470215fcc46bc3f65475d3a25cc1a89726cfeff76644c", "transactionHash": "0x188192b39f695f9b05b1caefc8fdf317bc4fd55f20d8134b13f3f0ce7650e8f5", "transactionIndex": 0, "args": {"_sender": "0x90c647f94ca29a840a6736117d45f768ccf4b69a", "_missing_funds": 80, "_amount": 13}, "logIndex": 0, "address": "0xd1d8649b19ec31680c5ca285cf07b8c0aef0e564"} # noqa
 
 
@@ -28,74 +40,248 @@ log = logging.getLogger(__name__)
 # }
 
 
-class AuctionStatus(Resource):
-    def __init__(self, auction_contract, sampler):
-        super(AuctionStatus, self).__init__()
-        self.contract = auction_contract
+class StatusCache:
+    """Serialized status responses of the latest block, keyed by (block, synced block, bins).
+
+    The latest block comes from the poller's snapshot and the sampled state
+    from the sampler's view. A response is computed once per key, and the
+    entries of older blocks are dropped when a new block shows up. The
+    response dict is never changed in place but replaced, so readers need no
+    lock; concurrent misses at worst compute the same response twice.
+    """
+
+    def __init__(self, poller, sampler):
+        self.poller = poller
         self.sampler = sampler
-        self.wallet_address = self.contract.call().wallet_address()
+        self.responses = {}
+
+    def get(self, bins, compute):
+        """Return (etag, body); `compute(snapshot, view)` builds the response on a miss."""
+        snapshot = self.poller.snapshot
+        view = self.sampler.view
+        block = snapshot['block']
+        key = (block['number'], view.block, bins)
+        responses = self.responses
+        CACHE_LOOKUPS.inc(cache='status', result='hit' if key in responses else 'miss')
+        if key not in responses:
+            responses = {k: v for k, v in responses.items() if k[:2] == key[:2]}
+            body = json.dumps(compute(snapshot, view)).encode()
+            responses[key] = ('%s-%d-%d' % (block['hash'], view.block, bins), body)
+            self.responses = responses
+        return responses[key]
+
+
+class AuctionResource(Resource):
+    """Base of the resources of one of the sampled auctions.
+
+    `auctions` maps lowercase contract addresses to dicts of the auction's
+    'contract', 'sampler', 'poller', 'cache' and 'stream'. Routes without an address are
+    served only when there is a single auction.
+    """
+
+    def __init__(self, auctions):
+        super(AuctionResource, self).__init__()
+        self.auctions = auctions
+
+    def select(self, address):
+        if address is None:
+            if len(self.auctions) != 1:
+                abort(404, message='auction address required')
+            return next(iter(self.auctions.values()))
+        auction = self.auctions.get(address.lower())
+        if auction is None:
+            abort(404, message='unknown auction %s' % address)
+        return auction
+
 
-    def get_histogram(self):
-        if len(self.sampler.events.items()) == 0:
+class AuctionStatus(AuctionResource):
+
+    def get_histogram(self, view, num_bins):
+        if view.histogram.first_timestamp is None:
             return None
-        parser = reqparse.RequestParser()
-        parser.add_argument('bins', help='bins in the histogram', default=20, type=int)
-        args = parser.parse_args()
-        block_to_events = {}
-        for block, events in self.sampler.events.items():
-            block_to_events[block] = sum((event['args']['_amount'] for event in events))
-        min_block = min(block_to_events.keys())
-        max_block = max(block_to_events.keys())
-        num_bins = args['bins']
-        num_bins = max(min(max_block - min_block, num_bins), 1)
-        ar, ar_bins = numpy.histogram(list(block_to_events.keys()),
-                                      bins=num_bins,
-                                      weights=[numpy.float64(x) for x in block_to_events.values()])
-        bin_timestamps = []
-        for block_id in ar_bins.tolist():
-            block_id = int(block_id)
-            timestamp = self.sampler.state.block_to_timestamp.get(block_id, None)
-            if timestamp is None:
-                timestamp = self.sampler.chain.web3.eth.getBlock(block_id)['timestamp']
-                self.sampler.state.block_to_timestamp[block_id] = timestamp
-            bin_timestamps.append(timestamp)
-#        bin_timestamps = [self.sampler.block_to_timestamp[int(block_id)]
-#                          for block_id in ar_bins.tolist()]
+        bin_timestamps, ar = view.histogram.histogram(num_bins)
         return {'timestamped_bins': bin_timestamps,
                 'block_bins': bin_timestamps,
-                'bin_sum': ar.tolist(),
-                'bin_cumulative_sum': numpy.cumsum(ar).tolist()}
+                'bin_sum': ar,
+                'bin_cumulative_sum': list(accumulate(ar))}
 
-    def get_status(self):
-        web3 = self.sampler.chain.web3
+    def get_status(self, snapshot, view):
         ret = {}
-        ret['auction_stage'] = self.contract.call().stage()
-        ret['price'] = self.contract.call().price()
-        block_to_sum = {}
-        for block, events in self.sampler.events.items():
-            block_to_sum[block] = sum((event['args']['_amount'] for event in events))
-        total = sum((v for v in block_to_sum.values()))
-        wallet_balance = self.contract.web3.eth.getBalance(self.wallet_address)
+        ret['auction_stage'] = snapshot['stage']
+        ret['price'] = snapshot['price']
+        total = view.total
+        wallet_balance = snapshot['wallet_balance']
         if total != wallet_balance:
             log.warning('log balance and events total sum do not match (%d != %d)'
                         % (total, wallet_balance))
 
         ret['raised_eth'] = wallet_balance
-        ret['final_price'] = self.sampler.final_price
-        ret['claimed_tokens'] = self.sampler.total_claimed
-        ret['timestamp'] = web3.eth.getBlock("latest")['timestamp']
-        ret['start_time'] = self.sampler.auction_start_time
-        ret['end_time'] = self.sampler.auction_end_time
-        ret['price_start'] = self.sampler.price_start
-        ret['price_constant'] = self.sampler.price_constant
-        ret['price_exponent'] = self.sampler.price_exponent
+        auction = view.auction
+        ret['final_price'] = auction.get('final_price')
+        ret['claimed_tokens'] = view.claimed
+        ret['timestamp'] = snapshot['timestamp']
+        ret['start_time'] = auction.get('auction_start_time')
+        ret['end_time'] = auction.get('auction_end_time')
+        ret['price_start'] = auction.get('price_start')
+        ret['price_constant'] = auction.get('price_constant')
+        ret['price_exponent'] = auction.get('price_exponent')
         if ret['auction_stage'] >= 2:
             checksummed_addr = ethereum.utils.add_cool_checksum(self.contract.address)
             ret['auction_contract_address'] = checksummed_addr
         return ret
 
-    def get(self):
+    def get_response(self, snapshot, view, bins):
         ret = {}
-        ret['histogram'] = self.get_histogram()
-        ret['status'] = self.get_status()
+        ret['histogram'] = self.get_histogram(view, bins)
+        ret['status'] = self.get_status(snapshot, view)
         return ret
+
+    def get(self, address=None):
+        auction = self.select(address)
+        self.contract = auction['contract']
+        self.cache = auction['cache']
+        parser = reqparse.RequestParser()
+        parser.add_argument('bins', help='bins in the histogram', default=20, type=int,
+                            location='args')
+        args = parser.parse_args()
+        bins = args['bins']
+        if not MIN_BINS <= bins <= MAX_BINS:
+            abort(400, message='bins must be between %d and %d' % (MIN_BINS, MAX_BINS))
+        compute = lambda snapshot, view: self.get_response(snapshot, view, bins)
+        etag, body = self.cache.get(bins, compute)
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+
+class AuctionStream(AuctionResource):
+    """Server-Sent Events stream of the per-block status diffs of an auction."""
+
+    def get(self, address=None):
+        stream = self.select(address)['stream']
+        last_block = request.headers.get('Last-Event-ID', type=int)
+        response = Response(stream.subscribe(last_block), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class AuctionEvents(AuctionResource):
+    """Bid and claim records of the blocks after `since_block`.
+
+    Bids are [block, transaction index, log index, sender, amount, missing
+    funds], claims [block, transaction index, log index, recipient, amount].
+    Only blocks up to `synced_block` are returned; records of the blocks after
+    `final_block` can still be replaced by a chain reorganization, so clients
+    ask for `since_block=final_block` next and drop what they have past it.
+    """
+
+    def get(self, address=None):
+        sampler = self.select(address)['sampler']
+        view = sampler.view
+        parser = reqparse.RequestParser()
+        parser.add_argument('since_block', help='last block already fetched', default=-1,
+                            type=int, location='args')
+        since_block = parser.parse_args()['since_block']
+        bids = sampler.bids
+        claims = sampler.state.claims
+        bid_count = min(view.bid_count, len(bids))
+        claim_count = min(view.claim_count, len(claims))
+        bid_rows = range(bisect_right(bids.block, since_block, 0, bid_count),
+                         bisect_right(bids.block, view.block, 0, bid_count))
+        claim_rows = range(bisect_right(claims.block, since_block, 0, claim_count),
+                           bisect_right(claims.block, view.block, 0, claim_count))
+        return {
+            'since_block': since_block,
+            'synced_block': view.block,
+            'final_block': view.final_block,
+            'bids': [[bids.block[i], bids.transaction_index[i], bids.log_index[i],
+                      bids.senders[bids.sender[i]], bids.amount[i], bids.missing_funds[i]]
+                     for i in bid_rows],
+            'claims': [[claims.block[i], claims.transaction_index[i], claims.log_index[i],
+                        claims.recipients[claims.recipient[i]], claims.amount[i]]
+                       for i in claim_rows]
+        }
+
+
+class AuctionExport(AuctionResource):
+    """Streams all the bids or claims of an auction as NDJSON or CSV.
+
+    Rows are serialized by a generator as the response is sent, so memory use
+    does not depend on the number of records, and nothing is read from the chain.
+    """
+
+    def get(self, address=None):
+        sampler = self.select(address)['sampler']
+        view = sampler.view
+        parser = reqparse.RequestParser()
+        parser.add_argument('kind', default='bids', choices=('bids', 'claims'), location='args')
+        parser.add_argument('format', default='ndjson', choices=FORMATS, location='args')
+        parser.add_argument('from_block', default=0, type=int, location='args')
+        parser.add_argument('to_block', default=view.block, type=int, location='args')
+        parser.add_argument('address', help='only records of this sender or recipient',
+                            location='args')
+        args = parser.parse_args()
+        to_block = min(args['to_block'], view.block)
+        filter_address = args['address'].lower() if args['address'] else None
+        if args['kind'] == 'bids':
+            bids = sampler.bids
+            rows = bid_rows(bids, min(view.bid_count, len(bids)), args['from_block'], to_block,
+                            filter_address)
+            columns = BID_COLUMNS
+        else:
+            claims = sampler.state.claims
+            rows = claim_rows(claims, min(view.claim_count, len(claims)), args['from_block'],
+                              to_block, filter_address)
+            columns = CLAIM_COLUMNS
+        if args['format'] == 'csv':
+            mimetype = 'text/csv'
+        else:
+            mimetype = 'application/x-ndjson'
+        response = Response(serialize(rows, columns, args['format']), mimetype=mimetype)
+        response.headers['Content-Disposition'] = ('attachment; filename=%s.%s'
+                                                   % (args['kind'], args['format']))
+        return response
+
+
+class Metrics(Resource):
+    """Metrics of the process in the Prometheus text format.
+
+    `ingester_metrics`, if given, returns the collected metrics of the
+    ingester process, exposed along with the local ones by REST workers
+    that do not ingest themselves.
+    """
+
+    def __init__(self, auctions, ingester_metrics=None):
+        super(Metrics, self).__init__()
+        self.auctions = auctions
+        self.ingester_metrics = ingester_metrics
+
+    def get(self):
+        for address, auction in self.auctions.items():
+            snapshot = auction['poller'].snapshot
+            view = auction['sampler'].view
+            head = snapshot['block']['number']
+            HEAD_BLOCK.set(head, auction=address)
+            SYNCED_BLOCK.set(view.block, auction=address)
+            LAG_BLOCKS.set(max(head - view.block, 0), auction=address)
+            if view.block >= head:
+                LAG_SECONDS.set(0, auction=address)
+            elif view.timestamp is not None:
+                LAG_SECONDS.set(max(snapshot['timestamp'] - view.timestamp, 0), auction=address)
+        collected = self.ingester_metrics() if self.ingester_metrics is not None else None
+        return Response(expose(collected=collected), mimetype='text/plain; version=0.0.4')
+
+
+def instrument_app(app):
+    """Record the latency of every request of `app` by route, method and status."""
+    @app.before_request
+    def start_timer():
+        g.t_start = time.time()
+
+    @app.after_request
+    def observe_latency(response):
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_LATENCY.observe(time.time() - g.t_start, route=route, method=request.method,
+                                status=response.status_code)
+        return response
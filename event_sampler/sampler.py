@@ -1,19 +1,22 @@
-from deploy.utils import watch_logs
-from collections import defaultdict
-from operator import itemgetter
+from event_sampler.feed import LogFeed
+from event_sampler.histogram import TimeHistogram
+from event_sampler.store import BidStore, ClaimStore
+from event_sampler.view import SamplerView
+from event_sampler.metrics import CACHE_LOOKUPS, EVENTS, STATE_SAVE
+from event_sampler.journal import Journal, write_atomic
+from event_sampler.snapshot import BlockTimestamps, encode_snapshot, is_snapshot, read_snapshot
+from deploy.decoder import get_registry
 
 import logging
+import struct
+import sys
 import time
 import json
-import shutil
 import gevent
 import os
 import click
 
 log = logging.getLogger(__name__)
-from web3.utils.filters import construct_event_filter_params
-from web3.utils.events import get_event_data
-from web3.formatters import input_filter_params_formatter, log_array_formatter
 
 
 class StateSave:
@@ -35,42 +38,263 @@ class StateSave:
 
 
 class EventSamplerState:
-    def __init__(self, state_file_path):
+    """Sampler state persisted across restarts.
+
+    `synced_block` is the last block whose logs have all been processed and
+    `last_log` the (blockNumber, logIndex) of the last processed log, so that
+    a restarted sampler only has to fetch logs after the checkpoint.
+
+    `recent` holds what is needed to roll back the blocks that may still be
+    reorganized: for each of them the block hash, the (blockHash,
+    transactionHash, logIndex) keys of the processed logs and the journal
+    records undoing their changes. It is persisted like the rest of the
+    state, so that a restarted sampler can still roll those blocks back.
+
+    The state file is a snapshot. Changes made after it are appended to a
+    journal next to it, flushed by `save()`, and folded into a new snapshot
+    once the journal holds `compact_size` records. Snapshots use the binary
+    format of event_sampler.snapshot; JSON state files of older versions are
+    still read.
+    """
+
+    def __init__(self, state_file_path, compact_size=10000):
         self.state_file_path = state_file_path
-        self.state_file_tmp = state_file_path + ".tmp"
-        self.block_to_timestamp = {}
+        self.journal = Journal(state_file_path + '.journal')
+        self.compact_size = compact_size
+        self.reset()
+        snapshot_seq = 0
         if os.path.isfile(state_file_path):
-            self.block_to_timestamp = self.load()
+            snapshot_seq = self.load()
+        if snapshot_seq is not None:
+            self.replay(snapshot_seq)
+        self.saved_position = (self.synced_block, self.last_log)
+
+    def reset(self):
+        self.block_to_timestamp = BlockTimestamps(self.journal)
+        self.synced_block = -1
+        self.last_log = (-1, -1)
+        self.bids = BidStore()
+        self.claims = ClaimStore()
+        self.total_claimed = 0
+        # auction parameters read from Deployed, AuctionStarted and AuctionEnded
+        self.auction = {}
+        # block -> {'hash', 'logs', 'undo'} of the blocks that may be reorganized
+        self.recent = {}
+
+    def clear(self):
+        """Drop the whole state, snapshot and journal included."""
+        self.journal.pending = []
+        self.reset()
+        self.compact()
+
+    def meta(self):
+        return {
+            'journal_seq': self.journal.seq,
+            'synced_block': self.synced_block,
+            'last_log': self.last_log,
+            'total_claimed': self.total_claimed,
+            'auction': self.auction,
+            'senders': self.bids.senders,
+            'recipients': self.claims.recipients,
+            'recent': {block: {'hash': recent['hash'],
+                               'logs': sorted(list(key) for key in recent['logs']),
+                               'undo': recent['undo']}
+                       for block, recent in self.recent.items()}
+        }
+
+    def from_snapshot(self, path):
+        meta, blocks, timestamps, bids, claims = read_snapshot(path)
+        self.block_to_timestamp = BlockTimestamps(self.journal, blocks, timestamps)
+        self.synced_block = meta['synced_block']
+        self.last_log = tuple(meta['last_log'])
+        self.bids = BidStore.from_records(bids, meta['senders'])
+        self.claims = ClaimStore.from_records(claims, meta.get('recipients', []))
+        self.total_claimed = meta['total_claimed']
+        self.auction = meta['auction']
+        # JSON object keys are strings
+        self.recent = {int(block): {'hash': recent['hash'],
+                                    'logs': set(tuple(key) for key in recent['logs']),
+                                    'undo': recent['undo']}
+                       for block, recent in meta.get('recent', {}).items()}
+        return meta['journal_seq']
+
+    def from_dict(self, state):
+        self.block_to_timestamp = BlockTimestamps.from_dict(self.journal,
+                                                            state.get('block_to_timestamp', {}))
+        self.synced_block = state.get('synced_block', -1)
+        self.last_log = tuple(state.get('last_log', (-1, -1)))
+        if 'bids' in state:
+            self.bids = BidStore.from_dict(state['bids'])
+        self.total_claimed = state.get('total_claimed', 0)
+        self.auction = state.get('auction', {})
+        return state.get('journal_seq', 0)
+
+    def add_bid(self, event):
+        args = event['args']
+        record = [event['blockNumber'], event['transactionIndex'], event['logIndex'],
+                  args['_sender'], args['_amount'], args['_missing_funds']]
+        self.bids.add(*record)
+        self.journal.append(['bid'] + record)
+
+    def pop_bid(self):
+        self.journal.append(['pop_bid'])
+        return self.bids.pop()
+
+    def add_claim(self, event):
+        record = [event['blockNumber'], event['transactionIndex'], event['logIndex'],
+                  event['args']['_recipient'], event['args']['_sent_amount']]
+        self.claims.add(*record)
+        self.total_claimed += record[-1]
+        self.journal.append(['claim'] + record)
+
+    def pop_claim(self):
+        self.journal.append(['pop_claim'])
+        self.total_claimed -= self.claims.amount[-1]
+        self.claims.pop()
+
+    def update_auction(self, values):
+        self.auction.update(values)
+        self.journal.append(['auction', values])
+
+    def add_recent_log(self, block, key):
+        """Record the log `key` of the recent block `block`; its hash is that of the first log."""
+        self.recent.setdefault(block, {'hash': key[0], 'logs': set(), 'undo': []})
+        self.recent[block]['logs'].add(tuple(key))
+        self.journal.append(['recent_log', block] + list(key))
+
+    def add_undo(self, block, record):
+        self.recent[block]['undo'].append(record)
+        self.journal.append(['undo', block, record])
+
+    def pop_recent(self, block):
+        self.journal.append(['pop_recent', block])
+        return self.recent.pop(block)
+
+    def prune_recent(self, confirmed_block):
+        """Forget the blocks up to `confirmed_block`, which can no longer be reorganized."""
+        if any(block <= confirmed_block for block in self.recent):
+            self.journal.append(['prune_recent', confirmed_block])
+            self.apply_prune_recent(confirmed_block)
+
+    def apply_prune_recent(self, confirmed_block):
+        for block in [b for b in self.recent if b <= confirmed_block]:
+            del self.recent[block]
+
+    def apply(self, record):
+        """Redo a journal record; the inverse of the methods above."""
+        kind, args = record[0], record[1:]
+        if kind == 'timestamp':
+            self.block_to_timestamp.set(*args)
+        elif kind == 'bid':
+            self.bids.add(*args)
+        elif kind == 'pop_bid':
+            self.bids.pop()
+        elif kind == 'claim':
+            self.claims.add(*args)
+            self.total_claimed += args[-1]
+        elif kind == 'pop_claim':
+            self.total_claimed -= self.claims.amount[-1]
+            self.claims.pop()
+        elif kind == 'total_claimed':
+            # journals written before claims were recorded
+            self.total_claimed = args[0]
+        elif kind == 'auction':
+            self.auction.update(args[0])
+        elif kind == 'position':
+            self.synced_block, self.last_log = args[0], tuple(args[1])
+        elif kind == 'recent_log':
+            self.recent.setdefault(args[0], {'hash': args[1], 'logs': set(), 'undo': []})
+            self.recent[args[0]]['logs'].add(tuple(args[1:]))
+        elif kind == 'undo':
+            self.recent[args[0]]['undo'].append(args[1])
+        elif kind == 'pop_recent':
+            self.recent.pop(args[0], None)
+        elif kind == 'prune_recent':
+            self.apply_prune_recent(args[0])
+        else:
+            raise ValueError('unknown journal record %s' % kind)
+
+    def replay(self, snapshot_seq):
+        self.journal.seq = snapshot_seq
+        for record in self.journal.read(snapshot_seq):
+            self.apply(record)
 
     def save(self):
-        with open(self.state_file_tmp, 'w') as f:
-            json.dump(self.block_to_timestamp, f)
-            f.flush()
-        shutil.copy2(self.state_file_tmp, self.state_file_path)
+        """Flush the changes since the last save to the journal; no-op if there are none."""
+        position = (self.synced_block, self.last_log)
+        if position != self.saved_position:
+            self.journal.append(['position', self.synced_block, list(self.last_log)])
+            self.saved_position = position
+        if len(self.journal.pending) > 0:
+            with STATE_SAVE.time(operation='flush'):
+                self.journal.flush()
+        if self.journal.size >= self.compact_size:
+            with STATE_SAVE.time(operation='compact'):
+                self.compact()
+
+    def compact(self):
+        t_start = time.time()
+        blocks, timestamps = self.block_to_timestamp.merge()
+        write_atomic(self.state_file_path,
+                     encode_snapshot(self.meta(), blocks, timestamps, self.bids.to_records(),
+                                     self.claims.to_records()))
+        self.journal.truncate()
+        log.info('state snapshot took %f seconds' % (time.time() - t_start))
 
     def load(self):
-        for state_file in (self.state_file_path, self.state_file_tmp):
-            try:
-                return self.load_state(state_file)
-            except ValueError:
-                log.warning("Can't load state from: %s" % (state_file))
-        return {}
+        """Load the state file, returning the number of the last journal record it includes.
+
+        The journal only holds the changes made after the state file, so a
+        state file that can't be read is set aside as `<state file>.corrupt`
+        and the journal truncated: the state starts over empty, to be synced
+        again from block 0, and None is returned.
+        """
+        try:
+            if is_snapshot(self.state_file_path):
+                return self.from_snapshot(self.state_file_path)
+            return self.from_dict(self.load_state(self.state_file_path))
+        except (ValueError, KeyError, struct.error) as e:
+            log.error("Can't load state from %s (%s), syncing again from block 0"
+                      % (self.state_file_path, str(e)))
+        os.replace(self.state_file_path, self.state_file_path + '.corrupt')
+        self.journal.truncate()
+        self.reset()
+        return None
 
     def load_state(self, state_file):
         with open(state_file, 'r') as f:
             state = json.loads(f.read())
-            return {int(k): v for k, v in state.items()}
+        if 'version' not in state:
+            # old state files hold only the block -> timestamp mapping
+            return {'block_to_timestamp': {int(k): v for k, v in state.items()}}
+        # JSON snapshots written before the binary format, version 2 without a journal
+        if state['version'] not in (2, 3):
+            raise ValueError('unsupported state version %s' % state['version'])
+        state['block_to_timestamp'] = {int(k): v for k, v in state['block_to_timestamp'].items()}
+        return state
 
 
 class EventSampler:
+    """Sampled state of one auction contract.
+
+    Logs come from a LogFeed. Without a `feed` the sampler makes one of its
+    own and starts it; samplers sharing a feed are started by `feed.start()`.
+    """
+
     def __init__(self, auction_contract_addr, chain,
-                 state_file_path: str=click.get_app_dir('event_sampler')):
+                 state_file_path: str=click.get_app_dir('event_sampler'),
+                 confirmations: int=12, feed=None):
         self.contract_addr = auction_contract_addr
         self.chain = chain
         Auction = self.chain.provider.get_contract_factory('DutchAuction')
         self.auction_contract = Auction(address=auction_contract_addr)
         self.auction_contract_addr = auction_contract_addr
         self.state = EventSamplerState(state_file_path)
+        own_feed = feed is None
+        if own_feed:
+            feed = LogFeed(self.chain.web3)
+        self.feed = feed
+        self.timestamps = feed.timestamps
         callbacks = {
             'BidSubmission': self.on_bid_submission,
             'AuctionEnded': self.on_auction_end,
@@ -78,92 +302,296 @@ class EventSampler:
             'AuctionStarted': self.on_auction_start,
             'ClaimedTokens': self.on_claimed_tokens
         }
-        self.events = defaultdict(list)
-        self.auction_start_block = None
-        self.total_claimed = 0
-        self.final_price = None
-        self.auction_start_time = None
-        self.auction_end_time = None
-        self.price_start = None
-        self.price_constant = None
-        self.price_exponent = None
+        self.bids = self.state.bids
+        # amount of all the bids, in wei
+        self.total = sum(self.bids.amount)
+        self.histogram = TimeHistogram()
+        # block -> amounts of the bids waiting for the block's timestamp
+        self.late_bids = {}
+        # seconds between attempts to fetch the timestamp of a block with late bids
+        self.retry_period = 1
+        self.resolve_timestamps(self.bids.block)
+        for block, amount in zip(self.bids.block, self.bids.amount):
+            self.add_to_histogram(block, amount)
+
+        # Blocks younger than `confirmations` may still be reorganized; the state
+        # keeps what is needed to roll them back in `state.recent`.
+        self.confirmations = confirmations
+        self.head = self.state.synced_block
+        # (block, timestamp) of the last block the feed advanced the sampler to
+        self.synced_timestamp = (None, None)
+
+        # topic0 -> callback
+        self.decoders = get_registry(self.auction_contract.abi)
+        self.handlers = {self.decoders[event_name].topic: callback
+                         for event_name, callback in callbacks.items()}
+        # whether the state changed since the view was built
+        self.changed = False
+        self.publish()
 
-        for k, v in callbacks.items():
-            self.sync_events(k, v)
-            watch_logs(self.auction_contract, k, v)
+        feed.add(self)
+        if own_feed:
+            feed.start()
 
+    def publish(self):
+        """Replace `view` with the current state; readers use only the view."""
+        self.view = SamplerView.from_sampler(self)
+        self.changed = False
+
+    def start(self):
         # start state save event - after the events are synced
         self.save_event = StateSave(self.state)
         self.save_event.start()
 
-    def sync_events(self, event_name: str, callback):
+    def apply_events(self, events, to_block, to_timestamp=None):
+        """Process the decoded logs of all the blocks up to `to_block`, mined at `to_timestamp`."""
         t_start = time.time()
-        events = self.get_logs(event_name)
-        log.info('get logs of %s took %f seconds (%d events)'
-                 % (event_name, time.time() - t_start, len(events)))
-        if events is None:
-            return
+        self.resolve_timestamps(event['blockNumber'] for event in events)
+        log.info('block timestamps took %f seconds' % (time.time() - t_start))
         t_start = time.time()
+        self.head = max(self.head, to_block)
         for event in events:
-            callback(event)
-        log.info('callbacks of %s took %f seconds (%d events)'
-                 % (event_name, time.time() - t_start, len(events)))
+            self.dispatch(event)
+        if to_block >= self.state.synced_block:
+            self.state.synced_block = to_block
+            self.synced_timestamp = (to_block, to_timestamp)
+        self.prune()
+        self.publish()
+        log.info('callbacks took %f seconds (%d events)'
+                 % (time.time() - t_start, len(events)))
+
+    def resolve_timestamps(self, block_numbers):
+        """Timestamps of `block_numbers`, fetched through the feed if not in the state."""
+        block_numbers = set(block_numbers)
+        missing = [block for block in block_numbers if block not in self.state.block_to_timestamp]
+        CACHE_LOOKUPS.inc(len(block_numbers) - len(missing), cache='block_to_timestamp',
+                          result='hit')
+        CACHE_LOOKUPS.inc(len(missing), cache='block_to_timestamp', result='miss')
+        if len(missing) > 0:
+            self.store_timestamps(self.timestamps.resolve(missing))
+        return {block: self.state.block_to_timestamp.get(block) for block in block_numbers}
+
+    def request_timestamps(self, block_numbers, callback):
+        """`resolve_timestamps` in the background, calling `callback` with the result."""
+        def store(timestamps):
+            self.store_timestamps(timestamps)
+            callback(timestamps)
+        return self.timestamps.request(block_numbers, store)
+
+    def store_timestamps(self, timestamps):
+        for block, timestamp in timestamps.items():
+            if timestamp is not None and block not in self.state.block_to_timestamp:
+                self.state.block_to_timestamp[block] = timestamp
+
+    def on_log(self, event):
+        """Process a log reported by the feed's filter.
+
+        Logs of orphaned blocks don't get here: the feed rolls the sampler
+        back with `rollback()` and processes the new chain's logs again.
+        """
+        event = dict(event)
+        block = event['blockNumber']
+        if block <= self.state.synced_block:
+            return
+        self.head = max(self.head, block)
+        self.dispatch(self.decode(event))
+        # the filter reports logs in order, so all earlier blocks are complete
+        self.state.synced_block = max(self.state.synced_block, block - 1)
+        self.prune()
+        # published by advance(), once per batch of logs
+        self.changed = True
+
+    def advance(self, block, timestamp=None):
+        """All the logs up to `block`, mined at `timestamp`, were delivered to on_log.
+
+        Publishes the changes.
+        """
+        if block > self.state.synced_block:
+            self.head = max(self.head, block)
+            self.state.synced_block = block
+            self.synced_timestamp = (block, timestamp)
+            self.prune()
+            self.changed = True
+        if self.changed:
+            self.publish()
+
+    def is_orphaned(self, event):
+        """Whether the filter log `event` shows that processed blocks were replaced.
+
+        That is a removed log, a log of a recent block with another hash, or
+        a new log in a recent block that was already synced.
+        """
+        block = event['blockNumber']
+        if event.get('removed'):
+            return True
+        recent = self.state.recent.get(block)
+        if recent is not None and recent['hash'] != event['blockHash']:
+            return True
+        key = (event['blockHash'], event['transactionHash'], event['logIndex'])
+        return (self.head - self.confirmations < block <= self.state.synced_block and
+                (recent is None or key not in recent['logs']))
+
+    def dispatch(self, event):
+        block = event['blockNumber']
+        position = (block, event['logIndex'])
+        if position <= self.state.last_log:
+            return
+        key = (event['blockHash'], event['transactionHash'], event['logIndex'])
+        if block > self.head - self.confirmations:
+            recent = self.state.recent.get(block)
+            if recent is not None and key in recent['logs']:
+                log.warning('duplicate log %s' % str(key))
+                return
+            self.state.add_recent_log(block, key)
+        topic = event['topics'][0]
+        self.handlers[topic](event)
+        self.state.last_log = position
+        EVENTS.inc(auction=self.contract_addr.lower(), event=self.decoders.by_topic[topic].name)
+
+    def add_undo(self, event, record):
+        """Journal record undoing a change made for `event`, kept while its block is recent."""
+        if event['blockNumber'] in self.state.recent:
+            self.state.add_undo(event['blockNumber'], record)
+
+    def undo(self, record):
+        kind = record[0]
+        if kind == 'pop_bid':
+            self.remove_last_bid()
+        elif kind == 'pop_claim':
+            self.state.pop_claim()
+        elif kind == 'auction':
+            self.state.update_auction(record[1])
+        else:
+            raise ValueError('unknown undo record %s' % kind)
+
+    def rollback(self, block):
+        """Undo everything processed from `block` on, after a chain reorganization.
+
+        The state only keeps what is needed to undo the recent blocks. A
+        reorganization reaching older blocks drops the whole state, so that
+        the feed syncs the auction again from block 0.
+        """
+        log.warning('chain reorganization at block %d, rolling back' % block)
+        if block <= self.head - self.confirmations:
+            log.error('reorganization deeper than %d confirmations, syncing %s again'
+                      % (self.confirmations, self.contract_addr))
+            self.clear()
+            return
+        for recent_block in sorted((b for b in self.state.recent if b >= block), reverse=True):
+            for record in reversed(self.state.pop_recent(recent_block)['undo']):
+                self.undo(record)
+            self.state.block_to_timestamp.pop(recent_block, None)
+        self.state.synced_block = min(self.state.synced_block, block - 1)
+        self.state.last_log = min(self.state.last_log, (block - 1, sys.maxsize))
+        self.changed = True
+
+    def clear(self):
+        """Drop the state and everything derived from it."""
+        self.state.clear()
+        self.bids = self.state.bids
+        self.total = 0
+        self.histogram = TimeHistogram()
+        # pending fetches of late bids give up
+        self.late_bids = {}
+        self.changed = True
+
+    def prune(self):
+        self.state.prune_recent(self.head - self.confirmations)
+
+    def decode(self, event):
+        return self.decoders.decode(event)
 
     def last_event(self):
-        if len(self.events) == 0:
-            return None
-        last_block = max(self.events.keys())
-        return sorted(self.events[last_block], key=itemgetter('logIndex'))[0]
+        return self.bids.last_event()
 
     def on_claimed_tokens(self, event):
-        self.total_claimed += event['args']['_sent_amount']
+        self.state.add_claim(event)
+        self.add_undo(event, ['pop_claim'])
+
+    def update_auction(self, event, values):
+        previous = {key: self.state.auction.get(key) for key in values}
+        self.state.update_auction(values)
+        self.add_undo(event, ['auction', previous])
 
     def on_deployed_event(self, event):
-        self.price_start = event['args']['_price_start']
-        self.price_constant = event['args']['_price_constant']
-        self.price_exponent = event['args']['_price_exponent']
+        self.update_auction(event, {
+            'price_start': event['args']['_price_start'],
+            'price_constant': event['args']['_price_constant'],
+            'price_exponent': event['args']['_price_exponent']
+        })
 
     def on_bid_submission(self, args):
         log.info('BidSubmission %s' % str(args))
-        if args['blockNumber'] not in self.state.block_to_timestamp:
-            timestamp = self.chain.web3.eth.getBlock(args['blockNumber'])['timestamp']
-            self.state.block_to_timestamp[args['blockNumber']] = timestamp
-        dup = [x for x in self.events[args['blockNumber']]
-               if x['transactionIndex'] == args['transactionIndex']
-               ]
-        if len(dup) >= 1:
-            log.warning('duplicate transaction? %s %s' % (str(args), str(dup)))
+        block = args['blockNumber']
+        amount = args['args']['_amount']
+        self.state.add_bid(args)
+        self.total += amount
+        self.add_to_histogram(block, amount)
+        self.add_undo(args, ['pop_bid'])
+
+    def remove_last_bid(self):
+        block, amount = self.bids.block[-1], self.bids.amount[-1]
+        self.state.pop_bid()
+        self.total -= amount
+        late = self.late_bids.get(block)
+        if late is not None:
+            # not in the histogram yet
+            late.remove(amount)
+            if len(late) == 0:
+                del self.late_bids[block]
             return
-        self.events[args['blockNumber']].append(args)
+        timestamp = self.state.block_to_timestamp.get(block)
+        if timestamp is not None:
+            self.histogram.remove(timestamp, amount)
+
+    def add_to_histogram(self, block, amount):
+        timestamp = self.state.block_to_timestamp.get(block)
+        if block in self.late_bids:
+            self.late_bids[block].append(amount)
+        elif timestamp is not None:
+            self.histogram.add(timestamp, amount)
+        else:
+            self.late_bids[block] = [amount]
+            gevent.spawn(self.add_late_bids, block)
+
+    def add_late_bids(self, block):
+        """Add the bids of `block` to the histogram once its timestamp is fetched.
+
+        The node may not know a just mined block yet or fail to answer, so the
+        timestamp is asked again every `retry_period` seconds. Gives up when a
+        rollback removed all the bids of the block.
+        """
+        while block in self.late_bids:
+            try:
+                timestamp = self.resolve_timestamps([block])[block]
+            except Exception as e:
+                log.warning('fetching the timestamp of block %d failed: %s' % (block, str(e)))
+                timestamp = None
+            if timestamp is not None and block in self.late_bids:
+                for amount in self.late_bids.pop(block):
+                    self.histogram.add(timestamp, amount)
+                self.changed = True
+                return
+            gevent.sleep(self.retry_period)
 
     def on_auction_end(self, event):
-        self.final_price = event['args']['_final_price']
-        self.auction_end_block = event['blockNumber']
-        self.auction_end_time = self.chain.web3.eth.getBlock(event['blockNumber']).timestamp
+        self.update_auction(event, {
+            'final_price': event['args']['_final_price'],
+            'auction_end_block': event['blockNumber'],
+            'auction_end_time': self.state.block_to_timestamp.get(event['blockNumber'])
+        })
+        if self.state.auction['auction_end_time'] is None:
+            self.request_timestamps([event['blockNumber']], self.set_auction_end_time)
         log.info('auction ended %s' % (str(event['args'])))
 
+    def set_auction_end_time(self, timestamps):
+        block = self.state.auction['auction_end_block']
+        self.state.update_auction({'auction_end_time': timestamps.get(block)})
+        self.changed = True
+
     def on_auction_start(self, event):
-        self.auction_start_block = event['args']['_block_number']
-        self.auction_start_time = event['args']['_start_time']
+        self.update_auction(event, {
+            'auction_start_block': event['args']['_block_number'],
+            'auction_start_time': event['args']['_start_time']
+        })
         log.info('auction started %s' % (str(event['args'])))
-
-    def get_logs(self, event_name, from_block=0, to_block='latest', filters=None):
-        filter_kwargs = {
-            'fromBlock': from_block,
-            'toBlock': to_block,
-            'address': self.contract_addr
-        }
-        event_abi = [i for i in self.auction_contract.abi
-                     if i['type'] == 'event' and i['name'] == event_name][0]
-        assert event_abi
-        filters = filters if filters else {}
-        filter_ = construct_event_filter_params(event_abi, argument_filters=filters,
-                                                **filter_kwargs)[1]
-        filter_params = input_filter_params_formatter(filter_)
-        response = self.chain.web3._requestManager.request_blocking('eth_getLogs', [filter_params])
-
-        logs = log_array_formatter(response)
-        logs = [dict(log) for log in logs]
-        for log in logs:
-            log['args'] = get_event_data(event_abi, log)['args']
-        return logs
@@ -0,0 +1,477 @@
+"""
+State shared by the ingester process with pre-forked REST workers.
+
+The ingester publishes the state of every auction in plain data files of
+the state directory, none of which is ever executed or unpickled:
+
+    <address>.shared      header and JSON metadata: poller snapshot, sampler
+                          view, row counts and the rows rewritten by rollbacks
+    <address>.bids        BID_DTYPE records
+    <address>.claims      CLAIM_DTYPE records
+    <address>.senders     ADDRESS_DTYPE bidder addresses, indexed by bid sender
+    <address>.recipients  ADDRESS_DTYPE claim recipients
+    <address>.histogram   histogram base slots, uint256 split into WORDS words
+
+The header of the `.shared` file holds a sequence counter used as a seqlock
+over all the files: the writer makes it odd before changing any of them and
+even again after, and a reader retries when the counter was odd or changed
+while it read. Records are only appended, except for the rows a chain
+reorganization rolled back, which are written again; workers keep their own
+stores and read only the new and rewritten rows. Workers serve the REST API
+from these files and never talk to the node.
+"""
+from types import MappingProxyType
+import gevent
+import gevent.event
+import json
+import logging
+import mmap
+import os
+import struct
+
+import numpy
+
+from event_sampler.histogram import TimeHistogram
+from event_sampler.metrics import collect
+from event_sampler.resources import StatusCache
+from event_sampler.snapshot import BID_DTYPE, CLAIM_DTYPE, WORDS, join_words, split_words
+from event_sampler.store import BidStore, ClaimStore
+from event_sampler.stream import StatusStream
+from event_sampler.view import SamplerView
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'EVSHARED'
+# magic, sequence counter, metadata length
+HEADER = struct.Struct('<8sQQ')
+SEQ_OFFSET = 8
+ADDRESS_DTYPE = numpy.dtype('S42')
+SLOT_DTYPE = numpy.dtype([('amount', '<u8', (WORDS,))])
+# rollbacks listed in the metadata; a worker that missed more reads all the rows again
+MAX_REWRITES = 64
+
+
+class SharedRegion:
+    """JSON metadata in a memory-mapped file, published under a seqlock.
+
+    A write is `begin()`, changes to the files the metadata describes, then
+    `commit(meta)`. The file is created with room for `size` metadata bytes;
+    larger metadata is written to a new, bigger file that replaces the old
+    one by rename. The old file is left with an odd counter, so that its
+    readers notice the new inode and map it.
+    """
+
+    def __init__(self, path, size=64 * 1024):
+        self.path = path
+        self.size = size
+        self.file = None
+        self.map = None
+        self.inode = None
+        self.seq = 0
+
+    def create(self, size):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.seq, 0))
+            f.truncate(HEADER.size + size)
+        self.retire()
+        os.replace(tmp_path, self.path)
+        self.size = size
+        self.open()
+
+    def retire(self):
+        # readers of the replaced file, e.g. of a previous ingester, wait for the new one
+        if self.map is None and os.path.isfile(self.path):
+            self.open()
+        if self.map is not None:
+            struct.pack_into('<Q', self.map, SEQ_OFFSET, self.seq | 1)
+
+    def open(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+        self.file = open(self.path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.inode = os.fstat(self.file.fileno()).st_ino
+
+    def begin(self):
+        """Start a write; returns the sequence number it will be published with."""
+        if self.map is None:
+            self.create(self.size)
+        self.seq += 1
+        struct.pack_into('<Q', self.map, SEQ_OFFSET, self.seq)
+        return self.seq + 1
+
+    def commit(self, meta):
+        data = json.dumps(meta).encode()
+        if len(data) > len(self.map) - HEADER.size:
+            size = self.size
+            while size < len(data):
+                size *= 2
+            self.create(size)
+        self.map[HEADER.size:HEADER.size + len(data)] = data
+        struct.pack_into('<Q', self.map, SEQ_OFFSET + 8, len(data))
+        self.seq += 1
+        struct.pack_into('<Q', self.map, SEQ_OFFSET, self.seq)
+
+    def read(self, load=None):
+        """(sequence number, metadata, `load(seq, metadata)`) of the latest write.
+
+        `load` reads the other files under the same lock. Returns None before
+        the first write.
+        """
+        while True:
+            if self.map is None or os.stat(self.path).st_ino != self.inode:
+                if not os.path.isfile(self.path):
+                    return None
+                self.open()
+            magic, seq, length = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC:
+                raise ValueError('%s is not a shared state file' % self.path)
+            if seq & 1:
+                gevent.sleep(0.001)
+                continue
+            if length == 0:
+                return None
+            data = self.map[HEADER.size:HEADER.size + length]
+            try:
+                meta = json.loads(data.decode())
+                loaded = load(seq, meta) if load is not None else None
+            except ValueError:
+                if struct.unpack_from('<Q', self.map, SEQ_OFFSET)[0] == seq:
+                    raise
+                # torn by a concurrent write
+                continue
+            if struct.unpack_from('<Q', self.map, SEQ_OFFSET)[0] == seq:
+                return seq, meta, loaded
+
+
+class RecordFile:
+    """Fixed-size `dtype` records in a file, written and read by row."""
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = numpy.dtype(dtype)
+        self.file = None
+
+    def create(self):
+        self.file = open(self.path, 'w+b')
+
+    def write(self, row, records):
+        self.file.seek(row * self.dtype.itemsize)
+        self.file.write(numpy.asarray(records, dtype=self.dtype).tobytes())
+        self.file.flush()
+
+    def read(self, start, stop):
+        """Rows [start, stop)."""
+        if start >= stop:
+            return numpy.zeros(0, dtype=self.dtype)
+        records = numpy.fromfile(self.path, dtype=self.dtype, count=stop - start,
+                                 offset=start * self.dtype.itemsize)
+        if len(records) != stop - start:
+            raise ValueError('%s is shorter than its metadata' % self.path)
+        return records
+
+
+class SharedTable:
+    """The records and interned addresses of a BidStore or ClaimStore in RecordFiles.
+
+    `rewrites` lists [sequence number, row] of the writes that rewrote rows
+    from `row` on after a rollback.
+    """
+
+    def __init__(self, path, kind):
+        records, dtype, addresses = kind
+        self.records = RecordFile(path + '.' + records, dtype)
+        self.addresses = RecordFile(path + '.' + addresses, ADDRESS_DTYPE)
+        self.count = 0
+        self.address_count = 0
+        self.rewrites = []
+        # sequence number from which `rewrites` is complete
+        self.rewrites_since = 0
+
+    def create(self):
+        self.records.create()
+        self.addresses.create()
+
+    def update(self, store, addresses, count, seq):
+        """Write the changes to the first `count` rows of `store` in the write `seq`."""
+        # the store may have been rolled back since the view holding `count` was built
+        count = min(count, len(store))
+        first = min(self.count, store.mark())
+        if first < self.count:
+            self.rewrites.append([seq, first])
+            if len(self.rewrites) > MAX_REWRITES:
+                self.rewrites_since = self.rewrites.pop(0)[0]
+        if count > first:
+            self.records.write(first, store.to_records(first, count))
+        self.count = count
+        if len(addresses) > self.address_count:
+            self.addresses.write(self.address_count,
+                                 [address.encode() for address in addresses[self.address_count:]])
+            self.address_count = len(addresses)
+
+    def meta(self):
+        return {'count': self.count, 'addresses': self.address_count,
+                'rewrites': self.rewrites, 'rewrites_since': self.rewrites_since}
+
+    def read(self, meta, count, address_count, seq):
+        """(reset, first row, records, addresses) changed since a reader's write `seq`.
+
+        The reader has `count` rows and `address_count` addresses; with `reset`
+        it must start over from empty stores.
+        """
+        reset = seq is None or seq < meta['rewrites_since']
+        if reset:
+            count = address_count = 0
+        else:
+            for rewrite_seq, row in meta['rewrites']:
+                if rewrite_seq > seq:
+                    count = min(count, row)
+        count = min(count, meta['count'])
+        return (reset, count, self.records.read(count, meta['count']),
+                [address.decode() for address in self.addresses.read(address_count,
+                                                                     meta['addresses'])])
+
+
+BIDS = ('bids', BID_DTYPE, 'senders')
+CLAIMS = ('claims', CLAIM_DTYPE, 'recipients')
+
+
+class StatePublisher:
+    """Ingester side: writes the state of every auction to its shared files.
+
+    Every `period` seconds each auction whose poller snapshot or sampler view
+    was replaced since the last write is written again.
+    """
+
+    def __init__(self, auctions, state_dir, period=0.5):
+        self.auctions = auctions
+        self.period = period
+        self.run = gevent.event.Event()
+        self.regions = {}
+        self.tables = {}
+        for address in auctions:
+            path = shared_path(state_dir, address)
+            self.regions[address] = SharedRegion(path + '.shared')
+            self.tables[address] = (SharedTable(path, BIDS), SharedTable(path, CLAIMS),
+                                    RecordFile(path + '.histogram', SLOT_DTYPE))
+        # tells the workers which ingester wrote the rows they have
+        self.epoch = os.urandom(8).hex()
+        self.published = {}
+
+    def stop(self):
+        self.run.set()
+
+    def start(self):
+        for address, (bids, claims, histogram) in self.tables.items():
+            self.regions[address].retire()
+            bids.create()
+            claims.create()
+            histogram.create()
+        self.ev_publish = gevent.spawn(self.callback)
+
+    def callback(self):
+        while self.run.is_set() is False:
+            for address, auction in self.auctions.items():
+                try:
+                    self.publish(address, auction)
+                except Exception as e:
+                    log.warning('publishing state of %s failed: %s' % (address, str(e)))
+            gevent.sleep(self.period)
+
+    def publish(self, address, auction):
+        snapshot = auction['poller'].snapshot
+        sampler = auction['sampler']
+        view = sampler.view
+        published = self.published.get(address)
+        if published is not None and published[0] is snapshot and published[1] is view:
+            return
+        region = self.regions[address]
+        bids, claims, histogram_file = self.tables[address]
+        histogram = view.histogram
+        seq = region.begin()
+        # the slots are written again only when the frozen histogram was replaced
+        histogram_seq = published[2] if published is not None else None
+        try:
+            bids.update(sampler.bids, sampler.bids.senders, view.bid_count, seq)
+            claims.update(sampler.state.claims, sampler.state.claims.recipients,
+                          view.claim_count, seq)
+            if published is None or published[1].histogram is not histogram:
+                amounts = histogram.slots()
+                slots = numpy.zeros(len(amounts), dtype=SLOT_DTYPE)
+                slots['amount'] = split_words(amounts)
+                histogram_file.write(0, slots)
+                histogram_seq = seq
+        except Exception:
+            # the files are left half written: make the workers read all of them again
+            self.epoch = os.urandom(8).hex()
+            for table in (bids, claims):
+                table.count = table.address_count = 0
+                table.rewrites = []
+            self.published.pop(address, None)
+            raise
+        region.commit({
+            'epoch': self.epoch,
+            'address': auction['contract'].address,
+            'snapshot': dict(snapshot, block={key: snapshot['block'][key]
+                                              for key in ('number', 'hash', 'timestamp')}),
+            'view': dict(view._asdict(), auction=dict(view.auction), histogram={
+                'resolution': histogram.resolution,
+                'origin': histogram.origin,
+                'first_timestamp': histogram.first_timestamp,
+                'last_timestamp': histogram.last_timestamp,
+                'slots': histogram.sizes[0] if histogram.sizes else 0,
+                'seq': histogram_seq
+            }),
+            'confirmations': sampler.confirmations,
+            'bids': bids.meta(),
+            'claims': claims.meta(),
+            'metrics': encode_metrics(collect())
+        })
+        self.published[address] = (snapshot, view, histogram_seq)
+
+
+def shared_path(state_dir, address):
+    """Path of the shared files of an auction, without the extension."""
+    return os.path.join(state_dir, address.lower())
+
+
+def encode_metrics(collected):
+    """`collect()` result with the label tuples as lists, to be stored as JSON."""
+    return {name: [[[list(label) for label in key], value] for key, value in values.items()]
+            for name, values in collected.items()}
+
+
+def decode_metrics(encoded):
+    return {name: {tuple(tuple(label) for label in key): value for key, value in values}
+            for name, values in encoded.items()}
+
+
+class SharedAuction:
+    """Worker side: the latest state of an auction read from its shared files.
+
+    Stands in for the contract, poller and sampler of the ingester in the
+    `auctions` dict of event_sampler.resources, with the same attributes.
+    The bid and claim stores are kept between refreshes: only the rows
+    appended or rewritten since the last read are read and applied.
+    """
+
+    def __init__(self, path, sample_period=0.5):
+        self.region = SharedRegion(path + '.shared')
+        self.bid_table = SharedTable(path, BIDS)
+        self.claim_table = SharedTable(path, CLAIMS)
+        self.histogram_file = RecordFile(path + '.histogram', SLOT_DTYPE)
+        self.sample_period = sample_period
+        self.epoch = None
+        self.seq = None
+        self.histogram_seq = None
+        self.histogram = None
+        self.snapshot = None
+        self.bids = BidStore()
+        self.state = SharedState(ClaimStore())
+        self.listeners = []
+        self.run = gevent.event.Event()
+        self.refresh()
+
+    def load(self, seq, meta):
+        """The changes since the last refresh, read under the region's lock."""
+        if meta['epoch'] == self.epoch and seq == self.seq:
+            return None
+        last_seq = self.seq if meta['epoch'] == self.epoch else None
+        bids = self.bid_table.read(meta['bids'], len(self.bids), len(self.bids.senders),
+                                   last_seq)
+        claims = self.state.claims
+        claims = self.claim_table.read(meta['claims'], len(claims), len(claims.recipients),
+                                       last_seq)
+        histogram = meta['view']['histogram']
+        slots = None
+        if last_seq is None or histogram['seq'] != self.histogram_seq:
+            slots = join_words(self.histogram_file.read(0, histogram['slots'])['amount'])
+        return bids, claims, slots
+
+    def refresh(self):
+        result = self.region.read(self.load)
+        while result is None:
+            # the ingester did not publish yet
+            gevent.sleep(self.sample_period)
+            result = self.region.read(self.load)
+        seq, meta, changes = result
+        if changes is None:
+            return
+        bids, claims, slots = changes
+        previous = self.snapshot
+        self.epoch = meta['epoch']
+        self.seq = seq
+        self.address = meta['address']
+        self.confirmations = meta['confirmations']
+        self.bids = apply_rows(self.bids, *bids)
+        self.state = SharedState(apply_rows(self.state.claims, *claims))
+        if slots is not None:
+            self.histogram = load_histogram(meta['view']['histogram'], slots)
+            self.histogram_seq = meta['view']['histogram']['seq']
+        self.view = SamplerView(**dict(meta['view'], auction=MappingProxyType(
+            meta['view']['auction']), histogram=self.histogram))
+        self.metrics = decode_metrics(meta['metrics'])
+        self.snapshot = meta['snapshot']
+        if previous is None or previous['block']['number'] != self.snapshot['block']['number']:
+            for listener in self.listeners:
+                listener(self.snapshot)
+
+    def stop(self):
+        self.run.set()
+
+    def start(self):
+        self.ev_poll = gevent.spawn(self.callback)
+
+    def callback(self):
+        while self.run.is_set() is False:
+            gevent.sleep(self.sample_period)
+            try:
+                self.refresh()
+            except Exception as e:
+                log.warning('reading shared state failed: %s' % str(e))
+
+
+def apply_rows(store, reset, first, records, addresses):
+    """Bring a BidStore or ClaimStore up to date with the result of SharedTable.read."""
+    if reset:
+        store = type(store)()
+    while len(store) > first:
+        store.pop()
+    store.extend(records, addresses)
+    return store
+
+
+def load_histogram(meta, slots):
+    histogram = TimeHistogram(meta['resolution'])
+    if meta['origin'] is not None:
+        histogram.origin = meta['origin']
+        histogram.fill(slots)
+        histogram.first_timestamp = meta['first_timestamp']
+        histogram.last_timestamp = meta['last_timestamp']
+        histogram.total = sum(slots)
+    return histogram.freeze()
+
+
+class SharedState:
+    """The part of EventSamplerState read by the resources."""
+
+    def __init__(self, claims):
+        self.claims = claims
+
+
+def shared_auctions(state_dir, addresses):
+    """`auctions` dict of event_sampler.resources for a REST worker."""
+    auctions = {}
+    for address in addresses:
+        shared = SharedAuction(shared_path(state_dir, address))
+        shared.start()
+        auctions[address.lower()] = {
+            'contract': shared,
+            'sampler': shared,
+            'poller': shared,
+            'cache': StatusCache(shared, shared),
+            'stream': StatusStream(shared, shared)
+        }
+    return auctions
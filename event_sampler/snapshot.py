@@ -0,0 +1,190 @@
+"""
+Binary snapshot of the sampler state.
+
+Layout, all integers little-endian:
+
+    header      8 byte magic, uint32 format version, uint32 metadata length
+    metadata    JSON object (sync position, auction, senders, array lengths),
+                zero padded to a multiple of 8 bytes
+    blocks      int64[timestamps], sorted
+    timestamps  int64[timestamps], timestamp of blocks[i]
+    bids        BID_DTYPE[bids], uint256 values split into 4 uint64 words,
+                least significant word first
+    claims      CLAIM_DTYPE[claims] (since format 2)
+
+The arrays are opened with `numpy.memmap` in read-only mode. Block
+timestamps are looked up in the mapped arrays, so loading them doesn't
+depend on their number. The bid and claim records are copied into the
+in-memory stores with whole-column conversions, and the sampler replays the
+bids into its total and histogram: that part of loading is still
+linear in the number of bids, only without JSON parsing.
+"""
+from collections.abc import MutableMapping
+import json
+import struct
+
+import numpy
+
+MAGIC = b'EVSTATE\x00'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<8sII')
+WORDS = 4
+
+BID_DTYPE = numpy.dtype([
+    ('block', '<i8'),
+    ('transaction_index', '<i8'),
+    ('log_index', '<i8'),
+    ('sender', '<i8'),
+    ('amount', '<u8', (WORDS,)),
+    ('missing_funds', '<u8', (WORDS,))
+])
+
+CLAIM_DTYPE = numpy.dtype([
+    ('block', '<i8'),
+    ('transaction_index', '<i8'),
+    ('log_index', '<i8'),
+    ('recipient', '<i8'),
+    ('amount', '<u8', (WORDS,))
+])
+
+
+def split_words(values):
+    """uint256 values as an array of WORDS uint64 words each."""
+    words = numpy.zeros((len(values), WORDS), dtype='<u8')
+    for i, value in enumerate(values):
+        for k in range(WORDS):
+            words[i, k] = (value >> (64 * k)) & 0xffffffffffffffff
+    return words
+
+
+def join_words(words):
+    """Inverse of `split_words`: a list of Python ints."""
+    values = numpy.zeros(len(words), dtype=object)
+    for k in range(WORDS):
+        values += words[:, k].astype(object) << (64 * k)
+    return values.tolist()
+
+
+def is_snapshot(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def encode_snapshot(meta, blocks, timestamps, bids, claims):
+    meta = dict(meta, timestamps=len(blocks), bids=len(bids), claims=len(claims))
+    meta_bytes = json.dumps(meta).encode()
+    meta_bytes += b'\x00' * (-(HEADER.size + len(meta_bytes)) % 8)
+    return b''.join([
+        HEADER.pack(MAGIC, FORMAT_VERSION, len(meta_bytes)),
+        meta_bytes,
+        numpy.asarray(blocks, dtype='<i8').tobytes(),
+        numpy.asarray(timestamps, dtype='<i8').tobytes(),
+        numpy.asarray(bids, dtype=BID_DTYPE).tobytes(),
+        numpy.asarray(claims, dtype=CLAIM_DTYPE).tobytes()
+    ])
+
+
+def read_snapshot(path):
+    """Metadata and memory-mapped (blocks, timestamps, bids, claims) arrays of a snapshot."""
+    with open(path, 'rb') as f:
+        magic, version, meta_length = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('not a state snapshot')
+        if version not in (1, FORMAT_VERSION):
+            raise ValueError('unsupported snapshot format %d' % version)
+        meta = json.loads(f.read(meta_length).rstrip(b'\x00').decode())
+    offset = HEADER.size + meta_length
+    arrays = []
+    # format 1 snapshots have no claims
+    for dtype, length in (('<i8', meta['timestamps']), ('<i8', meta['timestamps']),
+                          (BID_DTYPE, meta['bids']), (CLAIM_DTYPE, meta.get('claims', 0))):
+        dtype = numpy.dtype(dtype)
+        if length == 0:
+            # mmap can not map an empty range
+            arrays.append(numpy.zeros(0, dtype=dtype))
+        else:
+            arrays.append(numpy.memmap(path, dtype=dtype, mode='r', offset=offset,
+                                       shape=(length,)))
+        offset += dtype.itemsize * length
+    return meta, arrays[0], arrays[1], arrays[2], arrays[3]
+
+
+class BlockTimestamps(MutableMapping):
+    """block -> timestamp over sorted (memory-mapped) arrays and a dict of later changes.
+
+    Assignments and removals go to the `changes` dict (None marks a removed
+    block) and are appended to `journal`.
+    """
+
+    def __init__(self, journal, blocks=None, timestamps=None):
+        self.journal = journal
+        self.blocks = blocks if blocks is not None else numpy.zeros(0, dtype='<i8')
+        self.timestamps = timestamps if timestamps is not None else numpy.zeros(0, dtype='<i8')
+        self.changes = {}
+
+    @classmethod
+    def from_dict(cls, journal, block_to_timestamp):
+        blocks = numpy.array(sorted(block_to_timestamp), dtype='<i8')
+        timestamps = numpy.array([block_to_timestamp[b] for b in blocks.tolist()], dtype='<i8')
+        return cls(journal, blocks, timestamps)
+
+    def lookup(self, block):
+        if block in self.changes:
+            return self.changes[block]
+        i = numpy.searchsorted(self.blocks, block)
+        if i < len(self.blocks) and self.blocks[i] == block:
+            return int(self.timestamps[i])
+        return None
+
+    def __getitem__(self, block):
+        timestamp = self.lookup(block)
+        if timestamp is None:
+            raise KeyError(block)
+        return timestamp
+
+    def __contains__(self, block):
+        return self.lookup(block) is not None
+
+    def get(self, block, default=None):
+        timestamp = self.lookup(block)
+        return default if timestamp is None else timestamp
+
+    def set(self, block, timestamp):
+        """Change without journaling, for journal replay; None removes the block."""
+        self.changes[block] = timestamp
+
+    def __setitem__(self, block, timestamp):
+        self.set(block, timestamp)
+        self.journal.append(['timestamp', block, timestamp])
+
+    def __delitem__(self, block):
+        if block not in self:
+            raise KeyError(block)
+        self.set(block, None)
+        self.journal.append(['timestamp', block, None])
+
+    def arrays(self):
+        """Sorted (blocks, timestamps) arrays with the changes merged in."""
+        if len(self.changes) == 0:
+            return self.blocks, self.timestamps
+        changed = numpy.array(list(self.changes), dtype='<i8')
+        keep = ~numpy.isin(self.blocks, changed)
+        added = [(b, t) for b, t in self.changes.items() if t is not None]
+        blocks = numpy.concatenate([self.blocks[keep],
+                                    numpy.array([b for b, _ in added], dtype='<i8')])
+        timestamps = numpy.concatenate([self.timestamps[keep],
+                                        numpy.array([t for _, t in added], dtype='<i8')])
+        order = numpy.argsort(blocks, kind='stable')
+        return blocks[order], timestamps[order]
+
+    def merge(self):
+        """Fold the changes into the arrays and return them."""
+        self.blocks, self.timestamps = self.arrays()
+        self.changes = {}
+        return self.blocks, self.timestamps
+
+    def __iter__(self):
+        return iter(self.arrays()[0].tolist())
+
+    def __len__(self):
+        return len(self.arrays()[0])
@@ -0,0 +1,224 @@
+from array import array
+
+import numpy
+
+from event_sampler.snapshot import BID_DTYPE, CLAIM_DTYPE, join_words, split_words
+
+
+class BidStore:
+    """BidSubmission events kept as parallel arrays instead of web3 log dicts.
+
+    Row i of every column belongs to the same bid. Bidder addresses are
+    interned: `sender` holds an index into `senders`. Amounts are uint256 and
+    stay Python ints; everything else is a machine-sized integer array.
+    """
+
+    def __init__(self):
+        self.block = array('q')
+        self.transaction_index = array('l')
+        self.log_index = array('l')
+        self.sender = array('l')
+        self.amount = []
+        self.missing_funds = []
+        self.senders = []
+        self.sender_ids = {}
+        # row of the event returned by last_event()
+        self.last = None
+        # lowest length since the last mark(): the rows from there on may have changed
+        self.low_water = 0
+
+    def __len__(self):
+        return len(self.block)
+
+    def __iter__(self):
+        return (self.record(i) for i in range(len(self)))
+
+    def sender_id(self, address):
+        sender_id = self.sender_ids.get(address)
+        if sender_id is None:
+            sender_id = len(self.senders)
+            self.senders.append(address)
+            self.sender_ids[address] = sender_id
+        return sender_id
+
+    def append(self, event):
+        args = event['args']
+        self.add(event['blockNumber'], event['transactionIndex'], event['logIndex'],
+                 args['_sender'], args['_amount'], args['_missing_funds'])
+
+    def add(self, block, transaction_index, log_index, sender, amount, missing_funds):
+        row = len(self)
+        self.block.append(block)
+        self.transaction_index.append(transaction_index)
+        self.log_index.append(log_index)
+        self.sender.append(self.sender_id(sender))
+        self.amount.append(amount)
+        self.missing_funds.append(missing_funds)
+        # same as the old EventSampler.last_event(): lowest logIndex of the last block
+        if self.last is None or (-block, log_index) < (-self.block[self.last],
+                                                       self.log_index[self.last]):
+            self.last = row
+        return row
+
+    def pop(self):
+        """Remove the most recent bid, e.g. when its block is orphaned."""
+        row = len(self) - 1
+        record = self.record(row)
+        for column in (self.block, self.transaction_index, self.log_index, self.sender,
+                       self.amount, self.missing_funds):
+            column.pop()
+        self.low_water = min(self.low_water, row)
+        if self.last == row:
+            self.last = None
+            for i in range(row - 1, -1, -1):
+                if self.block[i] != self.block[row - 1]:
+                    break
+                if self.last is None or self.log_index[i] < self.log_index[self.last]:
+                    self.last = i
+        return record
+
+    def record(self, row):
+        """Row `row` in the layout of a decoded BidSubmission log."""
+        return {
+            'event': 'BidSubmission',
+            'blockNumber': self.block[row],
+            'transactionIndex': self.transaction_index[row],
+            'logIndex': self.log_index[row],
+            'args': {
+                '_sender': self.senders[self.sender[row]],
+                '_amount': self.amount[row],
+                '_missing_funds': self.missing_funds[row]
+            }
+        }
+
+    def last_event(self):
+        if self.last is None:
+            return None
+        return self.record(self.last)
+
+    def mark(self):
+        """Return the lowest length since the previous mark() and start a new period.
+
+        Rows below it are unchanged since the previous mark(); a copy of the
+        store is brought up to date by rewriting the rows from there on.
+        """
+        low_water, self.low_water = self.low_water, len(self)
+        return low_water
+
+    def to_records(self, start=0, stop=None):
+        """Rows [start, stop) as BID_DTYPE records."""
+        stop = len(self) if stop is None else stop
+        records = numpy.zeros(stop - start, dtype=BID_DTYPE)
+        records['block'] = self.block[start:stop]
+        records['transaction_index'] = self.transaction_index[start:stop]
+        records['log_index'] = self.log_index[start:stop]
+        records['sender'] = self.sender[start:stop]
+        records['amount'] = split_words(self.amount[start:stop])
+        records['missing_funds'] = split_words(self.missing_funds[start:stop])
+        return records
+
+    def extend(self, records, senders=()):
+        """Append BID_DTYPE records whose sender ids index `self.senders + senders`."""
+        for address in senders:
+            self.sender_id(address)
+        if len(records) == 0:
+            return
+        row = len(self)
+        self.block.extend(records['block'].tolist())
+        self.transaction_index.extend(records['transaction_index'].tolist())
+        self.log_index.extend(records['log_index'].tolist())
+        self.sender.extend(records['sender'].tolist())
+        self.amount.extend(join_words(records['amount']))
+        self.missing_funds.extend(join_words(records['missing_funds']))
+        # first row of the last block with the lowest logIndex, as in add()
+        last = row + int(numpy.lexsort((records['log_index'], -records['block']))[0])
+        if self.last is None or (-self.block[last], self.log_index[last]) < (
+                -self.block[self.last], self.log_index[self.last]):
+            self.last = last
+
+    @classmethod
+    def from_records(cls, records, senders):
+        """Store of the bid records of a state snapshot."""
+        store = cls()
+        store.extend(records, senders)
+        store.low_water = len(store)
+        return store
+
+    @classmethod
+    def from_dict(cls, state):
+        store = cls()
+        columns = zip(state['block'], state['transaction_index'], state['log_index'],
+                      state['sender'], state['amount'], state['missing_funds'])
+        for block, transaction_index, log_index, sender, amount, missing_funds in columns:
+            store.add(block, transaction_index, log_index, state['senders'][sender],
+                      amount, missing_funds)
+        return store
+
+
+class ClaimStore:
+    """ClaimedTokens events as parallel arrays, laid out like BidStore."""
+
+    def __init__(self):
+        self.block = array('q')
+        self.transaction_index = array('l')
+        self.log_index = array('l')
+        self.recipient = array('l')
+        self.amount = []
+        self.recipients = []
+        self.recipient_ids = {}
+        # lowest length since the last mark(), as in BidStore
+        self.low_water = 0
+
+    def __len__(self):
+        return len(self.block)
+
+    def recipient_id(self, address):
+        recipient_id = self.recipient_ids.get(address)
+        if recipient_id is None:
+            recipient_id = len(self.recipients)
+            self.recipients.append(address)
+            self.recipient_ids[address] = recipient_id
+        return recipient_id
+
+    def add(self, block, transaction_index, log_index, recipient, amount):
+        self.block.append(block)
+        self.transaction_index.append(transaction_index)
+        self.log_index.append(log_index)
+        self.recipient.append(self.recipient_id(recipient))
+        self.amount.append(amount)
+
+    def pop(self):
+        for column in (self.block, self.transaction_index, self.log_index, self.recipient,
+                       self.amount):
+            column.pop()
+        self.low_water = min(self.low_water, len(self))
+
+    def mark(self):
+        low_water, self.low_water = self.low_water, len(self)
+        return low_water
+
+    def to_records(self, start=0, stop=None):
+        stop = len(self) if stop is None else stop
+        records = numpy.zeros(stop - start, dtype=CLAIM_DTYPE)
+        records['block'] = self.block[start:stop]
+        records['transaction_index'] = self.transaction_index[start:stop]
+        records['log_index'] = self.log_index[start:stop]
+        records['recipient'] = self.recipient[start:stop]
+        records['amount'] = split_words(self.amount[start:stop])
+        return records
+
+    def extend(self, records, recipients=()):
+        for address in recipients:
+            self.recipient_id(address)
+        self.block.extend(records['block'].tolist())
+        self.transaction_index.extend(records['transaction_index'].tolist())
+        self.log_index.extend(records['log_index'].tolist())
+        self.recipient.extend(records['recipient'].tolist())
+        self.amount.extend(join_words(records['amount']))
+
+    @classmethod
+    def from_records(cls, records, recipients):
+        store = cls()
+        store.extend(records, recipients)
+        store.low_water = len(store)
+        return store
@@ -0,0 +1,107 @@
+from bisect import bisect_right
+from collections import deque
+import gevent.queue
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class StatusStream:
+    """Per-block status changes of one auction, pushed to Server-Sent Events subscribers.
+
+    On every new block of the poller one diff is built and encoded, and the
+    same message is queued for every subscriber. A diff holds the new block
+    number and timestamp, the status values that changed and the bids added
+    since the previous diff. `bids_from` is the index of the first of those
+    bids; after a chain reorganization dropped bids it is lower than the
+    number of bids the client has, and the client drops the ones past it.
+    """
+
+    def __init__(self, poller, sampler, history=64, queue_size=64, keepalive=15):
+        self.poller = poller
+        self.sampler = sampler
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self.subscribers = set()
+        # (block number, message) of the latest diffs, replayed to reconnecting clients
+        self.history = deque(maxlen=history)
+        self.values = {}
+        self.bid_count = sampler.view.bid_count
+        self.last_bid = self.bid_key(self.bid_count - 1)
+        poller.listeners.append(self.on_block)
+
+    def status_values(self, snapshot, view):
+        return {
+            'auction_stage': snapshot['stage'],
+            'price': snapshot['price'],
+            'raised_eth': snapshot['wallet_balance'],
+            'claimed_tokens': view.claimed,
+            'final_price': view.auction.get('final_price'),
+            'start_time': view.auction.get('auction_start_time'),
+            'end_time': view.auction.get('auction_end_time')
+        }
+
+    def diff(self, snapshot):
+        view = self.sampler.view
+        values = self.status_values(snapshot, view)
+        changed = {key: value for key, value in values.items()
+                   if key not in self.values or self.values[key] != value}
+        self.values = values
+        bids = self.sampler.bids
+        bid_count = min(view.bid_count, len(bids))
+        bids_from = self.bid_count
+        if self.bid_key(bids_from - 1) != self.last_bid:
+            # bids were rolled back: resend those of the blocks that can still change
+            unconfirmed = snapshot['block']['number'] - self.sampler.confirmations
+            bids_from = min(bids_from, bisect_right(bids.block, unconfirmed, 0, bid_count))
+        self.bid_count = bid_count
+        self.last_bid = self.bid_key(self.bid_count - 1)
+        return {
+            'block': snapshot['block']['number'],
+            'timestamp': snapshot['timestamp'],
+            'status': changed,
+            'bids_from': bids_from,
+            'bids': [[bids.block[i], bids.senders[bids.sender[i]], bids.amount[i],
+                      bids.missing_funds[i]] for i in range(bids_from, bid_count)]
+        }
+
+    def bid_key(self, row):
+        # a replaced block may hold another bid at the same position
+        bids = self.sampler.bids
+        if row < 0 or row >= len(bids):
+            return None
+        return (bids.block[row], bids.transaction_index[row], bids.log_index[row],
+                bids.sender[row], bids.amount[row])
+
+    def on_block(self, snapshot):
+        block = snapshot['block']['number']
+        message = ('id: %d\nevent: status\ndata: %s\n\n'
+                   % (block, json.dumps(self.diff(snapshot)))).encode()
+        self.history.append((block, message))
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(message)
+            except gevent.queue.Full:
+                # a client that does not keep up is dropped, it reconnects with Last-Event-ID
+                log.warning('dropping slow status stream subscriber')
+                self.subscribers.discard(queue)
+
+    def subscribe(self, last_block=None):
+        """Generator of the messages of a subscriber, starting after `last_block`."""
+        missed = []
+        if last_block is not None:
+            missed = [message for block, message in self.history if block > last_block]
+        # room for the missed messages on top of those to come
+        queue = gevent.queue.Queue(self.queue_size + len(missed))
+        for message in missed:
+            queue.put_nowait(message)
+        self.subscribers.add(queue)
+        try:
+            while queue in self.subscribers:
+                try:
+                    yield queue.get(timeout=self.keepalive)
+                except gevent.queue.Empty:
+                    yield b': keepalive\n\n'
+        finally:
+            self.subscribers.discard(queue)
@@ -0,0 +1,72 @@
+from gevent.event import AsyncResult
+from gevent.pool import Pool
+
+import gevent
+import logging
+
+from deploy.transport import batch_request
+from event_sampler.metrics import CACHE_LOOKUPS
+
+log = logging.getLogger(__name__)
+
+
+class BlockTimestampResolver:
+    """Fetches block timestamps using batched `eth_getBlockByNumber` requests.
+
+    Blocks are fetched in JSON-RPC batches of `batch_size`, at most
+    `concurrency` batches at a time. Concurrent requests for a block that is
+    already being fetched wait for the same result instead of asking again.
+    The resolver keeps no timestamps once they are fetched: callers store them
+    in their own `block_to_timestamp` and only ask for the blocks missing there.
+    """
+
+    def __init__(self, web3, batch_size=100, concurrency=4):
+        self.web3 = web3
+        self.batch_size = batch_size
+        self.pool = Pool(concurrency)
+        # block number -> AsyncResult of the timestamp being fetched
+        self.pending = {}
+
+    def get(self, block_number):
+        return self.resolve([block_number])[block_number]
+
+    def request(self, block_numbers, callback=None):
+        """Fetch timestamps in the background; `callback` gets the resolved dict."""
+        def resolve():
+            timestamps = self.resolve(block_numbers)
+            if callback is not None:
+                callback(timestamps)
+        return gevent.spawn(resolve)
+
+    def resolve(self, block_numbers):
+        """block -> timestamp of `block_numbers`, None for blocks the node doesn't know."""
+        results = {}
+        missing = []
+        for block in set(block_numbers):
+            if block not in self.pending:
+                self.pending[block] = AsyncResult()
+                missing.append(block)
+            results[block] = self.pending[block]
+        missing.sort()
+        CACHE_LOOKUPS.inc(len(results) - len(missing), cache='timestamp_resolver', result='hit')
+        CACHE_LOOKUPS.inc(len(missing), cache='timestamp_resolver', result='miss')
+        for i in range(0, len(missing), self.batch_size):
+            self.pool.spawn(self.fetch, missing[i:i + self.batch_size])
+        return {block: result.get() for block, result in results.items()}
+
+    def fetch(self, block_numbers):
+        try:
+            blocks = self.get_blocks(block_numbers)
+        except Exception as e:
+            log.warning('fetching timestamps of %d blocks failed: %s' % (len(block_numbers), e))
+            for block in block_numbers:
+                self.pending.pop(block).set_exception(e)
+            return
+        for block_number, block in zip(block_numbers, blocks):
+            # unknown blocks (not mined yet or orphaned) have no timestamp
+            timestamp = int(block['timestamp'], 16) if block is not None else None
+            self.pending.pop(block_number).set(timestamp)
+
+    def get_blocks(self, block_numbers):
+        requests = [('eth_getBlockByNumber', [hex(block), False]) for block in block_numbers]
+        return batch_request(self.web3, requests)
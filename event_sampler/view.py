@@ -0,0 +1,38 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+
+class SamplerView(namedtuple('SamplerView', [
+        'block', 'timestamp', 'final_block', 'total', 'claimed', 'auction', 'histogram',
+        'bid_count', 'claim_count'])):
+    """Immutable state of a sampler after processing all logs up to `block`.
+
+    `timestamp` is that of `block`, None when the sampler does not know it.
+
+    The sampler builds a new view after each batch of logs and publishes it by
+    replacing `EventSampler.view`. Readers take the reference once and use
+    only that object, so they need no lock and all the values they use come
+    from the same block. `histogram` is a frozen TimeHistogram. The bid and
+    claim stores are append-only outside of reorganizations, so the rows
+    below `bid_count` and `claim_count` are those of the view; readers clamp
+    the counts to the store length in case a rollback dropped rows since.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_sampler(cls, sampler):
+        state = sampler.state
+        block, timestamp = sampler.synced_timestamp
+        if block != state.synced_block:
+            timestamp = state.block_to_timestamp.get(state.synced_block)
+        return cls(
+            block=state.synced_block,
+            timestamp=timestamp,
+            final_block=min(state.synced_block, sampler.head - sampler.confirmations),
+            total=sampler.total,
+            claimed=state.total_claimed,
+            auction=MappingProxyType(dict(state.auction)),
+            histogram=sampler.histogram.freeze(),
+            bid_count=len(sampler.bids),
+            claim_count=len(state.claims)
+        )
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the tests import the repository's packages (deploy, event_sampler) along with
+# the helper modules of this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,198 @@
+"""
+In-memory node answering the JSON-RPC requests of the sampler and deploy tools.
+
+`FakeNode` is a web3 provider: `Web3(FakeNode())` talks to it like to a
+node, without a chain. Blocks are mined with `mine()`, logs added to the
+next block with `add_log()`, and `reorg(block)` replaces the blocks from
+`block` on, reporting the logs of the old ones as removed to the filters
+unless `report_removed` is unset.
+Every request is recorded in `requests`; `errors` maps a method to a
+function of the params returning an error message, or None to answer.
+`FakeSession` serves a FakeNode to an RPCTransport over fake HTTP.
+"""
+import json
+
+import gevent
+import requests
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+GENESIS_TIMESTAMP = 1500000000
+BLOCK_TIME = 15
+
+
+def block_hash(number, fork):
+    return '0x%032x%032x' % (fork, number)
+
+
+class FakeNode(BaseProvider):
+    def __init__(self):
+        # fork of each block, changed by reorg()
+        self.forks = [0]
+        self.fork = 0
+        # block number -> raw logs
+        self.logs = {}
+        self.next_logs = []
+        self.filters = {}
+        self.filter_count = 0
+        self.requests = []
+        self.errors = {}
+        # whether reorg() reports the logs of the replaced blocks to the filters
+        self.report_removed = True
+
+    @property
+    def head(self):
+        return len(self.forks) - 1
+
+    def web3(self):
+        return Web3(self)
+
+    def block(self, number):
+        if number > self.head:
+            return None
+        return {
+            'number': hex(number),
+            'hash': block_hash(number, self.forks[number]),
+            'timestamp': hex(GENESIS_TIMESTAMP + BLOCK_TIME * number)
+        }
+
+    def add_log(self, address, topics, data='0x'):
+        """Add a log to the block mined next."""
+        self.next_logs.append({'address': address, 'topics': list(topics), 'data': data})
+
+    def mine(self, count=1):
+        for _ in range(count):
+            self.forks.append(self.fork)
+            number = self.head
+            logs = []
+            for i, entry in enumerate(self.next_logs):
+                logs.append(dict(entry,
+                                 blockNumber=hex(number),
+                                 blockHash=block_hash(number, self.fork),
+                                 transactionHash='0x%032x%032x' % (number, i),
+                                 transactionIndex=hex(i),
+                                 logIndex=hex(i),
+                                 removed=False))
+            self.next_logs = []
+            self.logs[number] = logs
+            for changes in self.filters.values():
+                changes['changes'].extend(e for e in logs if self.matches(changes['params'], e))
+        return self.head
+
+    def reorg(self, block):
+        """Drop the blocks from `block` on; the next mined blocks are of a new fork."""
+        self.fork += 1
+        for number in range(block, self.head + 1):
+            removed = [dict(e, removed=True) for e in self.logs.pop(number, [])]
+            if not self.report_removed:
+                continue
+            for changes in self.filters.values():
+                changes['changes'].extend(e for e in removed
+                                          if self.matches(changes['params'], e))
+        del self.forks[block:]
+
+    def matches(self, params, entry):
+        addresses = params.get('address')
+        if addresses is not None:
+            if isinstance(addresses, str):
+                addresses = [addresses]
+            if entry['address'].lower() not in [a.lower() for a in addresses]:
+                return False
+        for accepted, topic in zip(params.get('topics') or [], entry['topics']):
+            if accepted is None:
+                continue
+            if isinstance(accepted, str):
+                accepted = [accepted]
+            if topic not in accepted:
+                return False
+        return True
+
+    def block_number(self, value, default):
+        if value is None:
+            return default
+        if value == 'latest':
+            return self.head
+        if value == 'earliest':
+            return 0
+        return int(value, 16) if isinstance(value, str) else value
+
+    def get_logs(self, params):
+        from_block = self.block_number(params.get('fromBlock'), self.head)
+        to_block = self.block_number(params.get('toBlock'), self.head)
+        return [entry for number in range(from_block, min(to_block, self.head) + 1)
+                for entry in self.logs.get(number, []) if self.matches(params, entry)]
+
+    def make_request(self, method, params):
+        self.requests.append((method, params))
+        if method in self.errors:
+            error = self.errors[method](params)
+            if error is not None:
+                return {'jsonrpc': '2.0', 'id': 0, 'error': {'code': -32000, 'message': error}}
+        return {'jsonrpc': '2.0', 'id': 0, 'result': self.answer(method, params)}
+
+    def answer(self, method, params):
+        if method == 'eth_blockNumber':
+            return hex(self.head)
+        if method == 'net_version':
+            return '1'
+        if method == 'eth_getBlockByNumber':
+            return self.block(self.block_number(params[0], self.head))
+        if method == 'eth_getLogs':
+            return self.get_logs(params[0])
+        if method == 'eth_newFilter':
+            self.filter_count += 1
+            filter_id = hex(self.filter_count)
+            self.filters[filter_id] = {'params': params[0], 'changes': []}
+            return filter_id
+        if method == 'eth_getFilterChanges':
+            changes = self.filters[params[0]]['changes']
+            self.filters[params[0]]['changes'] = []
+            return changes
+        if method == 'eth_getFilterLogs':
+            return self.get_logs(self.filters[params[0]]['params'])
+        if method in ('eth_call', 'eth_getBalance'):
+            # the block whose state was read
+            return hex(self.block_number(params[-1], self.head))
+        if method == 'eth_uninstallFilter':
+            return self.filters.pop(params[0], None) is not None
+        raise ValueError('unsupported method %s' % method)
+
+    def count(self, method):
+        return sum(1 for m, _ in self.requests if m == method)
+
+
+class FakeSession:
+    """requests.Session answering from a FakeNode, failing as scripted in `failures`.
+
+    A failure is an exception to raise or an HTTP status to answer with.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.failures = []
+        self.posts = []
+        self.delay = 0
+
+    def post(self, url, data=None, **kwargs):
+        payload = json.loads(data.decode())
+        self.posts.append(payload)
+        if self.delay:
+            gevent.sleep(self.delay)
+        response = requests.Response()
+        response.url = url
+        if len(self.failures) > 0:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            response.status_code = failure
+            response._content = b''
+            return response
+        if isinstance(payload, list):
+            result = [dict(self.node.make_request(item['method'], item['params']),
+                           id=item['id']) for item in payload]
+        else:
+            result = dict(self.node.make_request(payload['method'], payload['params']),
+                          id=payload['id'])
+        response.status_code = 200
+        response._content = json.dumps(result).encode()
+        return response
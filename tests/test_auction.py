@@ -7,7 +7,6 @@ from web3.utils.compat import (
     Timeout,
 )
 from utils import (
-    elapsed_at_price,
     check_succesful_tx
 )
 from fixtures import (
@@ -0,0 +1,60 @@
+import pytest
+from event_sampler.backfill import LogBackfill
+from fake_node import FakeNode
+
+ADDRESS = '0x' + '11' * 20
+OTHER_ADDRESS = '0x' + '22' * 20
+TOPIC = '0x' + '33' * 32
+
+
+@pytest.fixture()
+def node():
+    node = FakeNode()
+    for block in range(1, 1001):
+        for _ in range(block % 3):
+            node.add_log(ADDRESS, [TOPIC])
+        if block % 10 == 0:
+            node.add_log(OTHER_ADDRESS, [TOPIC])
+        node.mine()
+    return node
+
+
+def ranges(node):
+    return [(int(params[0]['fromBlock'], 16), int(params[0]['toBlock'], 16))
+            for method, params in node.requests if method == 'eth_getLogs']
+
+
+def test_chunks(node):
+    backfill = LogBackfill(node.web3(), chunk_size=300, concurrency=3)
+    logs = backfill.get_logs({'address': ADDRESS, 'topics': [[TOPIC]]}, 1)
+    assert [(e['blockNumber'], e['logIndex']) for e in logs] == \
+        [(block, i) for block in range(1, 1001) for i in range(block % 3)]
+    # chunks end at multiples of the chunk size, whatever the first block
+    assert sorted(ranges(node)) == [(1, 299), (300, 599), (600, 899), (900, 1000)]
+
+
+def test_split_on_result_size_error(node):
+    def too_many(params):
+        from_block = int(params[0]['fromBlock'], 16)
+        to_block = int(params[0]['toBlock'], 16)
+        if to_block - from_block + 1 > 100:
+            return 'query returned more than 10000 results'
+    node.errors['eth_getLogs'] = too_many
+    backfill = LogBackfill(node.web3(), chunk_size=400, concurrency=1)
+    logs = backfill.get_logs({'address': ADDRESS, 'topics': [[TOPIC]]}, 1, 1000)
+
+    assert [(e['blockNumber'], e['logIndex']) for e in logs] == \
+        [(block, i) for block in range(1, 1001) for i in range(block % 3)]
+    # 400 -> 200 -> 100 blocks, then the following chunks start at the smaller size
+    assert backfill.chunk_size == 100
+    answered = [(a, b) for a, b in ranges(node) if b - a + 1 <= 100]
+    assert sorted(answered) == \
+        [(1, 99)] + [(a, a + 99) for a in range(100, 1000, 100)] + [(1000, 1000)]
+
+
+def test_other_errors_are_raised(node):
+    node.errors['eth_getLogs'] = lambda params: 'invalid argument'
+    backfill = LogBackfill(node.web3(), chunk_size=400)
+    with pytest.raises(ValueError):
+        backfill.get_logs({'address': ADDRESS}, 1, 1000)
+    assert all((b + 1) % 400 == 0 or b == 1000 for a, b in ranges(node))
@@ -0,0 +1,143 @@
+import pytest
+from web3 import Web3
+from deploy.transport import RPCTransport
+from event_sampler.backfill import LogBackfill
+from fake_node import FakeNode, FakeSession
+
+ADDRESS = '0x' + '11' * 20
+TOPIC = '0x' + '33' * 32
+SEGMENT = 100
+
+
+@pytest.fixture()
+def node():
+    node = FakeNode()
+    for block in range(1, 351):
+        if block % 5 == 0:
+            node.add_log(ADDRESS, [TOPIC])
+        node.mine()
+    return node
+
+
+@pytest.fixture(autouse=True)
+def segment(monkeypatch):
+    monkeypatch.setattr('deploy.cache.LOGS_SEGMENT', SEGMENT)
+
+
+def make_transport(node, path):
+    transport = RPCTransport('http://localhost:8545', backoff=0, chain_cache=str(path))
+    transport.session = FakeSession(node)
+    return transport
+
+
+def posted(transport, method):
+    return [payload['params'] for payload in transport.session.posts
+            if isinstance(payload, dict) and payload['method'] == method]
+
+
+def logs_params(from_block, to_block):
+    return [{'address': ADDRESS, 'topics': [TOPIC], 'fromBlock': hex(from_block),
+             'toBlock': hex(to_block)}]
+
+
+def posted_ranges(transport):
+    return [(int(params[0]['fromBlock'], 16), int(params[0]['toBlock'], 16))
+            for params in posted(transport, 'eth_getLogs')]
+
+
+class CountingDB:
+    """sqlite3 connection counting its commits."""
+
+    def __init__(self, db):
+        self.db = db
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+        self.db.commit()
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+def test_final_blocks(node, tmp_path):
+    transport = make_transport(node, tmp_path / 'chain.db')
+    # the final block is 350 - 12
+    for number in (338, 339, 400):
+        for _ in range(2):
+            transport.make_request('eth_getBlockByNumber', [hex(number), False])
+    # the final block is cached, the recent and unknown ones are not
+    assert posted(transport, 'eth_getBlockByNumber')[1:] == \
+        [[hex(338), False], [hex(339), False], [hex(339), False], [hex(400), False],
+         [hex(400), False]]
+    assert transport.stats['eth_getBlockByNumber'][3] == 1
+
+    # stored across runs
+    transport = make_transport(node, tmp_path / 'chain.db')
+    assert transport.make_request('eth_getBlockByNumber', [hex(338), False])['result'] == \
+        node.block(338)
+    assert posted(transport, 'eth_getBlockByNumber') == [['0x0', False]]
+
+    # a different chain doesn't see the results
+    other = FakeNode()
+    other.forks = [1]
+    other.fork = 1
+    other.mine(350)
+    transport = make_transport(other, tmp_path / 'chain.db')
+    assert transport.make_request('eth_getBlockByNumber', [hex(338), False])['result'] == \
+        other.block(338)
+    assert len(posted(transport, 'eth_getBlockByNumber')) == 2
+
+
+def test_logs_segments(node, tmp_path):
+    transport = make_transport(node, tmp_path / 'chain.db')
+    logs = transport.make_request('eth_getLogs', logs_params(0, 338))['result']
+    assert logs == node.get_logs(logs_params(0, 338)[0])
+    assert posted_ranges(transport) == [(0, 99), (100, 199), (200, 299), (300, 338)]
+
+    # another run: ranges within cached segments are not asked again
+    transport = make_transport(node, tmp_path / 'chain.db')
+    assert transport.make_request('eth_getLogs', logs_params(50, 320))['result'] == \
+        node.get_logs(logs_params(50, 320)[0])
+    assert transport.make_request('eth_getLogs', logs_params(120, 150))['result'] == \
+        node.get_logs(logs_params(120, 150)[0])
+    # the segment of 300-399 was cached only up to 338
+    assert posted_ranges(transport) == [(300, 320)]
+
+    # not final: asked every time
+    for _ in range(2):
+        assert transport.make_request('eth_getLogs', logs_params(200, 350))['result'] == \
+            node.get_logs(logs_params(200, 350)[0])
+    assert posted_ranges(transport) == [(300, 320), (300, 350), (300, 350)]
+
+
+def test_one_commit_per_batch(node, tmp_path):
+    transport = make_transport(node, tmp_path / 'chain.db')
+    cache = transport.chain_cache
+    cache.open()
+    cache.db = CountingDB(cache.db)
+    transport.make_request('eth_getLogs', logs_params(0, 338))
+    assert cache.db.commits == 1
+    transport.batch([('eth_getBlockByNumber', [hex(number), False]) for number in (1, 2, 345)])
+    assert cache.db.commits == 2
+    # nothing to store: no commit
+    transport.batch([('eth_getBlockByNumber', [hex(number), False]) for number in (1, 345)])
+    assert cache.db.commits == 2
+
+
+def test_backfill_reuses_segments(node, tmp_path):
+    transport = make_transport(node, tmp_path / 'chain.db')
+    backfill = LogBackfill(Web3(transport), chunk_size=SEGMENT)
+    filter_params = {'address': ADDRESS, 'topics': [TOPIC]}
+    logs = backfill.get_logs(filter_params, 10)
+    assert [e['blockNumber'] for e in logs] == list(range(10, 351, 5))
+    assert sorted(posted_ranges(transport)) == [(10, 99), (100, 199), (200, 299), (300, 350)]
+
+    # a later run asks again the segment that was not final, and the first
+    # chunk, which was cached from block 10 only
+    node.mine(100)
+    transport = make_transport(node, tmp_path / 'chain.db')
+    backfill = LogBackfill(Web3(transport), chunk_size=SEGMENT)
+    logs = backfill.get_logs(filter_params, 50)
+    assert [e['blockNumber'] for e in logs] == list(range(50, 351, 5))
+    assert sorted(posted_ranges(transport)) == [(50, 99), (300, 399), (400, 450)]
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+from eth_abi import encode_abi, encode_single
+from eth_utils import encode_hex
+from web3.utils.events import get_event_data
+
+from deploy.decoder import DecoderRegistry, EventDecoder
+
+EVENT_ABI = {
+    'type': 'event',
+    'name': 'Transfer',
+    'anonymous': False,
+    'inputs': [
+        {'name': '_from', 'type': 'address', 'indexed': True},
+        {'name': '_value', 'type': 'uint256', 'indexed': False},
+        {'name': '_delta', 'type': 'int128', 'indexed': True},
+        {'name': '_ok', 'type': 'bool', 'indexed': False},
+        {'name': '_id', 'type': 'bytes8', 'indexed': False},
+        {'name': '_change', 'type': 'int256', 'indexed': False}
+    ]
+}
+ARRAY_EVENT_ABI = {
+    'type': 'event',
+    'name': 'Batch',
+    'anonymous': False,
+    'inputs': [
+        {'name': '_sender', 'type': 'address', 'indexed': True},
+        {'name': '_amounts', 'type': 'uint256[]', 'indexed': False},
+        {'name': '_pair', 'type': 'uint256[2]', 'indexed': False}
+    ]
+}
+
+
+def make_log(decoder, args):
+    """Raw log of the event of `decoder` with the argument values `args`."""
+    inputs = decoder.abi['inputs']
+    topics = [decoder.topic]
+    topics += [encode_hex(encode_single(i['type'], args[i['name']]))
+               for i in inputs if i['indexed']]
+    data = [i for i in inputs if not i['indexed']]
+    return {
+        'address': '0x' + '12' * 20,
+        'blockNumber': 1,
+        'blockHash': '0x' + '00' * 32,
+        'transactionIndex': 0,
+        'transactionHash': '0x' + '00' * 32,
+        'logIndex': 0,
+        'topics': topics,
+        'data': encode_hex(encode_abi([i['type'] for i in data],
+                                      [args[i['name']] for i in data]))
+    }
+
+
+def random_args(rng):
+    return {
+        '_from': '0x%040x' % rng.getrandbits(160),
+        '_value': rng.choice([0, 1, 2 ** 256 - 1, rng.getrandbits(256)]),
+        '_delta': rng.choice([-2 ** 127, -1, 0, 2 ** 127 - 1, rng.getrandbits(126)]),
+        '_ok': rng.random() < 0.5,
+        '_id': bytes(rng.getrandbits(8) for _ in range(8)),
+        '_change': rng.choice([-2 ** 255, -1, 2 ** 255 - 1, -rng.getrandbits(254)])
+    }
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_decoder_parity(lazy):
+    decoder = EventDecoder(EVENT_ABI)
+    assert decoder.compiled
+    rng = random.Random(0)
+    for _ in range(50):
+        log = make_log(decoder, random_args(rng))
+        expected = dict(get_event_data(EVENT_ABI, log)['args'])
+        decoded = decoder.decode(dict(log), lazy)
+        assert decoded['event'] == 'Transfer'
+        assert dict(decoded['args']) == expected
+
+
+def test_array_arguments():
+    registry = DecoderRegistry([EVENT_ABI, ARRAY_EVENT_ABI], lazy=True)
+    decoder = registry['Batch']
+    assert decoder.compiled is False
+    args = {'_sender': '0x' + 'ab' * 20, '_amounts': [1, 2 ** 200, 3], '_pair': [4, 5]}
+    log = make_log(decoder, args)
+    expected = dict(get_event_data(ARRAY_EVENT_ABI, log)['args'])
+    decoded = registry.decode(dict(log))
+    assert dict(decoded['args']) == expected
+    assert list(decoded['args']['_amounts']) == args['_amounts']
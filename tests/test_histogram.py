@@ -0,0 +1,111 @@
+import random
+
+import pytest
+from event_sampler.histogram import TimeHistogram
+
+
+def brute_force_slots(bids, resolution):
+    origin = min(timestamp for timestamp, _ in bids)
+    origin -= origin % resolution
+    slots = {}
+    for timestamp, amount in bids:
+        slot = (timestamp - origin) // resolution
+        slots[slot] = slots.get(slot, 0) + amount
+    return origin, [slots.get(slot, 0) for slot in range(max(slots) + 1)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_histogram_sums(seed):
+    rng = random.Random(seed)
+    resolution = rng.choice([1, 15, 60])
+    histogram = TimeHistogram(resolution)
+    bids = []
+    for _ in range(300):
+        # mostly increasing timestamps, some older ones that move the origin
+        timestamp = 1500000000 + rng.randint(-2000, 20000)
+        amount = rng.randint(1, 10 ** 20)
+        bids.append((timestamp, amount))
+        histogram.add(timestamp, amount)
+        if rng.random() < 0.1:
+            # rolled back bid
+            timestamp, amount = bids.pop(rng.randrange(len(bids)))
+            histogram.remove(timestamp, amount)
+
+    origin, slots = brute_force_slots(bids, resolution)
+    assert histogram.total == sum(slots)
+    # the bounds follow the remaining bids, to the slot
+    first = min(timestamp for timestamp, _ in bids)
+    last = max(timestamp for timestamp, _ in bids)
+    assert histogram.slot(histogram.first_timestamp) == histogram.slot(first)
+    assert histogram.slot(histogram.last_timestamp) == histogram.slot(last)
+    # a removed bid can leave empty slots before the first one still in the histogram
+    shift = (origin - histogram.origin) // resolution
+    slots = [0] * shift + slots
+    prefix_sums = [0]
+    for amount in slots:
+        prefix_sums.append(prefix_sums[-1] + amount)
+    for _ in range(2000):
+        start = rng.randint(0, len(slots))
+        end = rng.randint(start, len(slots))
+        assert histogram.range_sum(start, end) == prefix_sums[end] - prefix_sums[start]
+
+    frozen = histogram.freeze()
+    assert frozen.range_sum(0, len(slots)) == sum(slots)
+    assert histogram.freeze() is frozen
+    histogram.add(bids[0][0], 1)
+    assert histogram.freeze() is not frozen
+
+
+def test_histogram_bins():
+    histogram = TimeHistogram(15)
+    bids = [(1000 + 15 * i, i) for i in range(100)]
+    for timestamp, amount in bids:
+        histogram.add(timestamp, amount)
+    for num_bins in (1, 3, 7, 100, 1000):
+        timestamps, sums = histogram.histogram(num_bins)
+        assert len(timestamps) == len(sums) + 1
+        assert sum(sums) == histogram.total
+        for i, bin_sum in enumerate(sums):
+            assert bin_sum == sum(amount for timestamp, amount in bids
+                                  if timestamps[i] <= timestamp < timestamps[i + 1])
+
+
+def test_removed_bounds():
+    histogram = TimeHistogram(15)
+    bids = [(1000 + 15 * i, 10 + i) for i in range(100)]
+    for timestamp, amount in bids:
+        histogram.add(timestamp, amount)
+    # rolled back bids at both ends
+    for timestamp, amount in bids[:5] + bids[-20:]:
+        histogram.remove(timestamp, amount)
+    timestamps, sums = histogram.histogram(5)
+    # bin edges are slot edges: the slots of the first and the last remaining bid
+    assert timestamps[0] == bids[5][0] - bids[5][0] % 15
+    assert timestamps[-1] == bids[-21][0] - bids[-21][0] % 15 + 15
+    assert sum(sums) == sum(amount for _, amount in bids[5:-20])
+
+    for timestamp, amount in bids[5:-20]:
+        histogram.remove(timestamp, amount)
+    assert histogram.first_timestamp is None
+    assert histogram.last_timestamp is None
+    assert histogram.histogram(5) == ([], [])
+    histogram.add(2000, 7)
+    assert histogram.histogram(5) == ([1995, 2010], [7])
+
+
+def test_freeze_copies_changed_chunks():
+    histogram = TimeHistogram(1)
+    for timestamp in range(0, 10000, 3):
+        histogram.add(timestamp, timestamp + 1)
+    frozen = histogram.freeze()
+    total = frozen.range_sum(0, 10000)
+    histogram.add(5000, 100)
+    histogram.add(20000, 100)
+    # the frozen copy still has the old amounts
+    assert frozen.range_sum(0, 10000) == total
+    assert frozen.range_sum(0, 10000) + 100 == histogram.range_sum(0, 10000)
+    assert histogram.range_sum(0, 20001) == total + 200
+    # only the changed chunks of the base level were copied
+    shared = [a is b for a, b in zip(histogram.levels[0], frozen.levels[0])]
+    assert len(shared) == len(frozen.levels[0])
+    assert shared.count(False) == 1
@@ -0,0 +1,91 @@
+import pytest
+from deploy.hub import LogHub
+from fake_node import FakeNode
+
+TOPIC_A = '0x' + 'a1' * 32
+TOPIC_B = '0x' + 'b2' * 32
+ADDRESS_A = '0x' + 'aa' * 20
+ADDRESS_B = '0x' + 'bb' * 20
+
+
+@pytest.fixture()
+def node():
+    return FakeNode()
+
+
+@pytest.fixture()
+def web3(node):
+    return node.web3()
+
+
+@pytest.fixture()
+def hub(web3):
+    # polled by the tests
+    hub = LogHub(web3, poll_interval=3600)
+    yield hub
+    hub.stop()
+
+
+def mine_logs(node, count):
+    for i in range(count):
+        node.add_log(ADDRESS_A, [TOPIC_A])
+        node.add_log(ADDRESS_B, [TOPIC_B])
+        node.add_log(ADDRESS_B, [TOPIC_A])
+        node.mine()
+
+
+def test_union_query(node, hub):
+    received = {'a': [], 'b': []}
+    mine_logs(node, 3)
+    hub.subscribe(ADDRESS_A, [TOPIC_A], received['a'].append, from_block=2)
+    hub.subscribe(ADDRESS_B, [TOPIC_B], received['b'].append)
+    # the logs since from_block are read when subscribing
+    assert [e['blockNumber'] for e in received['a']] == [2, 3]
+    assert received['b'] == []
+
+    mine_logs(node, 4)
+    get_logs = node.count('eth_getLogs')
+    hub.poll()
+    # one query for both subscriptions, over the union of their addresses and topics
+    assert node.count('eth_getLogs') == get_logs + 1
+    params = node.requests[-1][1][0]
+    assert sorted(params['address']) == [ADDRESS_A, ADDRESS_B]
+    assert params['topics'] == [sorted([TOPIC_A, TOPIC_B])]
+    assert (params['fromBlock'], params['toBlock']) == (hex(4), hex(7))
+    assert [e['blockNumber'] for e in received['a']] == [2, 3, 4, 5, 6, 7]
+    assert [e['blockNumber'] for e in received['b']] == [4, 5, 6, 7]
+    assert all(e['address'] == ADDRESS_B and e['topics'] == [TOPIC_B] for e in received['b'])
+
+    # nothing new: no query
+    hub.poll()
+    assert node.count('eth_getLogs') == get_logs + 1
+
+
+def test_filter_fallback(node, hub):
+    node.errors['eth_getLogs'] = lambda params: 'the method eth_getLogs does not exist'
+    mine_logs(node, 2)
+    logs = hub.get_logs({'address': ADDRESS_A, 'topics': [TOPIC_A]}, 0, 'latest')
+    assert [e['blockNumber'] for e in logs] == [1, 2]
+    assert hub.get_logs_supported is False
+    assert node.count('eth_getFilterLogs') == 1
+    # the filter installed for the range is removed
+    assert node.filters == {}
+
+
+def test_transient_error(node, hub):
+    failures = [1]
+
+    def error(params):
+        if len(failures) > 0:
+            failures.pop()
+            return 'request timed out'
+    node.errors['eth_getLogs'] = error
+    mine_logs(node, 2)
+    with pytest.raises(ValueError):
+        hub.get_logs({'address': ADDRESS_A, 'topics': [TOPIC_A]}, 0, 'latest')
+    # still reading with eth_getLogs
+    assert hub.get_logs_supported is None
+    logs = hub.get_logs({'address': ADDRESS_A, 'topics': [TOPIC_A]}, 0, 'latest')
+    assert [e['blockNumber'] for e in logs] == [1, 2]
+    assert hub.get_logs_supported is True
+    assert node.count('eth_newFilter') == 0
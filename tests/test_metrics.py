@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+from flask import Flask
+from flask_restful import Api
+from event_sampler.metrics import (LAG_BLOCKS, LAG_SECONDS, Counter, Gauge, Histogram, collect,
+                                   expose)
+from event_sampler.resources import Metrics
+
+ADDRESS = '0x' + '11' * 20
+
+
+def test_exposition():
+    registry = []
+    calls = Counter('rpc_calls_total', 'Calls', registry=registry)
+    head = Gauge('head_block', 'Head', registry=registry)
+    latency = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1), registry=registry)
+    Counter('unused_total', 'Never incremented', registry=registry)
+    calls.inc(method='eth_getLogs', outcome='ok')
+    calls.inc(2, method='eth_call', outcome='ok')
+    head.set(12, auction='a"b\\c')
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, method='eth_call')
+
+    assert expose(registry) == '\n'.join([
+        '# HELP rpc_calls_total Calls',
+        '# TYPE rpc_calls_total counter',
+        'rpc_calls_total{method="eth_call",outcome="ok"} 2',
+        'rpc_calls_total{method="eth_getLogs",outcome="ok"} 1',
+        '# HELP head_block Head',
+        '# TYPE head_block gauge',
+        'head_block{auction="a\\"b\\\\c"} 12',
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{method="eth_call",le="0.1"} 1',
+        'latency_seconds_bucket{method="eth_call",le="1"} 2',
+        'latency_seconds_bucket{method="eth_call",le="+Inf"} 3',
+        'latency_seconds_sum{method="eth_call"} 5.55',
+        'latency_seconds_count{method="eth_call"} 3',
+        ''])
+
+
+def test_collected_series():
+    # the metrics of another process, e.g. the ingester of a REST worker
+    ingester = []
+    Counter('events_total', 'Events', registry=ingester).inc(5, event='BidSubmission')
+    collected = collect(ingester)
+
+    registry = []
+    events = Counter('events_total', 'Events', registry=registry)
+    assert 'events_total{event="BidSubmission"} 5' in expose(registry, collected)
+    # local series win
+    events.inc(event='BidSubmission')
+    events.inc(event='ClaimedTokens')
+    text = expose(registry, collected)
+    assert 'events_total{event="BidSubmission"} 1' in text
+    assert 'events_total{event="ClaimedTokens"} 1' in text
+
+
+def make_auction(head, synced, synced_timestamp):
+    snapshot = {'block': {'number': head}, 'timestamp': 1500000000 + 15 * head}
+    view = SimpleNamespace(block=synced, timestamp=synced_timestamp)
+    return {'poller': SimpleNamespace(snapshot=snapshot),
+            'sampler': SimpleNamespace(view=view)}
+
+
+def test_lag():
+    auctions = {ADDRESS: make_auction(100, 96, 1500000000 + 15 * 96)}
+    app = Flask(__name__)
+    Api(app).add_resource(Metrics, '/metrics', resource_class_kwargs={'auctions': auctions})
+    client = app.test_client()
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'event_sampler_lag_blocks{auction="%s"} 4' % ADDRESS in text
+    # time between the synced block and the head block, not since the head block
+    assert 'event_sampler_lag_seconds{auction="%s"} 60' % ADDRESS in text
+
+    auctions[ADDRESS] = make_auction(100, 100, 1500000000 + 15 * 100)
+    client.get('/metrics')
+    assert LAG_BLOCKS.values[(('auction', ADDRESS),)] == 0
+    assert LAG_SECONDS.values[(('auction', ADDRESS),)] == 0
@@ -0,0 +1,83 @@
+import numpy
+import pytest
+from deploy.price import (
+    AuctionPrice,
+    calc_token_price,
+    calc_token_prices,
+    elapsed_at_price
+)
+from fixtures import (
+    owner_index,
+    owner,
+    wallet_address,
+    whitelister_address,
+    contract_args,
+    contract_params,
+    create_contract,
+    get_token_contract,
+    token_contract,
+    auction_contract_fast_decline,
+    txnCost
+)
+
+
+# The local price model against the contract, across the auction
+def test_price_model(
+    web3,
+    owner,
+    auction_contract_fast_decline,
+    token_contract):
+    auction = auction_contract_fast_decline
+    token = token_contract(auction.address)
+    bidder = web3.eth.accounts[5]
+
+    auction.transact({'from': owner}).setup(token.address)
+    auction.transact({'from': owner}).startAuction()
+    model = AuctionPrice.from_contract(auction)
+    start_time = model.start_time
+
+    timestamps = []
+    prices = []
+    for elapsed in [1, 33, 600, 86400, 10 ** 7, 10 ** 10]:
+        timestamp = start_time + elapsed
+        web3.testing.timeTravel(timestamp)
+        price = auction.call().price()
+        assert model.price(timestamp) == price
+
+        if elapsed == 33:
+            missing_funds = auction.call().missingFundsToEndAuction()
+            auction.transact({'from': bidder, 'value': min(missing_funds // 10, 10 ** 18)}).bid()
+        received_wei = auction.call().received_wei()
+        assert model.missing_funds(timestamp, received_wei) == \
+            auction.call().missingFundsToEndAuction()
+
+        timestamps.append(timestamp)
+        prices.append(price)
+
+    # int64 arithmetic while elapsed ** price_exponent fits, Python ints past it
+    first_day = model.prices(timestamps[:4])
+    assert first_day.dtype == numpy.int64
+    assert first_day.tolist() == prices[:4]
+    all_prices = model.prices(timestamps)
+    assert all_prices.dtype == object
+    assert all_prices.tolist() == prices
+
+
+@pytest.mark.parametrize('args', [params['args'] for params in contract_args])
+def test_calc_token_prices(args):
+    for elapsed in [numpy.arange(0, 5000), numpy.arange(0, 10 ** 7, 9973),
+                    numpy.array([0, 1, 10 ** 10, 10 ** 15, 2 ** 62])]:
+        expected = [calc_token_price(*args, int(e)) for e in elapsed]
+        assert calc_token_prices(*args, elapsed).tolist() == expected
+
+
+@pytest.mark.parametrize('args', [params['args'] for params in contract_args])
+def test_elapsed_at_price(args):
+    price_start = args[0]
+    for price in [price_start, price_start - 1, price_start // 2, price_start // 100, 1]:
+        elapsed = elapsed_at_price(*args, price)
+        assert calc_token_price(*args, elapsed) <= price
+        if elapsed > 0:
+            assert calc_token_price(*args, elapsed - 1) > price
+    assert elapsed_at_price(*args, price_start + 1) == 0
+    assert elapsed_at_price(*args, -1) is None
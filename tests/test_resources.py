@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from flask_restful import Api
+from event_sampler.histogram import TimeHistogram
+from event_sampler.resources import AuctionEvents, AuctionExport, AuctionStatus, StatusCache
+from event_sampler.store import BidStore, ClaimStore
+from event_sampler.view import SamplerView
+
+ADDRESS = '0x' + '11' * 20
+SENDERS = ['0x' + '%02x' % i * 20 for i in (0xa1, 0xa2, 0xa3)]
+
+
+def make_view(block, bids, claims=None):
+    histogram = TimeHistogram()
+    for i in range(len(bids)):
+        histogram.add(1500000000 + 15 * bids.block[i], bids.amount[i])
+    claims = claims if claims is not None else ClaimStore()
+    return SamplerView(block=block, timestamp=1500000000 + 15 * block, final_block=block - 12,
+                       total=sum(bids.amount), claimed=sum(claims.amount), auction={},
+                       histogram=histogram.freeze(), bid_count=len(bids),
+                       claim_count=len(claims))
+
+
+def make_snapshot(number, total):
+    return {'block': {'number': number, 'hash': '0x%064x' % number}, 'stage': 2,
+            'price': 10 ** 18, 'wallet_balance': total, 'timestamp': 1500000000 + 15 * number}
+
+
+@pytest.fixture()
+def auction():
+    bids = BidStore()
+    for block in range(1, 50):
+        bids.add(block, 0, 1, SENDERS[block % 3], 10 ** 18 * block, 0)
+    claims = ClaimStore()
+    for block in range(52, 60, 2):
+        claims.add(block, 1, 0, SENDERS[block % 3], 10 ** 20 + block)
+    sampler = SimpleNamespace(bids=bids, state=SimpleNamespace(claims=claims),
+                              view=make_view(60, bids, claims))
+    # processed after the view was published: not served yet
+    bids.add(61, 0, 0, SENDERS[0], 1, 0)
+    claims.add(61, 2, 0, SENDERS[0], 1)
+    poller = SimpleNamespace(snapshot=make_snapshot(61, sampler.view.total))
+    return {'contract': SimpleNamespace(address=ADDRESS), 'sampler': sampler,
+            'poller': poller, 'cache': StatusCache(poller, sampler)}
+
+
+@pytest.fixture()
+def client(auction):
+    app = Flask(__name__)
+    api = Api(app)
+    auctions = {'auctions': {ADDRESS: auction}}
+    api.add_resource(AuctionStatus, '/status', '/auction/<string:address>/status',
+                     resource_class_kwargs=auctions)
+    api.add_resource(AuctionEvents, '/events', '/auction/<string:address>/events',
+                     resource_class_kwargs=auctions)
+    api.add_resource(AuctionExport, '/export', '/auction/<string:address>/export',
+                     resource_class_kwargs=auctions)
+    return app.test_client()
+
+
+def test_status_etag(client, auction):
+    response = client.get('/status?bins=10')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['histogram']['bin_sum']) == 10
+    assert sum(body['histogram']['bin_sum']) == auction['sampler'].view.total
+    etag = response.headers['ETag']
+
+    response = client.get('/auction/%s/status?bins=10' % ADDRESS,
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    # another number of bins is another response
+    assert client.get('/status?bins=5', headers={'If-None-Match': etag}).status_code == 200
+    assert len(auction['cache'].responses) == 2
+
+    # a new block drops the responses of the previous one
+    auction['poller'].snapshot = make_snapshot(62, auction['sampler'].view.total)
+    response = client.get('/status?bins=10', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(auction['cache'].responses) == 1
+
+
+@pytest.mark.parametrize('bins', [0, -1, 201, 10 ** 9])
+def test_status_bins_out_of_range(client, auction, bins):
+    response = client.get('/status?bins=%d' % bins)
+    assert response.status_code == 400
+    assert auction['cache'].responses == {}
+
+
+def test_events(client, auction):
+    body = client.get('/events').get_json()
+    assert (body['since_block'], body['synced_block'], body['final_block']) == (-1, 60, 48)
+    assert [bid[0] for bid in body['bids']] == list(range(1, 50))
+    assert body['bids'][2] == [3, 0, 1, SENDERS[0], 3 * 10 ** 18, 0]
+    assert body['claims'] == [[block, 1, 0, SENDERS[block % 3], 10 ** 20 + block]
+                              for block in range(52, 60, 2)]
+
+    # the next request asks from final_block on, the records after it may have changed
+    body = client.get('/auction/%s/events?since_block=48' % ADDRESS).get_json()
+    assert [bid[0] for bid in body['bids']] == [49]
+    assert [claim[0] for claim in body['claims']] == [52, 54, 56, 58]
+    body = client.get('/events?since_block=60').get_json()
+    assert (body['bids'], body['claims']) == ([], [])
+    assert client.get('/auction/0x%s/events' % ('22' * 20)).status_code == 404
+
+
+def test_export(client, auction):
+    response = client.get('/export')
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=bids.ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['block'] for row in rows] == list(range(1, 50))
+    assert rows[0] == {'block': 1, 'transaction_index': 0, 'log_index': 1,
+                       'sender': SENDERS[1], 'amount': 10 ** 18, 'missing_funds': 0}
+
+    response = client.get('/export?format=csv&from_block=10&to_block=20&address=%s'
+                          % SENDERS[2].upper().replace('0X', '0x'))
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['block', 'transaction_index', 'log_index', 'sender', 'amount',
+                       'missing_funds']
+    assert [int(row[0]) for row in rows[1:]] == [11, 14, 17, 20]
+    assert all(row[3] == SENDERS[2] for row in rows[1:])
+
+    # blocks after the view are not served
+    response = client.get('/export?kind=claims&format=csv&to_block=1000')
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['block', 'transaction_index', 'log_index', 'recipient', 'amount']
+    assert [int(row[0]) for row in rows[1:]] == [52, 54, 56, 58]
+    # an unknown address has no records
+    assert client.get('/export?address=0x%s' % ('33' * 20)).get_data() == b''
+    assert client.get('/export?format=xml').status_code == 400
@@ -0,0 +1,245 @@
+import os
+import random
+from types import SimpleNamespace
+
+import gevent
+import pytest
+from eth_abi import encode_abi
+from eth_utils import encode_hex
+from deploy.decoder import EventDecoder
+from event_sampler.feed import LogFeed
+from event_sampler.sampler import EventSampler
+from fake_node import BLOCK_TIME, GENESIS_TIMESTAMP, FakeNode
+
+ADDRESS = '0x' + 'aa' * 20
+
+
+def event_abi(name, inputs):
+    return {'type': 'event', 'name': name, 'anonymous': False,
+            'inputs': [{'name': n, 'type': t, 'indexed': i} for n, t, i in inputs]}
+
+
+AUCTION_ABI = [
+    event_abi('Deployed', [('_price_start', 'uint256', True), ('_price_constant', 'uint256', True),
+                           ('_price_exponent', 'uint32', True)]),
+    event_abi('AuctionStarted', [('_start_time', 'uint256', True),
+                                 ('_block_number', 'uint256', True)]),
+    event_abi('BidSubmission', [('_sender', 'address', True), ('_amount', 'uint256', False),
+                                ('_missing_funds', 'uint256', False)]),
+    event_abi('ClaimedTokens', [('_recipient', 'address', True),
+                                ('_sent_amount', 'uint256', False)]),
+    event_abi('AuctionEnded', [('_final_price', 'uint256', False)])
+]
+BID_TOPIC = EventDecoder(AUCTION_ABI[2]).topic
+CLAIM_TOPIC = EventDecoder(AUCTION_ABI[3]).topic
+END_TOPIC = EventDecoder(AUCTION_ABI[4]).topic
+
+
+def add_bid(node, sender, amount):
+    node.add_log(ADDRESS, [BID_TOPIC, '0x' + '00' * 12 + sender[2:]],
+                 encode_hex(encode_abi(['uint256', 'uint256'], [amount, 10 ** 24])))
+
+
+def add_claim(node, recipient, amount):
+    node.add_log(ADDRESS, [CLAIM_TOPIC, '0x' + '00' * 12 + recipient[2:]],
+                 encode_hex(encode_abi(['uint256'], [amount])))
+
+
+def add_end(node, final_price):
+    node.add_log(ADDRESS, [END_TOPIC], encode_hex(encode_abi(['uint256'], [final_price])))
+
+
+def mine_bids(node, blocks, amount):
+    """Mine `blocks` blocks with a bid of `amount` in every other one."""
+    for i in range(blocks):
+        if i % 2 == 0:
+            add_bid(node, '0x%040x' % (i + 1), amount)
+        node.mine()
+
+
+def chain_bids(node):
+    """Amounts of the bids on the chain."""
+    logs = node.get_logs({'fromBlock': 0, 'topics': [BID_TOPIC]})
+    return [int(entry['data'][2:66], 16) for entry in logs]
+
+
+class Samplers:
+    """Samplers of the auction on `node`, started like event_sampler.main does."""
+
+    def __init__(self, node, state_file):
+        self.node = node
+        self.state_file = state_file
+        self.started = []
+
+    def start(self, confirmations=5):
+        web3 = self.node.web3()
+        factory = web3.eth.contract(abi=AUCTION_ABI)
+        chain = SimpleNamespace(web3=web3, provider=SimpleNamespace(
+            get_contract_factory=lambda name: factory))
+        # polled by the tests
+        feed = LogFeed(web3, poll_interval=3600)
+        sampler = EventSampler(ADDRESS, chain, state_file_path=self.state_file,
+                               confirmations=confirmations, feed=feed)
+        feed.start()
+        self.started.append((feed, sampler))
+        return feed, sampler
+
+    def stop(self):
+        for feed, sampler in self.started:
+            feed.stop()
+            sampler.save_event.stop()
+            gevent.kill(feed.ev_poll)
+            gevent.kill(sampler.save_event.ev_save)
+        self.started = []
+
+
+@pytest.fixture()
+def samplers(tmpdir):
+    samplers = Samplers(FakeNode(), os.path.join(str(tmpdir), 'auction.state'))
+    yield samplers
+    samplers.stop()
+
+
+def check_totals(node, sampler):
+    # late bids are added to the histogram by greenlets
+    gevent.sleep(0.01)
+    bids = chain_bids(node)
+    assert sampler.total == sum(bids)
+    assert sampler.histogram.total == sum(bids)
+    assert list(sampler.bids.amount) == bids
+
+
+def test_sync_and_poll(samplers):
+    node = samplers.node
+    mine_bids(node, 20, 10)
+    feed, sampler = samplers.start()
+    check_totals(node, sampler)
+    assert sampler.view.block == node.head
+
+    mine_bids(node, 6, 100)
+    add_claim(node, '0x' + 'cc' * 20, 5)
+    node.mine()
+    feed.poll()
+    feed.poll()
+    check_totals(node, sampler)
+    assert sampler.view.block == node.head
+    assert sampler.view.timestamp == GENESIS_TIMESTAMP + BLOCK_TIME * node.head
+    assert sampler.state.total_claimed == 5
+
+
+def test_reorg_removed_logs(samplers):
+    node = samplers.node
+    mine_bids(node, 20, 10)
+    feed, sampler = samplers.start()
+    mine_bids(node, 4, 100)
+    feed.poll()
+    check_totals(node, sampler)
+
+    node.reorg(node.head - 3)
+    mine_bids(node, 5, 1000)
+    get_logs = node.count('eth_getLogs')
+    feed.poll()
+    check_totals(node, sampler)
+    # one resync for all the removed logs
+    assert node.count('eth_getLogs') == get_logs + 1
+    feed.poll()
+    check_totals(node, sampler)
+    assert sampler.view.block == node.head
+
+
+def test_reorg_without_removed_logs(samplers):
+    node = samplers.node
+    node.report_removed = False
+    mine_bids(node, 20, 10)
+    feed, sampler = samplers.start()
+    add_end(node, 3)
+    mine_bids(node, 3, 100)
+    feed.poll()
+    assert sampler.state.auction['final_price'] == 3
+
+    # the replaced blocks have no logs: only their hashes tell
+    node.reorg(node.head - 3)
+    node.mine(4)
+    feed.poll()
+    check_totals(node, sampler)
+    assert 'final_price' not in sampler.state.auction or \
+        sampler.state.auction['final_price'] is None
+
+
+def test_reorg_after_restart(samplers):
+    node = samplers.node
+    mine_bids(node, 20, 10)
+    feed, sampler = samplers.start()
+    add_bid(node, '0x' + 'bb' * 20, 1000)
+    node.mine()
+    add_claim(node, '0x' + 'cc' * 20, 7)
+    node.mine()
+    feed.poll()
+    feed.poll()
+    check_totals(node, sampler)
+    sampler.state.save()
+    samplers.stop()
+
+    # the last two blocks are replaced while the sampler is down
+    node.reorg(node.head - 1)
+    add_bid(node, '0x' + 'dd' * 20, 300)
+    node.mine(3)
+    feed, sampler = samplers.start()
+    check_totals(node, sampler)
+    assert sampler.state.total_claimed == 0
+    assert sampler.total == 10 * 10 + 300
+
+    # and again once running, for the blocks synced at startup
+    sampler.state.save()
+    samplers.stop()
+    feed, sampler = samplers.start()
+    node.reorg(node.head - 2)
+    add_bid(node, '0x' + 'ee' * 20, 40)
+    node.mine()
+    feed.poll()
+    check_totals(node, sampler)
+    assert sampler.total == 10 * 10 + 40
+
+
+def test_deep_reorg(samplers):
+    node = samplers.node
+    mine_bids(node, 20, 10)
+    feed, sampler = samplers.start(confirmations=3)
+    mine_bids(node, 10, 100)
+    feed.poll()
+    check_totals(node, sampler)
+
+    node.reorg(node.head - 8)
+    mine_bids(node, 10, 1000)
+    feed.poll()
+    # synced again from scratch
+    check_totals(node, sampler)
+    assert sampler.view.block == node.head
+
+
+def test_running_aggregates(samplers):
+    """The total, last bid and histogram kept as bids arrive match the bids on the chain."""
+    node = samplers.node
+    rng = random.Random(0)
+    mine_bids(node, 20, 10)
+    feed, sampler = samplers.start()
+    for step in range(30):
+        if step % 7 == 6:
+            node.reorg(node.head - rng.randint(0, 3))
+        for _ in range(rng.randint(1, 3)):
+            add_bid(node, '0x%040x' % rng.getrandbits(160), rng.randint(1, 10 ** 20))
+            node.mine(rng.randint(1, 2))
+        feed.poll()
+        check_totals(node, sampler)
+
+        logs = node.get_logs({'fromBlock': 0, 'topics': [BID_TOPIC]})
+        last = sampler.last_event()
+        assert (last['blockNumber'], last['logIndex']) == \
+            (int(logs[-1]['blockNumber'], 16), int(logs[-1]['logIndex'], 16))
+        timestamps = [GENESIS_TIMESTAMP + BLOCK_TIME * int(entry['blockNumber'], 16)
+                      for entry in logs]
+        edges, sums = sampler.histogram.histogram(7)
+        assert sum(sums) == sum(chain_bids(node))
+        for i, amount in enumerate(sums):
+            assert amount == sum(bid for bid, timestamp in zip(chain_bids(node), timestamps)
+                                 if edges[i] <= timestamp < edges[i + 1])
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+from event_sampler.sampler import EventSamplerState
+
+
+def bid(block, log_index, sender, amount):
+    return {'blockNumber': block, 'transactionIndex': 0, 'logIndex': log_index,
+            'args': {'_sender': sender, '_amount': amount, '_missing_funds': 2 ** 200 + block}}
+
+
+def claim(block, recipient, amount):
+    return {'blockNumber': block, 'transactionIndex': 1, 'logIndex': 0,
+            'args': {'_recipient': recipient, '_sent_amount': amount}}
+
+
+def contents(state):
+    return {
+        'synced_block': state.synced_block,
+        'last_log': state.last_log,
+        'block_to_timestamp': dict(state.block_to_timestamp.items()),
+        'bids': [state.bids.record(i) for i in range(len(state.bids))],
+        'senders': state.bids.senders,
+        'claims': list(zip(state.claims.block, state.claims.transaction_index,
+                           state.claims.log_index, state.claims.recipient, state.claims.amount)),
+        'recipients': state.claims.recipients,
+        'total_claimed': state.total_claimed,
+        'auction': state.auction,
+        'recent': state.recent
+    }
+
+
+def change(state, first_block, count):
+    for block in range(first_block, first_block + count):
+        block_hash = '0x%064x' % block
+        state.block_to_timestamp[block] = 1500000000 + 15 * block
+        state.add_bid(bid(block, 0, '0x%040x' % (block % 7), 10 ** 18 * block + 1))
+        state.add_recent_log(block, [block_hash, '0x%064x' % (block * 4), 0])
+        state.add_undo(block, ['pop_bid'])
+        state.add_bid(bid(block, 3, '0x%040x' % (block % 5), 2 ** 255 + block))
+        state.add_recent_log(block, [block_hash, '0x%064x' % (block * 4 + 1), 3])
+        state.add_undo(block, ['pop_bid'])
+        if block % 4 == 0:
+            state.add_claim(claim(block, '0x%040x' % (block % 3), 10 ** 20 + block))
+            state.add_undo(block, ['pop_claim'])
+        state.synced_block = block
+        state.last_log = (block, 3)
+        state.prune_recent(block - 5)
+    # rolled back block
+    last_block = first_block + count - 1
+    state.pop_recent(last_block)
+    state.pop_bid()
+    state.pop_bid()
+    if last_block % 4 == 0:
+        state.pop_claim()
+    del state.block_to_timestamp[last_block]
+    state.update_auction({'final_price': first_block, 'auction_end_block': None})
+
+
+@pytest.fixture()
+def state_file(tmpdir):
+    return os.path.join(str(tmpdir), 'auction.state')
+
+
+def test_state_round_trip(state_file):
+    state = EventSamplerState(state_file)
+    change(state, 1, 40)
+    state.save()
+    expected = contents(state)
+    assert contents(EventSamplerState(state_file)) == expected
+
+    # snapshot, then more changes in the journal
+    state.compact()
+    assert contents(EventSamplerState(state_file)) == expected
+    change(state, 41, 25)
+    state.save()
+    expected = contents(state)
+    loaded = EventSamplerState(state_file)
+    assert contents(loaded) == expected
+
+    # the loaded state goes on journaling from where it was saved
+    change(loaded, 66, 10)
+    loaded.save()
+    loaded.compact()
+    change(loaded, 76, 3)
+    loaded.save()
+    assert contents(EventSamplerState(state_file)) == contents(loaded)
+
+
+def test_torn_journal_record(state_file):
+    state = EventSamplerState(state_file)
+    change(state, 1, 10)
+    state.save()
+    expected = contents(state)
+    with open(state_file + '.journal', 'a') as f:
+        f.write('[1000, "bid", 11, 0')
+
+    loaded = EventSamplerState(state_file)
+    assert contents(loaded) == expected
+    change(loaded, 11, 5)
+    loaded.save()
+    assert contents(EventSamplerState(state_file)) == contents(loaded)
+
+
+def test_unreadable_snapshot(state_file):
+    state = EventSamplerState(state_file)
+    change(state, 1, 10)
+    state.save()
+    state.compact()
+    change(state, 11, 5)
+    state.save()
+    with open(state_file, 'r+b') as f:
+        f.seek(16)
+        f.write(b'\xff' * 16)
+
+    # the journal holds changes to the lost snapshot: start over from block 0
+    loaded = EventSamplerState(state_file)
+    assert loaded.synced_block == -1
+    assert len(loaded.bids) == 0
+    assert len(loaded.block_to_timestamp) == 0
+    assert os.path.isfile(state_file + '.corrupt')
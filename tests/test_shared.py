@@ -0,0 +1,124 @@
+import os
+from types import SimpleNamespace
+
+import gevent
+import pytest
+from event_sampler.histogram import TimeHistogram
+from event_sampler.shared import SharedAuction, SharedRegion, StatePublisher, shared_path
+from event_sampler.store import BidStore, ClaimStore
+from event_sampler.view import SamplerView
+
+ADDRESS = '0x' + '11' * 20
+
+
+@pytest.fixture()
+def path(tmpdir):
+    return os.path.join(str(tmpdir), 'auction.shared')
+
+
+def test_read_waits_for_commit(path):
+    writer = SharedRegion(path)
+    reader = SharedRegion(path)
+    assert reader.read() is None
+    writer.begin()
+    writer.commit({'block': 1})
+    assert reader.read()[1:] == ({'block': 1}, None)
+
+    # a write in progress: the reader waits for its end
+    writer.begin()
+    pending = gevent.spawn(reader.read)
+    gevent.sleep(0.01)
+    assert not pending.ready()
+    writer.commit({'block': 2})
+    seq, meta, _ = pending.get(timeout=1)
+    assert (seq, meta) == (writer.seq, {'block': 2})
+    assert seq % 2 == 0
+
+
+def test_read_retries_torn_load(path):
+    writer = SharedRegion(path)
+    reader = SharedRegion(path)
+    writer.begin()
+    writer.commit({'block': 1})
+    loaded = []
+
+    def load(seq, meta):
+        loaded.append(meta['block'])
+        if len(loaded) == 1:
+            # the files change while the reader reads them
+            writer.begin()
+            writer.commit({'block': 2})
+        return meta['block'] * 10
+
+    assert reader.read(load)[1:] == ({'block': 2}, 20)
+    assert loaded == [1, 2]
+
+
+def test_grown_region(path):
+    writer = SharedRegion(path, size=64)
+    reader = SharedRegion(path)
+    writer.begin()
+    writer.commit({'block': 1})
+    assert reader.read()[1] == {'block': 1}
+    inode = os.stat(path).st_ino
+    # too large for the file: written to a new one, replacing it
+    meta = {'block': 2, 'padding': 'x' * 1000}
+    writer.begin()
+    writer.commit(meta)
+    assert os.stat(path).st_ino != inode
+    assert reader.read()[1] == meta
+    assert reader.inode == writer.inode
+
+
+def make_auction():
+    bids = BidStore()
+    claims = ClaimStore()
+    sampler = SimpleNamespace(bids=bids, state=SimpleNamespace(claims=claims),
+                              histogram=TimeHistogram(), confirmations=5)
+    poller = SimpleNamespace()
+    return {'contract': SimpleNamespace(address=ADDRESS), 'sampler': sampler,
+            'poller': poller}
+
+
+def update(auction, block, bids):
+    sampler = auction['sampler']
+    for amount in bids:
+        sampler.bids.add(block, 0, len(sampler.bids), '0x%040x' % amount, amount, 0)
+        sampler.histogram.add(1500000000 + 15 * block, amount)
+    sampler.view = SamplerView(block=block, timestamp=1500000000 + 15 * block,
+                               final_block=block - 5, total=sum(sampler.bids.amount),
+                               claimed=0, auction={}, histogram=sampler.histogram.freeze(),
+                               bid_count=len(sampler.bids), claim_count=0)
+    auction['poller'].snapshot = {'block': {'number': block, 'hash': '0x%064x' % block,
+                                            'timestamp': 1500000000 + 15 * block}}
+
+
+def test_publish_and_rollback(tmpdir):
+    state_dir = str(tmpdir)
+    auction = make_auction()
+    publisher = StatePublisher({ADDRESS: auction}, state_dir)
+    publisher.start()
+    gevent.kill(publisher.ev_publish)
+    update(auction, 10, [1, 2, 3])
+    publisher.publish(ADDRESS, auction)
+    shared = SharedAuction(shared_path(state_dir, ADDRESS))
+    assert list(shared.bids.amount) == [1, 2, 3]
+    assert shared.view.total == 6
+    assert shared.view.histogram.total == 6
+
+    # the last two bids are rolled back and others added
+    sampler = auction['sampler']
+    for amount in [3, 2]:
+        sampler.bids.pop()
+        sampler.histogram.remove(1500000000 + 150, amount)
+    update(auction, 11, [20, 30, 40])
+    publisher.publish(ADDRESS, auction)
+    bids = shared.bids
+    shared.refresh()
+    # only the rewritten rows are read
+    assert shared.bids is bids
+    assert list(shared.bids.amount) == [1, 20, 30, 40]
+    assert shared.bids.senders == sampler.bids.senders
+    assert shared.view.total == 91
+    assert shared.view.histogram.histogram(2)[1] == [1, 90]
+    assert shared.snapshot['block']['number'] == 11
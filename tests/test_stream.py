@@ -0,0 +1,131 @@
+import json
+from types import SimpleNamespace
+
+import gevent
+from event_sampler.store import BidStore
+from event_sampler.stream import StatusStream
+
+
+class FakeSampler:
+    def __init__(self):
+        self.bids = BidStore()
+        self.confirmations = 5
+        self.claimed = 0
+        self.publish()
+
+    def add_bid(self, block, amount):
+        self.bids.add(block, 0, len(self.bids), '0x%040x' % block, amount, 0)
+
+    def publish(self):
+        self.view = SimpleNamespace(bid_count=len(self.bids), claimed=self.claimed,
+                                    auction={'auction_start_time': 1500000000})
+
+
+def snapshot(number, price=10 ** 18):
+    return {'block': {'number': number}, 'timestamp': 1500000000 + 15 * number, 'stage': 2,
+            'price': price, 'wallet_balance': 0}
+
+
+def decode(message):
+    lines = message.decode().split('\n')
+    assert lines[1] == 'event: status'
+    return int(lines[0][len('id: '):]), json.loads(lines[2][len('data: '):])
+
+
+def make_stream():
+    sampler = FakeSampler()
+    sampler.add_bid(1, 100)
+    sampler.publish()
+    poller = SimpleNamespace(listeners=[])
+    stream = StatusStream(poller, sampler)
+    assert poller.listeners == [stream.on_block]
+    return sampler, stream
+
+
+def test_diffs():
+    sampler, stream = make_stream()
+    stream.on_block(snapshot(10))
+    block, diff = decode(stream.history[-1][1])
+    assert block == 10
+    # all the values at first, and no bids: those before the stream are fetched with /events
+    assert diff['status']['price'] == 10 ** 18
+    assert diff['status']['start_time'] == 1500000000
+    assert (diff['bids_from'], diff['bids']) == (1, [])
+
+    sampler.add_bid(11, 200)
+    sampler.add_bid(11, 300)
+    sampler.publish()
+    stream.on_block(snapshot(11, price=9 * 10 ** 17))
+    _, diff = decode(stream.history[-1][1])
+    assert diff['status'] == {'price': 9 * 10 ** 17}
+    assert diff['bids_from'] == 1
+    assert [bid[2] for bid in diff['bids']] == [200, 300]
+
+    # bids not published in the view yet are left for the next diff
+    sampler.add_bid(12, 400)
+    stream.on_block(snapshot(12, price=9 * 10 ** 17))
+    _, diff = decode(stream.history[-1][1])
+    assert (diff['status'], diff['bids']) == ({}, [])
+    sampler.publish()
+    stream.on_block(snapshot(13, price=9 * 10 ** 17))
+    _, diff = decode(stream.history[-1][1])
+    assert (diff['bids_from'], [bid[2] for bid in diff['bids']]) == (3, [400])
+
+
+def test_rollback_diff():
+    sampler, stream = make_stream()
+    stream.on_block(snapshot(10))
+    sampler.add_bid(11, 200)
+    sampler.add_bid(12, 300)
+    sampler.publish()
+    stream.on_block(snapshot(12))
+
+    # block 12 is replaced by one with another bid
+    sampler.bids.pop()
+    sampler.bids.add(12, 0, 2, '0x' + 'ee' * 20, 500, 0)
+    sampler.publish()
+    stream.on_block(snapshot(13))
+    _, diff = decode(stream.history[-1][1])
+    # the client drops its bids from bids_from on: the unconfirmed blocks are sent again
+    assert diff['bids_from'] == 1
+    assert [bid[2] for bid in diff['bids']] == [200, 500]
+
+
+def test_last_event_id_replay():
+    sampler, stream = make_stream()
+    for number in range(10, 15):
+        stream.on_block(snapshot(number, price=10 ** 18 - number))
+
+    messages = stream.subscribe(last_block=12)
+    assert [decode(next(messages))[0] for _ in range(2)] == [13, 14]
+    # then the new blocks, as they come
+    stream.on_block(snapshot(15))
+    assert decode(next(messages))[0] == 15
+    messages.close()
+    assert stream.subscribers == set()
+
+    # a new client gets only what comes next
+    messages = stream.subscribe()
+    reader = gevent.spawn(next, messages)
+    gevent.sleep(0)
+    stream.on_block(snapshot(16))
+    assert decode(reader.get(timeout=1))[0] == 16
+    messages.close()
+
+
+def test_slow_subscriber_dropped():
+    sampler, stream = make_stream()
+    stream.queue_size = 2
+    messages = stream.subscribe()
+    reader = gevent.spawn(next, messages)
+    gevent.sleep(0)
+    stream.on_block(snapshot(10))
+    assert decode(reader.get(timeout=1))[0] == 10
+    for number in range(11, 14):
+        stream.on_block(snapshot(number))
+    # its stream ends, and the client reconnects with Last-Event-ID
+    assert stream.subscribers == set()
+    assert list(messages) == []
+    messages = stream.subscribe(last_block=10)
+    assert [decode(next(messages))[0] for _ in range(3)] == [11, 12, 13]
+    messages.close()
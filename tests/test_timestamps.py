@@ -0,0 +1,71 @@
+from collections import Counter
+
+import gevent
+import pytest
+from event_sampler.timestamps import BlockTimestampResolver
+from fake_node import BLOCK_TIME, GENESIS_TIMESTAMP, FakeNode
+
+
+class RecordingResolver(BlockTimestampResolver):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    def get_blocks(self, block_numbers):
+        self.batches.append(list(block_numbers))
+        return super().get_blocks(block_numbers)
+
+
+def requested_blocks(node):
+    return Counter(int(params[0], 16) for method, params in node.requests
+                   if method == 'eth_getBlockByNumber')
+
+
+def test_batches():
+    node = FakeNode()
+    node.mine(30)
+    resolver = RecordingResolver(node.web3(), batch_size=4)
+    timestamps = resolver.resolve([3, 1, 2, 10, 11, 12, 13, 20, 21, 1, 31])
+    expected = {block: GENESIS_TIMESTAMP + BLOCK_TIME * block
+                for block in (1, 2, 3, 10, 11, 12, 13, 20, 21)}
+    expected[31] = None
+    assert timestamps == expected
+    assert resolver.batches == [[1, 2, 3, 10], [11, 12, 13, 20], [21, 31]]
+    # nothing is kept once fetched
+    assert resolver.pending == {}
+    assert resolver.get(31) is None
+    node.mine()
+    assert resolver.get(31) == GENESIS_TIMESTAMP + BLOCK_TIME * 31
+
+
+def test_single_flight():
+    node = FakeNode()
+    node.mine(30)
+    resolver = RecordingResolver(node.web3(), batch_size=100)
+    first = gevent.spawn(resolver.resolve, range(1, 11))
+    second = gevent.spawn(resolver.resolve, range(5, 16))
+    callback_results = []
+    third = resolver.request([10, 16], callback_results.append)
+    gevent.joinall([first, second, third], raise_error=True)
+
+    assert first.value == {block: GENESIS_TIMESTAMP + BLOCK_TIME * block for block in range(1, 11)}
+    assert second.value == {block: GENESIS_TIMESTAMP + BLOCK_TIME * block
+                            for block in range(5, 16)}
+    assert callback_results == [{10: GENESIS_TIMESTAMP + BLOCK_TIME * 10,
+                                 16: GENESIS_TIMESTAMP + BLOCK_TIME * 16}]
+    # blocks asked while being fetched were waited for, not asked again
+    assert requested_blocks(node) == Counter(range(1, 17))
+    assert resolver.batches == [list(range(1, 11)), list(range(11, 16)), [16]]
+
+
+def test_failed_fetch():
+    node = FakeNode()
+    node.mine(5)
+    node.errors['eth_getBlockByNumber'] = lambda params: 'overloaded'
+    resolver = BlockTimestampResolver(node.web3())
+    with pytest.raises(ValueError):
+        resolver.resolve([1, 2])
+    # a failed fetch is asked again by the next request
+    del node.errors['eth_getBlockByNumber']
+    assert resolver.resolve([1, 2]) == {1: GENESIS_TIMESTAMP + BLOCK_TIME,
+                                        2: GENESIS_TIMESTAMP + 2 * BLOCK_TIME}
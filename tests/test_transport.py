@@ -0,0 +1,139 @@
+import gevent
+import pytest
+import requests
+from deploy.transport import RPCTransport, batch_request
+from fake_node import FakeNode, FakeSession
+
+
+@pytest.fixture()
+def node():
+    node = FakeNode()
+    node.mine(5)
+    return node
+
+
+def make_transport(node, **kwargs):
+    transport = RPCTransport('http://localhost:8545', backoff=0, **kwargs)
+    transport.session = FakeSession(node)
+    return transport
+
+
+def test_retry_transient_errors(node):
+    transport = make_transport(node, retries=3)
+    transport.session.failures = [requests.ConnectionError('reset'), 503,
+                                  requests.ReadTimeout('slow')]
+    assert transport.request('eth_blockNumber', [])['result'] == hex(5)
+    assert len(transport.session.posts) == 4
+    calls, errors, retries, cached, _ = transport.stats['eth_blockNumber']
+    assert (calls, errors, retries) == (1, 0, 3)
+
+    # not transient: no retry
+    transport.session.failures = [400]
+    with pytest.raises(requests.HTTPError):
+        transport.request('eth_blockNumber', [])
+    assert transport.stats['eth_blockNumber'][1] == 1
+
+
+def test_retries_exhausted(node):
+    transport = make_transport(node, retries=2)
+    outcomes = []
+    transport.listeners.append(lambda method, duration, outcome: outcomes.append(outcome))
+    transport.session.failures = [502] * 3
+    with pytest.raises(requests.HTTPError):
+        transport.request('eth_blockNumber', [])
+    assert outcomes == ['retry', 'retry', 'error']
+
+
+def test_non_idempotent_requests(node):
+    transport = make_transport(node, retries=3)
+    # the node may have received the transaction: never sent twice
+    for failure in (requests.ReadTimeout('slow'), requests.ConnectionError('reset')):
+        transport.session.failures = [failure]
+        with pytest.raises(type(failure)):
+            transport.make_request('eth_sendRawTransaction', ['0x00'])
+    assert len(transport.session.posts) == 2
+
+    # the connection could not be made: nothing was sent
+    transport.session.failures = [requests.ConnectTimeout('no route'), 503]
+    with pytest.raises(requests.HTTPError):
+        transport.make_request('eth_sendRawTransaction', ['0x00'])
+    assert len(transport.session.posts) == 4
+
+
+def test_batch(node):
+    transport = make_transport(node, retries=1)
+    web3 = node.web3()
+    web3.setProvider(transport)
+    transport.session.failures = [503]
+    results = batch_request(web3, [('eth_getBlockByNumber', [hex(n), False])
+                                   for n in (3, 1, 2)])
+    assert [result['number'] for result in results] == [hex(3), hex(1), hex(2)]
+    # one request per attempt
+    assert [len(payload) for payload in transport.session.posts] == [3, 3]
+    assert transport.stats['eth_getBlockByNumber'][0] == 3
+
+    # a batch holding a transaction is not retried
+    transport.session.failures = [requests.ReadTimeout('slow')]
+    with pytest.raises(requests.ReadTimeout):
+        transport.batch([('eth_blockNumber', []), ('eth_sendRawTransaction', ['0x00'])])
+    assert len(transport.session.posts) == 3
+
+
+def call(data, block='latest'):
+    return ('eth_call', [{'to': '0x' + '11' * 20, 'data': data}, block])
+
+
+def posted(transport, method):
+    return [payload for payload in transport.session.posts if payload['method'] == method]
+
+
+def test_call_cache_by_head_block(node):
+    transport = make_transport(node, call_cache=True)
+    transport.call_cache.max_age = 0
+    assert transport.make_request(*call('0x01'))['result'] == hex(5)
+    assert transport.make_request(*call('0x01'))['result'] == hex(5)
+    assert transport.make_request(*call('0x02'))['result'] == hex(5)
+    # sent for the head block, once per distinct read
+    assert [payload['params'][-1] for payload in posted(transport, 'eth_call')] == [hex(5)] * 2
+    assert transport.stats['eth_call'][3] == 1
+    # reads at a given block are not cached
+    transport.make_request(*call('0x01', hex(4)))
+    assert len(posted(transport, 'eth_call')) == 3
+
+    node.mine()
+    assert transport.make_request(*call('0x01'))['result'] == hex(6)
+    assert len(posted(transport, 'eth_call')) == 4
+    assert transport.call_cache.block == 6
+    assert len(transport.call_cache.results) == 1
+
+
+def test_call_cache_head_max_age(node):
+    transport = make_transport(node, call_cache=True)
+    transport.call_cache.max_age = 60
+    transport.make_request('eth_getBalance', ['0x' + '22' * 20, 'latest'])
+    node.mine()
+    # the head is not asked again yet
+    assert transport.make_request('eth_getBalance', ['0x' + '22' * 20, 'latest'])['result'] == \
+        hex(5)
+    assert len(posted(transport, 'eth_blockNumber')) == 1
+    assert len(posted(transport, 'eth_getBalance')) == 1
+
+
+def test_call_cache_single_flight(node):
+    transport = make_transport(node, call_cache=True)
+    transport.session.delay = 0.01
+    readers = [gevent.spawn(transport.make_request, *call('0x01')) for _ in range(5)]
+    gevent.joinall(readers, timeout=1)
+    assert [reader.value['result'] for reader in readers] == [hex(5)] * 5
+    assert len(posted(transport, 'eth_call')) == 1
+    assert len(posted(transport, 'eth_blockNumber')) == 1
+
+    # errors are shared by the waiting reads, but not cached
+    node.errors['eth_call'] = lambda params: 'execution reverted'
+    readers = [gevent.spawn(transport.make_request, *call('0x02')) for _ in range(2)]
+    gevent.joinall(readers, timeout=1)
+    assert all('error' in reader.value for reader in readers)
+    assert len(posted(transport, 'eth_call')) == 2
+    del node.errors['eth_call']
+    assert transport.make_request(*call('0x02'))['result'] == hex(5)
+    assert len(posted(transport, 'eth_call')) == 3
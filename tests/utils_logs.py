@@ -1,6 +1,6 @@
-from web3.formatters import input_filter_params_formatter, log_array_formatter
-from web3.utils.events import get_event_data
 from web3.utils.filters import construct_event_filter_params
+from deploy.decoder import get_registry
+from deploy.hub import get_hub
 from inspect import getframeinfo, stack
 from web3.utils.compat import (
     Timeout,
@@ -96,34 +96,29 @@ class LogFilter:
         callback=None):
         self.web3 = web3
         self.event_name = event_name
+        self.address = address
+        self.from_block = from_block
+        self.to_block = to_block
 
         # Callback for every registered log
         self.callback = callback
 
-        filter_kwargs = {
-            'fromBlock': from_block,
-            'toBlock': to_block,
-            'address': address
-        }
-
-        event_abi = [i for i in abi if i['type'] == 'event' and i['name'] == event_name]
-        if len(event_abi) == 0:
-            return None
-
-        self.event_abi = event_abi[0]
-        assert self.event_abi
+        self.decoder = get_registry(abi)[event_name]
+        self.event_abi = self.decoder.abi
 
         filters = filters if filters else {}
-        self.filter = construct_event_filter_params(
+        self.topics = construct_event_filter_params(
             self.event_abi,
-            argument_filters=filters,
-            **filter_kwargs)[1]
-        filter_params = input_filter_params_formatter(self.filter)
-        self.filter = web3.eth.filter(filter_params)
+            argument_filters=filters)[1]['topics']
+
+        # Logs are polled by the hub shared by all the filters of web3;
+        # watch() delivers those mined after init() or, without it, after this
+        self.hub = get_hub(web3)
+        self.synced_block = web3.eth.blockNumber
+        self.subscription = None
 
     def init(self, post_callback=None):
         for log in self.get_logs():
-            log['event'] = self.event_name
             self.callback(log)
         if post_callback:
             post_callback()
@@ -133,22 +128,23 @@ class LogFilter:
             log = self.set_log_data(log)
             self.callback(log)
 
-        self.filter.watch(log_callback)
+        self.subscription = self.hub.subscribe(
+            self.address,
+            self.topics,
+            log_callback,
+            from_block=self.synced_block + 1,
+            to_block=None if self.to_block == 'latest' else self.to_block)
 
     def stop(self):
-        if self.filter.running:
-            self.filter.stop_watching()
+        if self.subscription is not None:
+            self.subscription.stop()
 
     def get_logs(self):
-        response = self.web3.eth.getFilterLogs(self.filter.filter_id)
-        logs = log_array_formatter(response)
-        formatted_logs = []
-        for log in [dict(log) for log in logs]:
-            formatted_logs.append(self.set_log_data(log))
-        return formatted_logs
+        self.synced_block = self.web3.eth.blockNumber
+        to_block = self.synced_block if self.to_block == 'latest' else self.to_block
+        logs = self.hub.get_logs({'address': self.address, 'topics': self.topics},
+                                 self.from_block, to_block)
+        return [self.set_log_data(log) for log in logs]
 
     def set_log_data(self, log):
-        log = dict(log_array_formatter([log])[0])
-        log['args'] = get_event_data(self.event_abi, log)['args']
-        log['event'] = self.event_name
-        return log
+        return self.decoder.decode(dict(log))
@@ -0,0 +1,69 @@
+import requests
+import click
+import sys
+
+
+@click.command()
+@click.option(
+    '--host',
+    default="http://localhost:5000",
+    type=str,
+    help='Event sampler address'
+)
+@click.option(
+    '--auction-address',
+    default=None,
+    help='Auction to export, if the sampler serves several'
+)
+@click.option(
+    '--kind',
+    default='bids',
+    type=click.Choice(['bids', 'claims']),
+    help='Records to export'
+)
+@click.option(
+    '--format',
+    'output_format',
+    default='csv',
+    type=click.Choice(['csv', 'ndjson']),
+    help='Output format'
+)
+@click.option(
+    '--from-block',
+    default=None,
+    type=int,
+    help='First block of the records'
+)
+@click.option(
+    '--to-block',
+    default=None,
+    type=int,
+    help='Last block of the records'
+)
+@click.option(
+    '--address',
+    default=None,
+    help='Only the records of this sender (bids) or recipient (claims)'
+)
+@click.option(
+    '--output',
+    default='-',
+    type=click.File('wb'),
+    help='Output file, stdout by default'
+)
+def main(host, auction_address, kind, output_format, from_block, to_block, address, output):
+    """Export the bids or claims held by an event sampler, without querying the chain."""
+    url = host if auction_address is None else '%s/auction/%s' % (host, auction_address)
+    params = {'kind': kind, 'format': output_format, 'from_block': from_block,
+              'to_block': to_block, 'address': address}
+    params = {key: value for key, value in params.items() if value is not None}
+    # the response is written as it arrives, so memory use is constant
+    with requests.get(url + '/export', params=params, stream=True) as res:
+        if res.status_code != 200:
+            sys.exit('export failed: %d %s' % (res.status_code, res.text))
+        for chunk in res.iter_content(chunk_size=64 * 1024):
+            output.write(chunk)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,67 @@
 import requests
 import click
 import json
+import time
 
 
-def fetch(url):
-    try:
-        res = requests.get(url)
-        if res.status_code == 200:
-            return json.loads(res.text)
+def truncate(records, block):
+    """Drop the records of the blocks after `block`; records are ordered by block."""
+    while len(records) > 0 and records[-1][0] > block:
+        records.pop()
+
+
+class SamplerClient:
+    """Local mirror of the bids and claims of an event sampler auction.
+
+    All requests go through one pooled session. `update()` asks `/events` for
+    the records after `cursor`, the last block the sampler considers final,
+    and replaces the local records past it with the ones received, so that
+    records undone by a chain reorganization are dropped as well.
+    """
+
+    def __init__(self, host, auction_address=None):
+        self.session = requests.Session()
+        if auction_address is None:
+            self.url = host
         else:
+            self.url = '%s/auction/%s' % (host, auction_address)
+        self.cursor = -1
+        self.synced_block = -1
+        self.bids = []
+        self.claims = []
+        self.status = None
+        self.status_etag = None
+
+    def fetch(self, path, **kwargs):
+        try:
+            return self.session.get(self.url + path, **kwargs)
+        except requests.exceptions.ConnectionError:
+            return None
+
+    def update(self):
+        """Merge the next delta; returns it, or None if the sampler can't be reached."""
+        res = self.fetch('/events', params={'since_block': self.cursor})
+        if res is None or res.status_code != 200:
             return None
-    except requests.exceptions.ConnectionError:
-        return None
+        delta = res.json()
+        truncate(self.bids, delta['since_block'])
+        truncate(self.claims, delta['since_block'])
+        self.bids.extend(delta['bids'])
+        self.claims.extend(delta['claims'])
+        self.synced_block = delta['synced_block']
+        self.cursor = delta['final_block']
+        return delta
+
+    def update_status(self):
+        """Latest `/status`; unchanged responses are not downloaded again."""
+        headers = {}
+        if self.status_etag is not None:
+            headers['If-None-Match'] = self.status_etag
+        res = self.fetch('/status', headers=headers)
+        if res is not None and res.status_code == 200:
+            self.status = res.json()
+            self.status_etag = res.headers.get('ETag')
+        return self.status
 
 
 @click.command()
@@ -21,13 +71,31 @@ def fetch(url):
     type=str,
     help='Event sampler address'
 )
+@click.option(
+    '--auction-address',
+    default=None,
+    help='Auction to fetch, if the sampler serves several'
+)
+@click.option(
+    '--interval',
+    default=0,
+    type=float,
+    help='Keep fetching deltas every interval seconds, printing one JSON line each'
+)
 def main(**kwargs):
+    client = SamplerClient(kwargs['host'], kwargs['auction_address'])
+    client.update()
     ret = {}
-    status = fetch(kwargs['host'] + "/status")
-    histogram = fetch(kwargs['host'] + "/histogram")
-    ret['histogram'] = histogram
-    ret['status'] = status
+    ret['status'] = client.update_status()
+    ret['synced_block'] = client.synced_block
+    ret['bids'] = client.bids
+    ret['claims'] = client.claims
     print(json.dumps(ret))
+    while kwargs['interval'] > 0:
+        time.sleep(kwargs['interval'])
+        delta = client.update()
+        if delta is not None:
+            print(json.dumps(delta))
 
 
 if __name__ == "__main__":